@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from django.db import models
+
+
+# WideRow的列数
+WIDE_COLUMN_COUNT = 30
+
+
+class BenchRow(models.Model):
+    name = models.CharField(max_length=64, db_index=True)
+    description = models.TextField()
+    amount = models.IntegerField(db_index=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    created = models.DateTimeField(db_index=True)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        app_label = 'benchmarks'
+
+
+def _make_wide_model():
+    attrs = {
+        '__module__': __name__,
+        'Meta': type('Meta', (), {'app_label': 'benchmarks'}),
+    }
+    for i in range(WIDE_COLUMN_COUNT):
+        if i % 2:
+            attrs['col_{:02d}'.format(i)] = models.IntegerField(default=0)
+        else:
+            attrs['col_{:02d}'.format(i)] = models.CharField(max_length=32, default='')
+    return type('WideRow', (models.Model,), attrs)
+
+
+WideRow = _make_wide_model()
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+: server side请求处理的benchmark，只依赖Django以及SQLite，可以离线运行
+: 在仓库根目录下执行:
+:     python -m benchmarks.run --rows 100000 --save baseline.json
+:     python -m benchmarks.run --rows 100000 --compare baseline.json
+: --compare时，查询次数增加，或者中位数耗时超过基准的(1 + tolerance)倍时，返回值为1
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import django
+from django.conf import settings
+
+
+def setup_django(db_name):
+    settings.configure(
+        SECRET_KEY='benchmarks',
+        INSTALLED_APPS=['django.contrib.contenttypes', 'datatables_utils', 'benchmarks'],
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': db_name}},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        USE_TZ=True,
+        DEFAULT_AUTO_FIELD='django.db.models.AutoField',
+    )
+    django.setup()
+
+
+def _insert_rows(connection, model, count, make_row, batch_size=10000):
+    """
+    : 通过executemany批量插入，生成数百万行时比bulk_create()快很多
+    """
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(model._meta.db_table), ', '.join(qn(f.column) for f in fields), ', '.join(['%s'] * len(fields))
+    )
+    with connection.cursor() as cursor:
+        for batch_start in range(0, count, batch_size):
+            cursor.executemany(sql, [make_row(i) for i in range(batch_start, min(batch_start + batch_size, count))])
+
+
+def populate(rows, wide_rows, seed):
+    """
+    : 建立表并生成数据，数据由seed决定，相同参数下每次生成的数据相同
+    """
+    from django.db import connection, transaction
+    from .models import BenchRow, WideRow, WIDE_COLUMN_COUNT
+
+    rnd = random.Random(seed)
+    words = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+    base_time = datetime.datetime(2020, 1, 1)
+
+    def make_bench_row(i):
+        return (
+            'name {}'.format(rnd.randrange(rows)),
+            ' '.join(rnd.choice(words) for _ in range(8)),
+            rnd.randrange(100000),
+            '{:.2f}'.format(rnd.random() * 1000),
+            (base_time + datetime.timedelta(seconds=rnd.randrange(10 ** 8))).strftime('%Y-%m-%d %H:%M:%S'),
+            rnd.random() < 0.8,
+        )
+
+    def make_wide_row(i):
+        return tuple(
+            rnd.randrange(1000) if c % 2 else rnd.choice(words) for c in range(WIDE_COLUMN_COUNT)
+        )
+
+    existing_tables = connection.introspection.table_names()
+    with connection.schema_editor() as schema_editor:
+        for model in (BenchRow, WideRow):
+            if model._meta.db_table in existing_tables:
+                schema_editor.delete_model(model)
+            schema_editor.create_model(model)
+    with transaction.atomic():
+        _insert_rows(connection, BenchRow, rows, make_bench_row)
+        _insert_rows(connection, WideRow, wide_rows, make_wide_row)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def get_tables():
+    from datatables_utils.utils import ModelDataTable
+    from .models import BenchRow, WideRow
+
+    class BenchDataTable(ModelDataTable):
+        class Meta:
+            model = BenchRow
+            fields = ['name', 'description', 'amount', 'price', 'created', 'active']
+
+    class KeysetBenchDataTable(ModelDataTable):
+        class Meta:
+            model = BenchRow
+            fields = ['name', 'description', 'amount', 'price', 'created', 'active']
+            keyset_pagination = True
+
+    class WideDataTable(ModelDataTable):
+        class Meta:
+            model = WideRow
+            fields = [f.name for f in WideRow._meta.concrete_fields if not f.primary_key]
+
+    return BenchDataTable, KeysetBenchDataTable, WideDataTable
+
+
+def build_http_queryset(start=0, length=10, order=((0, 'asc'),), search='', regex=False):
+    from django.http import QueryDict
+
+    http_queryset = QueryDict(mutable=True)
+    http_queryset.update({
+        'draw': '1',
+        'start': str(start),
+        'length': str(length),
+        'search[value]': search,
+        'search[regex]': 'true' if regex else 'false',
+    })
+    for i, (column, direction) in enumerate(order):
+        http_queryset['order[{}][column]'.format(i)] = str(column)
+        http_queryset['order[{}][dir]'.format(i)] = direction
+    return http_queryset
+
+
+def get_scenarios(rows):
+    """
+    :return: list of (name, table序号, 请求参数, 是否需要先获取上一页的cursor)
+    """
+    deep_start = max(rows - 20, 0)
+    scenarios = [
+        ('first_page', 0, {}, False),
+        ('deep_page', 0, {'start': deep_start}, False),
+        ('deep_page_keyset_next', 1, {'start': deep_start}, True),
+        ('global_search', 0, {'search': 'name 123'}, False),
+        ('global_search_miss', 0, {'search': 'zzz'}, False),
+        ('regex_search', 0, {'search': '^name 1[0-9]*5$', 'regex': True}, False),
+        ('wide_table', 2, {'length': 100}, False),
+    ]
+    for index, column in enumerate(['name', 'description', 'amount', 'price', 'created', 'active']):
+        scenarios.append(('order_{}'.format(column), 0, {'order': ((index, 'desc'),)}, False))
+    return scenarios
+
+
+def run_request(view, http_queryset):
+    from django.db import connection
+    from datatables_utils.instrumentation import RequestTimings, instrument
+
+    timings = RequestTimings(view.dt_config, http_queryset)
+    with instrument(timings, using=connection.alias):
+        response = view.build_json_response(http_queryset)
+    return timings, response
+
+
+def run_scenario(dt_config, params, with_cursor, repeat):
+    from django.views import generic
+    from datatables_utils.views import DataTablesMixin
+
+    class BenchView(DataTablesMixin, generic.ListView):
+        model = dt_config.Meta.model
+
+    view = BenchView(dt_config=dt_config)
+    http_queryset = build_http_queryset(**params)
+    if with_cursor:
+        # 先请求上一页，使用返回的cursor请求下一页(keyset分页的连续翻页)
+        previous = dict(params, start=max(params.get('start', 0) - 10, 0))
+        _, response = run_request(view, build_http_queryset(**previous))
+        http_queryset['cursor'] = json.loads(response.content.decode('utf-8')).get('cursor') or ''
+    durations = []
+    timings = None
+    for _ in range(repeat):
+        timings, response = run_request(view, http_queryset)
+        durations.append(timings.duration * 1000)
+    return {
+        'median_ms': statistics.median(durations),
+        'min_ms': min(durations),
+        'queries': timings.queries,
+        'phases_ms': {name: duration * 1000 for name, (duration, queries) in timings.phases.items()},
+    }
+
+
+def run_class_creation(repeat, count=100):
+    """
+    : ModelDataTableMetaClass建立类的耗时，以及第一次使用时解析field的耗时，
+    : 以WideRow建立count个类计算
+    """
+    from datatables_utils.utils import ModelDataTable
+    from .models import WideRow
+
+    field_names = [f.name for f in WideRow._meta.concrete_fields if not f.primary_key]
+    create_durations = []
+    bind_durations = []
+    for _ in range(repeat):
+        tables = []
+        started = time.perf_counter()
+        for _ in range(count):
+            class WideDataTable(ModelDataTable):
+                class Meta:
+                    model = WideRow
+                    fields = field_names
+            tables.append(WideDataTable)
+        create_durations.append((time.perf_counter() - started) * 1000 / count)
+        started = time.perf_counter()
+        for table in tables:
+            table.bind_fields()
+        bind_durations.append((time.perf_counter() - started) * 1000 / count)
+    return {
+        'class_creation': {
+            'median_ms': statistics.median(create_durations), 'min_ms': min(create_durations), 'queries': 0,
+        },
+        'class_bind_fields': {
+            'median_ms': statistics.median(bind_durations), 'min_ms': min(bind_durations), 'queries': 0,
+        },
+    }
+
+
+def run(args):
+    setup_django(args.db)
+    populate(args.rows, args.wide_rows, args.seed)
+    tables = get_tables()
+    results = {}
+    for name, table_index, params, with_cursor in get_scenarios(args.rows):
+        if args.only and name not in args.only:
+            continue
+        results[name] = run_scenario(tables[table_index], params, with_cursor, args.repeat)
+    if not args.only or 'class_creation' in args.only:
+        results.update(run_class_creation(args.repeat))
+    return {
+        'rows': args.rows,
+        'wide_rows': args.wide_rows,
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': __import__('sqlite3').sqlite_version,
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    :return: list, 退化的项目
+    """
+    regressions = []
+    if (report['rows'], report['wide_rows']) != (baseline['rows'], baseline['wide_rows']):
+        regressions.append('row counts differ from baseline: {}/{} != {}/{}'.format(
+            report['rows'], report['wide_rows'], baseline['rows'], baseline['wide_rows']
+        ))
+        return regressions
+    for name, base in baseline['results'].items():
+        current = report['results'].get(name)
+        if current is None:
+            continue
+        if current['queries'] > base['queries']:
+            regressions.append('{}: queries {} > {}'.format(name, current['queries'], base['queries']))
+        if current['median_ms'] > base['median_ms'] * (1 + tolerance):
+            regressions.append('{}: median {:.2f}ms > {:.2f}ms * {:.2f}'.format(
+                name, current['median_ms'], base['median_ms'], 1 + tolerance
+            ))
+    return regressions
+
+
+def print_report(report, baseline=None):
+    print('rows={rows} wide_rows={wide_rows} python={python} django={django} sqlite={sqlite}'.format(**report))
+    print('{:<28}{:>12}{:>12}{:>9}{:>14}'.format('scenario', 'median_ms', 'min_ms', 'queries', 'baseline_ms'))
+    for name, result in report['results'].items():
+        base = (baseline or {}).get('results', {}).get(name)
+        print('{:<28}{:>12.2f}{:>12.2f}{:>9}{:>14}'.format(
+            name, result['median_ms'], result['min_ms'], result['queries'],
+            '{:.2f}'.format(base['median_ms']) if base else '-'
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the server-side request path of datatables_utils')
+    parser.add_argument('--rows', type=int, default=10000, help='BenchRow行数')
+    parser.add_argument('--wide-rows', type=int, default=None, help='WideRow行数，默认与--rows相同')
+    parser.add_argument('--repeat', type=int, default=5, help='每个场景的重复次数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', default=':memory:', help='SQLite数据库文件，默认在内存中')
+    parser.add_argument('--only', nargs='*', help='只运行指定的场景')
+    parser.add_argument('--save', help='将结果保存为JSON基准')
+    parser.add_argument('--compare', help='与JSON基准比较')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='允许的耗时增加比例')
+    args = parser.parse_args(argv)
+    if args.wide_rows is None:
+        args.wide_rows = args.rows
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION {}'.format(regression))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
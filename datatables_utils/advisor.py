@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict, namedtuple
+
+from django.db import models
+
+from .search import ShadowTableMixin
+from .utils import SEARCH_TYPE_TEXT
+
+
+IndexAdvice = namedtuple('IndexAdvice', ['model', 'fields', 'reasons'])
+IndexAdvice.__doc__ = """
+: 建议建立的索引
+: model: 建立索引的model
+: fields: tuple, 索引的field names
+: reasons: list, 需要该索引的(table_id, 说明)
+"""
+
+
+def get_existing_indexes(model):
+    """
+    : model已有的B-tree索引(包括主键、unique、db_index、Meta.indexes、unique_together以及UniqueConstraint)
+    : 带有condition或者表达式的索引不能用于一般的排序以及搜索，不包括在内
+    :return: list of tuple, 各索引的field names
+    """
+    opts = model._meta
+    indexes = []
+    for field in opts.concrete_fields:
+        if field.primary_key or field.unique or field.db_index:
+            indexes.append((field.name,))
+    for index in opts.indexes:
+        if index.fields and index.condition is None:
+            indexes.append(tuple(opts.get_field(name.lstrip('-')).name for name in index.fields))
+    for fields in opts.unique_together:
+        indexes.append(tuple(opts.get_field(name).name for name in fields))
+    for constraint in opts.constraints:
+        if isinstance(constraint, models.UniqueConstraint) and constraint.fields and constraint.condition is None:
+            indexes.append(tuple(opts.get_field(name).name for name in constraint.fields))
+    return indexes
+
+
+def is_covered(model, fields):
+    """
+    : fields是否为model已有的某个索引的前缀
+    """
+    fields = tuple(fields)
+    return any(index[:len(fields)] == fields for index in get_existing_indexes(model))
+
+
+def _resolve_path(model, query_name):
+    """
+    : 解析查询路径(例如'category__name')
+    :return: tuple(目标model, 目标field, 各关联的field列表)
+    """
+    names = query_name.split('__')
+    relations = []
+    for name in names[:-1]:
+        field = model._meta.get_field(name)
+        relations.append(field)
+        model = field.related_model
+    return model, model._meta.get_field(names[-1]), relations
+
+
+class IndexAdvisor:
+    """
+    : 根据ModelDataTable各列的排序以及搜索方式，对比model已有的索引，给出需要建立的索引:
+    : - 可排序的列：排序列的索引；keyset_pagination时为(排序列, dt_rowId)的复合索引
+    : - dt_rowId：作为所有排序的tiebreaker，需要索引
+    : - 范围、日期以及精确搜索的列：该列的索引
+    : - 关联路径中的反向关联：关联model中ForeignKey的索引
+    : icontains、istartswith(prefix_search)以及正则搜索不能使用普通的B-tree索引，只作为提示(notes)给出
+    """
+    def __init__(self):
+        self._advice = OrderedDict()
+        self.notes = []
+
+    def add_table(self, dt_config):
+        meta_model = dt_config.Meta.model._meta.concrete_model
+        table_id = dt_config.table_id
+        pk_column = dt_config.pk_column
+        pk_field = pk_column._field if pk_column is not None else None
+        if pk_field is not None and pk_field.model._meta.concrete_model is meta_model:
+            self.require(meta_model, (pk_field.name,), table_id, 'dt_rowId {}'.format(pk_column.name))
+        shadow_search = isinstance(dt_config.search_backend, ShadowTableMixin)
+
+        for column in dt_config.columns.values():
+            if column.computed:
+                continue
+            model, field, relations = _resolve_path(meta_model, column.query_name)
+            model = model._meta.concrete_model
+            if column.orderable or column.searchable:
+                self.add_relations(relations, table_id, column)
+            if column.orderable:
+                fields = (field.name,)
+                if (dt_config.keyset_pagination and pk_field is not None and model is meta_model
+                        and field != pk_field):
+                    fields += (pk_field.name,)
+                self.require(model, fields, table_id, 'order by {}'.format(column.name))
+            if not column.searchable:
+                continue
+            if column._search_type != SEARCH_TYPE_TEXT:
+                self.require(model, (field.name,), table_id, 'search {}'.format(column.name))
+            elif shadow_search:
+                continue
+            elif column.prefix_search:
+                self.notes.append((table_id, '{}: istartswith search needs an index on UPPER({}) with '
+                                             'text_pattern_ops (PostgreSQL) or a NOCASE index (SQLite)'
+                                   .format(column.name, field.column)))
+            else:
+                self.notes.append((table_id, '{}: icontains search cannot use a B-tree index, consider a '
+                                             'search_backend or a trigram index'.format(column.name)))
+
+    def add_relations(self, relations, table_id, column):
+        for field in relations:
+            if field.many_to_many:
+                self.notes.append((table_id, '{}: joins the many-to-many relation {}'.format(column.name, field.name)))
+            elif not field.concrete:
+                # 反向关联通过关联model中的ForeignKey进行join
+                remote = field.remote_field
+                self.require(remote.model._meta.concrete_model, (remote.name,), table_id,
+                             'join {} for {}'.format(field.name, column.name))
+
+    def require(self, model, fields, table_id, reason):
+        """
+        : 记录table需要的索引，已有的索引能够满足时不做任何操作
+        """
+        if model._meta.managed is False or is_covered(model, fields):
+            return
+        key = (model, tuple(fields))
+        if key not in self._advice:
+            self._advice[key] = IndexAdvice(model, tuple(fields), [])
+        self._advice[key].reasons.append((table_id, reason))
+
+    def get_advice(self):
+        """
+        : 包含了其他建议索引前缀的索引可以同时满足两者，只保留较长的索引
+        :return: list of IndexAdvice
+        """
+        advice = list(self._advice.values())
+        result = OrderedDict()
+        for item in advice:
+            wider = [
+                other for other in advice
+                if other.model is item.model and len(other.fields) > len(item.fields)
+                and other.fields[:len(item.fields)] == item.fields
+            ]
+            target = wider[0] if wider else item
+            key = (target.model, target.fields)
+            if key not in result:
+                result[key] = IndexAdvice(target.model, target.fields, [])
+            result[key].reasons.extend(item.reasons)
+        return list(result.values())
+
+
+def get_index(advice):
+    """
+    : 生成IndexAdvice对应的models.Index，名字与Django自动生成的规则相同
+    """
+    index = models.Index(fields=list(advice.fields))
+    index.set_name_with_model(advice.model)
+    return index
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import AppConfig
+
+
+class DatatablesUtilsConfig(AppConfig):
+    name = 'datatables_utils'
+
+    def ready(self):
+        # 注册system checks
+        from . import checks  # noqa: F401
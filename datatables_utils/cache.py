@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+import calendar
+import gzip
+import hashlib
+import json
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet, ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+
+VERSION_KEY_PREFIX = 'datatables_utils:version'
+WRITTEN_KEY_PREFIX = 'datatables_utils:written'
+RESPONSE_KEY_PREFIX = 'datatables_utils:response'
+SNAPSHOT_KEY_PREFIX = 'datatables_utils:snapshot'
+CHANGES_KEY_PREFIX = 'datatables_utils:changes'
+
+CHANGE_CREATED = 'created'
+CHANGE_UPDATED = 'updated'
+CHANGE_DELETED = 'deleted'
+
+# 不参与缓存key计算的请求参数，draw在命中缓存后被替换，_为jQuery添加的防缓存参数
+IGNORED_PARAMS = ('draw', '_')
+
+
+def _get_version_key(model):
+    return '{}:{}'.format(VERSION_KEY_PREFIX, model._meta.label_lower)
+
+
+def get_model_version(model, cache_alias='default'):
+    """
+    : 获取model的数据版本，model的数据发生变化后版本号增加
+    :return: int
+    """
+    cache = caches[cache_alias]
+    key = _get_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        # 以当前时间作为初始值，避免版本号被清除后与旧的缓存重复
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_model_version(model, cache_alias='default'):
+    cache = caches[cache_alias]
+    key = _get_version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), None)
+    cache.set('{}:{}'.format(WRITTEN_KEY_PREFIX, model._meta.label_lower), time.time(), None)
+
+
+def get_model_write_time(model, cache_alias='default'):
+    """
+    : 获取model的数据版本最后一次增加的时间
+    :return: float, unix时间戳；没有记录时返回None
+    """
+    return caches[cache_alias].get('{}:{}'.format(WRITTEN_KEY_PREFIX, model._meta.label_lower))
+
+
+def track_model(model, cache_alias='default'):
+    """
+    : 通过post_save, post_delete以及m2m_changed signal维护model的数据版本
+    : 对同一个model多次调用时只会注册一次
+    """
+    def bump(sender, **kwargs):
+        bump_model_version(model, cache_alias)
+
+    dispatch_uid = 'datatables_utils.version.{}.{}'.format(model._meta.label_lower, cache_alias)
+    post_save.connect(bump, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(bump, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        if not isinstance(through, str):
+            m2m_changed.connect(bump, sender=through, weak=False, dispatch_uid=dispatch_uid)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    : 合并同一进程内对同一个key的并发计算，只有第一个调用者进行计算，其他调用者等待其结果
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class ResponseCache:
+    """
+    : 缓存server side请求的JSON响应(不包含draw)
+    : 缓存的key由table类、规范化的请求参数(不包括draw)、queryset的SQL以及model的数据版本组成，
+    : Meta.model发生变化时数据版本增加，旧的缓存自然失效
+    : 通过ModelDataTable的Meta.response_cache指定
+    """
+    single_flight = SingleFlight()
+
+    def __init__(self, timeout=300, cache_alias='default'):
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+
+    def bind(self, dt_config):
+        track_model(dt_config.Meta.model, self.cache_alias)
+
+    def get_cache_key(self, dt_config, queryset, http_queryset):
+        """
+        :return: str, queryset为空(EmptyResultSet)时返回None
+        """
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return None
+        params = sorted(
+            (key, tuple(values)) for key, values in http_queryset.lists() if key not in IGNORED_PARAMS
+        )
+        digest = hashlib.md5('{}|{}|{}'.format(
+            sql, params, get_model_version(dt_config.Meta.model, self.cache_alias)
+        ).encode('utf-8')).hexdigest()
+        return '{}:{}.{}:{}'.format(RESPONSE_KEY_PREFIX, dt_config.__module__, dt_config.__qualname__, digest)
+
+    def get_body(self, cache_key, compute, dumps=None):
+        """
+        : 从缓存中读取JSON，未命中时调用compute()生成，并发的相同请求只计算一次
+        :param compute: 返回(json_context, cacheable)的函数
+        :param dumps: JSON编码函数，默认使用DjangoJSONEncoder
+        :return: str, 不包含draw的JSON
+        """
+        cache = caches[self.cache_alias]
+        body = cache.get(cache_key)
+        if body is not None:
+            return body
+
+        def compute_body():
+            body = cache.get(cache_key)
+            if body is not None:
+                return body
+            json_context, cacheable = compute()
+            json_context = dict(json_context)
+            json_context.pop('draw', None)
+            if dumps is None:
+                body = json.dumps(json_context, cls=DjangoJSONEncoder)
+            else:
+                body = dumps(json_context)
+            if cacheable:
+                cache.set(cache_key, body, self.timeout)
+            return body
+
+        return self.single_flight.do(cache_key, compute_body)
+
+    @staticmethod
+    def patch_draw(body, draw):
+        """
+        : 将draw加入缓存的JSON
+        """
+        if body == '{}':
+            return '{{"draw": {}}}'.format(draw)
+        return '{{"draw": {}, {}'.format(draw, body[1:])
+
+
+class ConditionalGet:
+    """
+    : client side模式(dt_serverSide = False)下，为JSON数据生成ETag以及Last-Modified，
+    : 数据没有变化时返回304，不再查询以及传输全部数据
+    : updated_field为None时，ETag由Meta.model的数据版本(参见track_model)生成，没有Last-Modified；
+    : 否则由Max(updated_field)以及Count(pk)生成，Last-Modified为Max(updated_field)
+    : snapshot为True时，将gzip压缩后的JSON保存在缓存中，客户端支持gzip时直接返回
+    : 通过ModelDataTable的Meta.conditional_get指定
+    """
+    def __init__(self, updated_field=None, snapshot=False, timeout=3600, cache_alias='default'):
+        self.updated_field = updated_field
+        self.snapshot = snapshot
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+
+    def bind(self, dt_config):
+        if self.updated_field is None:
+            track_model(dt_config.Meta.model, self.cache_alias)
+
+    def get_validators(self, dt_config, queryset):
+        """
+        :return: tuple(etag, last_modified)，last_modified为unix时间戳或None；
+        : queryset为空(EmptyResultSet)时返回(None, None)
+        """
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return None, None
+        last_modified = None
+        if self.updated_field is None:
+            version = get_model_version(dt_config.Meta.model, self.cache_alias)
+        else:
+            aggregates = queryset.aggregate(last_modified=Max(self.updated_field), count=Count('pk'))
+            last = aggregates['last_modified']
+            if last is not None:
+                last_modified = calendar.timegm(last.utctimetuple())
+            version = '{}|{}'.format(last, aggregates['count'])
+        digest = hashlib.md5('{}.{}|{}|{}|{}'.format(
+            dt_config.__module__, dt_config.__qualname__, dt_config.wire_format, sql, version
+        ).encode('utf-8')).hexdigest()
+        return '"{}"'.format(digest), last_modified
+
+    def get_snapshot_key(self, dt_config, etag):
+        return '{}:{}.{}:{}'.format(SNAPSHOT_KEY_PREFIX, dt_config.__module__, dt_config.__qualname__, etag.strip('"'))
+
+    def get_snapshot(self, dt_config, etag):
+        """
+        :return: bytes, gzip压缩后的JSON，不存在时返回None
+        """
+        return caches[self.cache_alias].get(self.get_snapshot_key(dt_config, etag))
+
+    def set_snapshot(self, dt_config, etag, content):
+        """
+        :param content: bytes, JSON
+        :return: bytes, gzip压缩后的JSON
+        """
+        compressed = gzip.compress(content)
+        caches[self.cache_alias].set(self.get_snapshot_key(dt_config, etag), compressed, self.timeout)
+        return compressed
+
+
+class DeltaRefresh:
+    """
+    : server side模式下的增量刷新：记录Meta.model各行的变化，
+    : 客户端传回上一次响应中的version(dt_since)以及当前页的行id(dt_ids)，
+    : 服务器只返回当前页中发生了变化的行，客户端在原位置更新
+    : 变化通过post_save以及post_delete signal记录在缓存中，每个变化一个key，
+    : 读取变化的代价与变化的数量成正比，与每页的行数无关
+    : 以下情况返回reload，客户端重新进行完整的请求:
+    : 有新增或者删除的行(计数发生了变化)；变化超过max_changes或者已经从缓存中过期；
+    : 当前页的行(按照当前的搜索以及排序条件)与客户端不同
+    : 通过ModelDataTable的Meta.delta_refresh指定
+    """
+    def __init__(self, max_changes=500, timeout=3600, cache_alias='default'):
+        self.max_changes = max_changes
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+
+    def bind(self, dt_config):
+        if not dt_config.dt_serverSide or dt_config.keyset_pagination:
+            raise ImproperlyConfigured('Meta.delta_refresh requires server-side mode without keyset_pagination')
+        row_id = dt_config.js_config.get('rowId')
+        if row_id is None or '__' in row_id:
+            raise ImproperlyConfigured('Meta.delta_refresh requires dt_rowId to be a field of Meta.model')
+        model = dt_config.Meta.model
+        # 重新定义的同名类替换之前的receiver
+        dispatch_uid = 'datatables_utils.changes.{}.{}'.format(dt_config.__module__, dt_config.__qualname__)
+        table_ref = weakref.ref(dt_config)
+
+        def log_save(sender, instance, created, **kwargs):
+            table = table_ref()
+            if table is not None:
+                self.log_change(table, self.get_row_id(table, instance), CHANGE_CREATED if created else CHANGE_UPDATED)
+
+        def log_delete(sender, instance, **kwargs):
+            table = table_ref()
+            if table is not None:
+                self.log_change(table, self.get_row_id(table, instance), CHANGE_DELETED)
+
+        post_save.disconnect(sender=model, dispatch_uid=dispatch_uid)
+        post_delete.disconnect(sender=model, dispatch_uid=dispatch_uid)
+        post_save.connect(log_save, sender=model, weak=False, dispatch_uid=dispatch_uid)
+        post_delete.connect(log_delete, sender=model, weak=False, dispatch_uid=dispatch_uid)
+
+    @staticmethod
+    def get_row_id(dt_config, instance):
+        """
+        :return: str, instance在JSON数据中的行id(dt_rowId)
+        """
+        return str(getattr(instance, dt_config.pk_column._field.attname))
+
+    def _get_key(self, dt_config):
+        return '{}:{}.{}'.format(CHANGES_KEY_PREFIX, dt_config.__module__, dt_config.__qualname__)
+
+    def get_version(self, dt_config):
+        """
+        : 获取当前的变化序号，需要在查询数据之前读取，之后的变化都大于该序号
+        :return: int
+        """
+        cache = caches[self.cache_alias]
+        key = self._get_key(dt_config) + ':version'
+        version = cache.get(key)
+        if version is None:
+            # 以当前时间作为初始值，序号被清除后，客户端的旧序号一定找不到对应的变化
+            cache.add(key, int(time.time() * 1000), None)
+            version = cache.get(key)
+        return version
+
+    def log_change(self, dt_config, row_id, kind=CHANGE_UPDATED):
+        """
+        : 记录一行的变化，通过update()、bulk_create()等不发送signal的方式修改数据时需要手动调用
+        """
+        cache = caches[self.cache_alias]
+        key = self._get_key(dt_config)
+        try:
+            seq = cache.incr(key + ':version')
+        except ValueError:
+            # 序号不存在，之前的序号都无法使用，不需要记录
+            self.get_version(dt_config)
+            return
+        cache.set('{}:{}'.format(key, seq), (str(row_id), kind), self.timeout)
+
+    def get_changes(self, dt_config, since, version):
+        """
+        :param since: 客户端上一次响应中的version
+        :param version: get_version()的结果
+        :return: OrderedDict, 行id -> 变化类型(新增或者删除优先于更新)；无法确定变化时返回None
+        """
+        if since > version or version - since > self.max_changes:
+            return None
+        key = self._get_key(dt_config)
+        keys = ['{}:{}'.format(key, seq) for seq in range(since + 1, version + 1)]
+        entries = caches[self.cache_alias].get_many(keys) if keys else {}
+        if len(entries) != len(keys):
+            return None
+        changes = OrderedDict()
+        for entry_key in keys:
+            row_id, kind = entries[entry_key]
+            if changes.get(row_id, CHANGE_UPDATED) == CHANGE_UPDATED:
+                changes[row_id] = kind
+        return changes
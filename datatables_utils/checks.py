@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+from .registry import registry
+
+
+@checks.register('datatables_utils')
+def check_tables(app_configs, **kwargs):
+    """
+    : 检查显式指定的table_id冲突，并解析各ModelDataTable子类的field，报告配置错误
+    """
+    app_labels = None if app_configs is None else {app_config.label for app_config in app_configs}
+    errors = []
+    for table_id, tables in sorted(registry.get_collisions().items()):
+        # 默认的table_id('dt-<model_name>')相同是正常的用法，只有在通过table_id查找时才会出错
+        if not any(t.table_id_declared for t in tables):
+            continue
+        errors.append(checks.Warning(
+            'table_id {} is used by multiple ModelDataTable classes: {}'.format(
+                table_id, ', '.join('{}.{}'.format(t.__module__, t.__qualname__) for t in tables)
+            ),
+            hint='Set a unique Meta.table_id on each of them.',
+            obj=tables[0],
+            id='datatables_utils.W001',
+        ))
+    for dt_config in registry.get_tables():
+        if app_labels is not None and dt_config.Meta.model._meta.app_label not in app_labels:
+            continue
+        try:
+            dt_config.bind_fields()
+        except (ImproperlyConfigured, ValueError) as e:
+            errors.append(checks.Error(str(e), obj=dt_config, id='datatables_utils.E001'))
+    return errors
+
+
+def _get_shared_cache_aliases(dt_config):
+    """
+    : 保存数据版本(参见track_model)或者变化记录的缓存，需要在所有进程之间共享
+    :return: list of (选项名, cache alias)
+    """
+    aliases = []
+    if dt_config.response_cache is not None:
+        aliases.append(('response_cache', dt_config.response_cache.cache_alias))
+    if dt_config.conditional_get is not None and dt_config.conditional_get.updated_field is None:
+        aliases.append(('conditional_get', dt_config.conditional_get.cache_alias))
+    if dt_config.delta_refresh is not None:
+        aliases.append(('delta_refresh', dt_config.delta_refresh.cache_alias))
+    return aliases
+
+
+@checks.register('datatables_utils', deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    """
+    : LocMemCache只在当前进程中有效，其他进程看不到数据版本的变化，缓存的响应以及304会一直是旧的数据
+    """
+    app_labels = None if app_configs is None else {app_config.label for app_config in app_configs}
+    errors = []
+    for dt_config in registry.get_tables():
+        if app_labels is not None and dt_config.Meta.model._meta.app_label not in app_labels:
+            continue
+        for option, alias in _get_shared_cache_aliases(dt_config):
+            if isinstance(caches[alias], LocMemCache):
+                errors.append(checks.Warning(
+                    'Meta.{} of {}.{} uses the process-local cache {}'.format(
+                        option, dt_config.__module__, dt_config.__qualname__, alias
+                    ),
+                    hint='Use a cache shared by all worker processes (e.g. Redis or Memcached).',
+                    obj=dt_config,
+                    id='datatables_utils.W002',
+                ))
+    return errors
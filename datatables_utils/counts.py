@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Count
+
+from .instrumentation import phase
+
+
+class CountStrategy:
+    """
+    : 计算recordsTotal, recordsFiltered的策略基类
+    : 通过ModelDataTable的Meta.count_strategy指定，默认为ExactCount
+    """
+    def get_counts(self, dt_config, queryset, filter_q=None, search_key=''):
+        """
+        :param dt_config: ModelDataTable类
+        :param queryset: 未经过搜索过滤的queryset
+        :param filter_q: 搜索所对应的Q对象，为None时表示没有搜索条件
+        :param search_key: 规范化后的搜索条件，用于区分不同的搜索
+        :return: tuple, (records_total, records_filtered)
+        """
+        with phase('count_total'):
+            records_total = self.count_total(dt_config, queryset)
+        if filter_q is None:
+            # 没有搜索条件时，不需要再次count
+            return records_total, records_total
+        with phase('count_filtered'):
+            return records_total, self.count_filtered(dt_config, queryset.filter(filter_q))
+
+    async def aget_counts(self, dt_config, queryset, filter_q=None, search_key=''):
+        """
+        : get_counts()的异步版本，默认在sync_to_async中调用get_counts()
+        """
+        return await sync_to_async(self.get_counts)(dt_config, queryset, filter_q, search_key)
+
+    def get_counts_and_aggregates(self, dt_config, queryset, filter_q=None, search_key='', aggregates=None):
+        """
+        : 同时计算footer所需的聚合值(参见ModelDataTable.get_aggregate_expressions())，
+        : 聚合值与recordsFiltered通过同一条聚合查询得到，不需要额外扫描表
+        :param aggregates: dict, alias -> Expression
+        :return: tuple, (records_total, records_filtered, 聚合值的dict)
+        """
+        if not aggregates:
+            return self.get_counts(dt_config, queryset, filter_q, search_key) + ({},)
+        with phase('count_total'):
+            records_total = self.count_total(dt_config, queryset)
+        filtered_queryset = queryset.filter(filter_q) if filter_q is not None else queryset
+        with phase('count_filtered'):
+            values = filtered_queryset.aggregate(dt_records_filtered=Count('pk'), **aggregates)
+        records_filtered = values.pop('dt_records_filtered')
+        if filter_q is None:
+            # 与get_counts()一致，没有搜索条件时recordsFiltered与recordsTotal相同
+            records_filtered = records_total
+        return records_total, records_filtered, values
+
+    def count_total(self, dt_config, queryset):
+        raise NotImplementedError('subclasses of CountStrategy must provide a count_total() method')
+
+    def count_filtered(self, dt_config, queryset):
+        return self.count_total(dt_config, queryset)
+
+
+class ExactCount(CountStrategy):
+    """
+    : 精确计数，即queryset.count()
+    """
+    def count_total(self, dt_config, queryset):
+        return queryset.count()
+
+    def get_counts_and_aggregates(self, dt_config, queryset, filter_q=None, search_key='', aggregates=None):
+        if not aggregates or filter_q is not None:
+            return super().get_counts_and_aggregates(dt_config, queryset, filter_q, search_key, aggregates)
+        # 没有搜索条件时，计数以及聚合值通过一条查询得到
+        with phase('count'):
+            values = queryset.aggregate(dt_records_total=Count('pk'), **aggregates)
+        records_total = values.pop('dt_records_total')
+        return records_total, records_total, values
+
+    async def aget_counts(self, dt_config, queryset, filter_q=None, search_key=''):
+        if filter_q is None:
+            records_total = await queryset.acount()
+            return records_total, records_total
+        records_total, records_filtered = await asyncio.gather(
+            queryset.acount(), queryset.filter(filter_q).acount()
+        )
+        return records_total, records_filtered
+
+
+class CappedCount(CountStrategy):
+    """
+    : 最多计数到cap条，即SELECT COUNT(*) FROM (... LIMIT cap)
+    : 超过cap条时，返回cap
+    """
+    def __init__(self, cap=10000):
+        self.cap = cap
+
+    def count_total(self, dt_config, queryset):
+        return queryset[:self.cap].count()
+
+
+def _filter_aggregate(expression, filter_q):
+    expression = expression.copy()
+    expression.filter = filter_q if expression.filter is None else filter_q & expression.filter
+    return expression
+
+
+class AggregateCount(CountStrategy):
+    """
+    : 通过一条条件聚合查询同时得到recordsTotal以及recordsFiltered
+    : 即SELECT COUNT(pk), COUNT(pk) FILTER (WHERE ...) FROM ...
+    """
+    def get_counts(self, dt_config, queryset, filter_q=None, search_key=''):
+        with phase('count'):
+            if filter_q is None:
+                records_total = queryset.count()
+                return records_total, records_total
+            counts = queryset.aggregate(
+                records_total=Count('pk'),
+                records_filtered=Count('pk', filter=filter_q),
+            )
+            return counts['records_total'], counts['records_filtered']
+
+    def get_counts_and_aggregates(self, dt_config, queryset, filter_q=None, search_key='', aggregates=None):
+        """
+        : 计数以及聚合值通过一条查询得到，聚合值只包括满足filter_q的行
+        """
+        if not aggregates:
+            return self.get_counts(dt_config, queryset, filter_q, search_key) + ({},)
+        if filter_q is not None:
+            aggregates = {alias: _filter_aggregate(expression, filter_q) for alias, expression in aggregates.items()}
+        with phase('count'):
+            values = queryset.aggregate(
+                dt_records_total=Count('pk'),
+                dt_records_filtered=Count('pk', filter=filter_q),
+                **aggregates
+            )
+        return values.pop('dt_records_total'), values.pop('dt_records_filtered'), values
+
+    def count_total(self, dt_config, queryset):
+        return queryset.count()
+
+
+class EstimatedCount(CountStrategy):
+    """
+    : 使用数据库查询计划器的估计值计数，目前只支持PostgreSQL:
+    : 不带过滤条件时读取pg_class.reltuples，否则读取EXPLAIN的Plan Rows
+    : 估计值小于threshold，或者数据库不支持时，使用fallback策略精确计数
+    """
+    def __init__(self, threshold=10000, fallback=None):
+        self.threshold = threshold
+        self.fallback = fallback if fallback is not None else ExactCount()
+
+    def count_total(self, dt_config, queryset):
+        estimate = self.get_estimate(queryset)
+        if estimate is None or estimate < self.threshold:
+            return self.fallback.count_total(dt_config, queryset)
+        return estimate
+
+    def get_estimate(self, queryset):
+        """
+        :return: int或者None(无法估计)
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [connection.ops.quote_name(queryset.model._meta.db_table)]
+                )
+                row = cursor.fetchone()
+                if row is not None and row[0] >= 0:
+                    return row[0]
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CachedCount(CountStrategy):
+    """
+    : 将另一个策略的计数结果缓存timeout秒
+    : 缓存的key由table_id，未过滤queryset的SQL以及规范化后的搜索条件组成
+    """
+    key_prefix = 'datatables_utils:count'
+
+    def __init__(self, strategy=None, timeout=60, cache_alias='default'):
+        self.strategy = strategy if strategy is not None else ExactCount()
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+
+    def get_cache_key(self, dt_config, queryset, search_key):
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return None
+        digest = hashlib.md5('{}|{}'.format(sql, search_key).encode('utf-8')).hexdigest()
+        return '{}:{}:{}'.format(self.key_prefix, dt_config.table_id, digest)
+
+    def get_counts(self, dt_config, queryset, filter_q=None, search_key=''):
+        cache_key = self.get_cache_key(dt_config, queryset, search_key)
+        if cache_key is None:
+            return self.strategy.get_counts(dt_config, queryset, filter_q, search_key)
+        cache = caches[self.cache_alias]
+        counts = cache.get(cache_key)
+        if counts is None:
+            counts = self.strategy.get_counts(dt_config, queryset, filter_q, search_key)
+            cache.set(cache_key, counts, self.timeout)
+        return tuple(counts)
+
+    def get_counts_and_aggregates(self, dt_config, queryset, filter_q=None, search_key='', aggregates=None):
+        if not aggregates:
+            return self.get_counts(dt_config, queryset, filter_q, search_key) + ({},)
+        cache_key = self.get_cache_key(dt_config, queryset, search_key)
+        if cache_key is None:
+            return self.strategy.get_counts_and_aggregates(dt_config, queryset, filter_q, search_key, aggregates)
+        cache_key += ':' + ','.join(aggregates)
+        cache = caches[self.cache_alias]
+        result = cache.get(cache_key)
+        if result is None:
+            result = self.strategy.get_counts_and_aggregates(dt_config, queryset, filter_q, search_key, aggregates)
+            cache.set(cache_key, result, self.timeout)
+        return tuple(result)
+
+    def count_total(self, dt_config, queryset):
+        return self.strategy.count_total(dt_config, queryset)
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+import re
+import time
+from contextlib import contextmanager
+
+from django.db import OperationalError, connections, transaction
+
+
+FALLBACK_PLAIN = 'plain'
+FALLBACK_PREFIX = 'prefix'
+FALLBACK_ERROR = 'error'
+FALLBACKS = (FALLBACK_PLAIN, FALLBACK_PREFIX, FALLBACK_ERROR)
+
+# SQLite每执行该数量的VM指令检查一次是否超时
+SQLITE_PROGRESS_STEPS = 1000
+
+_quantifier_re = re.compile(r'\{\d*(,\d*)?\}')
+
+
+class CostExceeded(Exception):
+    """
+    : 搜索内容超过CostGuard的限制，并且fallback为'error'
+    """
+    pass
+
+
+class QueryTimeout(Exception):
+    """
+    : 查询超过CostGuard.statement_timeout
+    """
+    pass
+
+
+def get_regex_complexity(pattern):
+    """
+    : 估计正则表达式的回溯代价: 量词、分支以及分组的数量之和
+    : 嵌套的量词(例如"(a+)+")、被量词修饰的分支(例如"(a|aa)+")以及反向引用可能导致指数级的回溯，返回None
+    :return: int或者None
+    """
+    complexity = 0
+    # 各层分组中是否包含量词或者分支
+    groups = [False]
+    last_group_quantified = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        closed_group = False
+        if char == '\\':
+            if pattern[i + 1:i + 2].isdigit():
+                return None
+            i += 2
+            last_group_quantified = False
+            continue
+        if char == '[':
+            # 字符集合作为一个整体
+            end = pattern.find(']', i + 2)
+            i = len(pattern) if end < 0 else end + 1
+            last_group_quantified = False
+            continue
+        if char == '(':
+            complexity += 1
+            groups.append(False)
+        elif char == ')':
+            last_group_quantified = groups.pop() if len(groups) > 1 else False
+            closed_group = True
+        elif char == '|':
+            complexity += 1
+            groups[-1] = True
+        elif char in '*+?' or (char == '{' and _quantifier_re.match(pattern, i)):
+            if char == '{':
+                i = _quantifier_re.match(pattern, i).end() - 1
+            if last_group_quantified:
+                return None
+            complexity += 1
+            groups[-1] = True
+        i += 1
+        if not closed_group:
+            last_group_quantified = False
+    return complexity
+
+
+class CostGuard:
+    """
+    : 限制用户提交的搜索内容的查询代价，通过ModelDataTable的Meta.cost_guard指定
+    : max_pattern_length: 搜索内容的最大长度
+    : allow_regex: 是否允许正则搜索
+    : max_regex_length, max_regex_complexity: 正则表达式的最大长度以及复杂度(参见get_regex_complexity())
+    : statement_timeout: 每个查询的最长执行时间(秒，正数)，超时后返回DataTables的error(导出时中断下载)
+    : fallback: 搜索内容超过限制时的处理方式:
+    :   'plain': 作为普通文本搜索(截断到max_pattern_length)
+    :   'prefix': 作为普通文本进行前缀搜索(istartswith)，有与prefix_search相同的索引时能够使用索引
+    :   'error': 返回DataTables的error
+    : 每页的最大行数由Meta.max_page_length限制
+    """
+    def __init__(self, max_pattern_length=256, allow_regex=True, max_regex_length=64, max_regex_complexity=10,
+                 statement_timeout=None, fallback=FALLBACK_PLAIN):
+        if fallback not in FALLBACKS:
+            raise ValueError('fallback should be one of {}'.format(', '.join(FALLBACKS)))
+        # 0在各数据库中的含义不同(PostgreSQL以及MySQL表示不限制)，只接受正数
+        if statement_timeout is not None and statement_timeout <= 0:
+            raise ValueError('statement_timeout should be a positive number of seconds')
+        self.max_pattern_length = max_pattern_length
+        self.allow_regex = allow_regex
+        self.max_regex_length = max_regex_length
+        self.max_regex_complexity = max_regex_complexity
+        self.statement_timeout = statement_timeout
+        self.fallback = fallback
+
+    def is_regex_allowed(self, pattern):
+        if not self.allow_regex:
+            return False
+        if self.max_regex_length is not None and len(pattern) > self.max_regex_length:
+            return False
+        try:
+            re.compile(pattern)
+        except re.error:
+            return False
+        complexity = get_regex_complexity(pattern)
+        if complexity is None:
+            return False
+        return self.max_regex_complexity is None or complexity <= self.max_regex_complexity
+
+    def check_search(self, pattern, is_regex):
+        """
+        :raise CostExceeded: 超过限制并且fallback为'error'
+        :return: tuple(pattern, is_regex, prefix)
+        """
+        too_long = self.max_pattern_length is not None and len(pattern) > self.max_pattern_length
+        if not too_long and (not is_regex or self.is_regex_allowed(pattern)):
+            return pattern, is_regex, False
+        if self.fallback == FALLBACK_ERROR:
+            raise CostExceeded('Search pattern exceeds the cost limit')
+        if self.max_pattern_length is not None:
+            pattern = pattern[:self.max_pattern_length]
+        return pattern, False, self.fallback == FALLBACK_PREFIX
+
+    def apply(self, dt_request):
+        """
+        : 对全局搜索以及各列的搜索进行检查
+        :raise CostExceeded:
+        :return: DataTablesRequest
+        """
+        search_value, search_regex, search_prefix = dt_request.search_value, dt_request.search_regex, False
+        if search_value:
+            search_value, search_regex, search_prefix = self.check_search(search_value, search_regex)
+        column_searches = []
+        for column_search in dt_request.column_searches:
+            value, regex, prefix = self.check_search(column_search.value, column_search.regex)
+            column_searches.append(column_search._replace(value=value, regex=regex, prefix=prefix))
+        return dt_request._replace(
+            search_value=search_value,
+            search_regex=search_regex,
+            search_prefix=search_prefix,
+            column_searches=tuple(column_searches),
+        )
+
+    @contextmanager
+    def limit_statements(self, using='default'):
+        """
+        : 在with中执行的每个查询超过statement_timeout时，抛出QueryTimeout
+        : PostgreSQL: SET LOCAL statement_timeout(在transaction中)
+        : MySQL: SET SESSION max_execution_time(只对SELECT有效)，结束后恢复原来的值
+        : SQLite: 通过progress handler中断查询，每个查询开始执行时重新计时
+        : 其他数据库不做限制
+        : with得到一个重新计时的函数，分批读取iterator()的结果时，在读取每一批之前调用，
+        : 使SQLite的限制作用于每一批的读取，而不是整个导出
+        """
+        if self.statement_timeout is None:
+            yield lambda: None
+            return
+        connection = connections[using]
+        deadline = [time.monotonic() + self.statement_timeout]
+        timeout_ms = int(self.statement_timeout * 1000)
+
+        def restart():
+            deadline[0] = time.monotonic() + self.statement_timeout
+
+        def restart_on_execute(execute, sql, params, many, context):
+            restart()
+            return execute(sql, params, many, context)
+
+        try:
+            with connection.execute_wrapper(restart_on_execute):
+                if connection.vendor == 'postgresql':
+                    with transaction.atomic(using=using):
+                        with connection.cursor() as cursor:
+                            cursor.execute('SET LOCAL statement_timeout = %s', [timeout_ms])
+                        yield restart
+                elif connection.vendor == 'mysql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT @@SESSION.max_execution_time')
+                        previous = cursor.fetchone()[0]
+                        cursor.execute('SET SESSION max_execution_time = %s', [timeout_ms])
+                    try:
+                        yield restart
+                    finally:
+                        with connection.cursor() as cursor:
+                            cursor.execute('SET SESSION max_execution_time = %s', [previous])
+                elif connection.vendor == 'sqlite':
+                    connection.ensure_connection()
+                    connection.connection.set_progress_handler(
+                        lambda: time.monotonic() > deadline[0], SQLITE_PROGRESS_STEPS
+                    )
+                    try:
+                        yield restart
+                    finally:
+                        connection.connection.set_progress_handler(None, SQLITE_PROGRESS_STEPS)
+                else:
+                    yield restart
+        except OperationalError as e:
+            if time.monotonic() >= deadline[0]:
+                raise QueryTimeout('Query exceeded the statement timeout') from e
+            raise
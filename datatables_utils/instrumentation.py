@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.dispatch import Signal
+
+
+logger = logging.getLogger('datatables_utils.slow_requests')
+
+# 每个被记录的DataTables请求处理完成后发送
+# sender为ModelDataTable类，参数timings为RequestTimings，view为处理请求的view
+dt_request_finished = Signal()
+
+_current_timings = ContextVar('datatables_utils_timings', default=None)
+
+
+def _get_int(http_queryset, key):
+    try:
+        return int(http_queryset.get(key))
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestTimings:
+    """
+    : 记录一次DataTables请求各阶段(phase)的耗时(秒)以及数据库查询次数
+    : 常见的phase: count_total, count_filtered(或count), page, serialize, encode
+    : 同时作为connection.execute_wrapper()的wrapper，将查询计入当前的phase
+    """
+    def __init__(self, dt_config, http_queryset=None):
+        self.dt_config = dt_config
+        http_queryset = http_queryset if http_queryset is not None else {}
+        # 全局搜索以及各列搜索内容的总长度
+        self.search_length = sum(
+            len(value) for key, value in http_queryset.items()
+            if key == 'search[value]' or key.endswith('[search][value]')
+        )
+        self.start = _get_int(http_queryset, 'start')
+        self.length = _get_int(http_queryset, 'length')
+        # phase名 -> [耗时, 查询次数]
+        self.phases = OrderedDict()
+        self.queries = 0
+        self.duration = None
+        self._stack = []
+        self._started = time.perf_counter()
+
+    @property
+    def table(self):
+        return '{}.{}'.format(self.dt_config.__module__, self.dt_config.__qualname__)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        if self._stack:
+            self._stack[-1][1] += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def phase(self, name):
+        entry = [0.0, 0]
+        self._stack.append(entry)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self.record(name, time.perf_counter() - started, entry[1])
+
+    def record(self, name, duration, queries=0):
+        """
+        : 记录一个phase，同名的phase累加
+        """
+        entry = self.phases.setdefault(name, [0.0, 0])
+        entry[0] += duration
+        entry[1] += queries
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+
+    def as_server_timing(self):
+        """
+        : 生成Server-Timing响应头，耗时单位为毫秒
+        :return: str
+        """
+        metrics = [
+            '{};dur={:.1f};desc="{} queries"'.format(name, duration * 1000, queries)
+            for name, (duration, queries) in self.phases.items()
+        ]
+        if self.duration is not None:
+            metrics.append('total;dur={:.1f}'.format(self.duration * 1000))
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'table': self.table,
+            'duration': self.duration,
+            'queries': self.queries,
+            'search_length': self.search_length,
+            'start': self.start,
+            'length': self.length,
+            'phases': {name: {'duration': duration, 'queries': queries}
+                       for name, (duration, queries) in self.phases.items()},
+        }
+
+    def __str__(self):
+        phases = ' '.join(
+            '{}={:.3f}s/{}q'.format(name, duration, queries) for name, (duration, queries) in self.phases.items()
+        )
+        return 'table={} duration={:.3f}s queries={} search_length={} start={} length={} {}'.format(
+            self.table, self.duration or 0, self.queries, self.search_length, self.start, self.length, phases
+        ).rstrip()
+
+
+@contextmanager
+def instrument(timings, using='default'):
+    """
+    : 在with中执行的phase()以及数据库查询被记录进timings
+    :param using: 数据库alias，或者多个alias的列表(读查询分散在多个数据库时)
+    """
+    aliases = [using] if isinstance(using, str) else list(dict.fromkeys(using))
+    token = _current_timings.set(timings)
+    try:
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(connections[alias].execute_wrapper(timings))
+            yield timings
+    finally:
+        _current_timings.reset(token)
+        timings.finish()
+
+
+@contextmanager
+def phase(name):
+    """
+    : 记录一个phase，当前没有进行记录时不做任何操作
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    with timings.phase(name):
+        yield
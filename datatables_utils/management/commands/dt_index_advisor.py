@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, migrations
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from ...advisor import IndexAdvisor, get_index
+from ...registry import registry
+
+
+class Command(BaseCommand):
+    help = ('Compares the ordering and search lookups of every ModelDataTable with the indexes of its model, '
+            'and prints the indexes that would avoid full scans or filesorts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', nargs='*', help='Only check tables whose Meta.model is in these apps.')
+        parser.add_argument('--table', action='append', dest='table_ids', default=[],
+                            help='Only check the table with this table_id; can be repeated.')
+        parser.add_argument('--migration', action='store_true',
+                            help='Print a migration adding the recommended indexes for each app.')
+        parser.add_argument('--explain', action='store_true',
+                            help='Print the EXPLAIN output of the first page ordered by each orderable column.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database used by --explain.')
+        parser.add_argument('--check', action='store_true',
+                            help='Exit with a non-zero status if any index is recommended.')
+
+    def handle(self, *app_labels, **options):
+        tables = self.get_tables(app_labels, options['table_ids'])
+        advisor = IndexAdvisor()
+        for dt_config in tables:
+            try:
+                advisor.add_table(dt_config)
+            except (ImproperlyConfigured, ValueError) as e:
+                self.stderr.write('{}: {}'.format(dt_config.table_id, e))
+        advice = advisor.get_advice()
+
+        if options['migration']:
+            self.write_migrations(advice)
+        else:
+            self.write_advice(advice, advisor.notes)
+        if options['explain']:
+            for dt_config in tables:
+                self.write_explain(dt_config, options['database'])
+        if options['check'] and advice:
+            sys.exit(1)
+
+    def get_tables(self, app_labels, table_ids):
+        """
+        : 只有被import过的ModelDataTable子类才会注册，
+        : 这里解析各model的datatables_class，保证通过model指定的table也被检查
+        """
+        for model in apps.get_models():
+            if hasattr(model, 'datatables_class'):
+                registry.get_for_model(model)
+        tables = []
+        for dt_config in sorted(registry.get_tables(), key=lambda t: t.table_id):
+            if app_labels and dt_config.Meta.model._meta.app_label not in app_labels:
+                continue
+            if table_ids and dt_config.table_id not in table_ids:
+                continue
+            tables.append(dt_config)
+        return tables
+
+    def write_advice(self, advice, notes):
+        if not advice:
+            self.stdout.write('No indexes to recommend.')
+        for item in advice:
+            self.stdout.write(self.style.MIGRATE_HEADING('{}.{}({})'.format(
+                item.model._meta.app_label, item.model.__name__, ', '.join(item.fields)
+            )))
+            for table_id, reason in item.reasons:
+                self.stdout.write('  {}: {}'.format(table_id, reason))
+        for table_id, note in notes:
+            self.stdout.write(self.style.WARNING('{}: {}'.format(table_id, note)))
+
+    def write_migrations(self, advice):
+        """
+        : 每个app生成一个依赖于该app当前最新migration的AddIndex migration
+        """
+        operations = OrderedDict()
+        for item in advice:
+            operations.setdefault(item.model._meta.app_label, []).append(migrations.AddIndex(
+                model_name=item.model._meta.model_name, index=get_index(item),
+            ))
+        if not operations:
+            self.stdout.write('No indexes to recommend.')
+            return
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        for app_label, app_operations in operations.items():
+            migration = migrations.Migration('dt_indexes', app_label)
+            migration.dependencies = loader.graph.leaf_nodes(app_label)
+            migration.operations = app_operations
+            self.stdout.write(self.style.MIGRATE_HEADING('# {}'.format(app_label)))
+            self.stdout.write(MigrationWriter(migration).as_string())
+
+    def write_explain(self, dt_config, using):
+        queryset = dt_config.Meta.model._default_manager.using(using)
+        query_fields = dt_config.get_query_fields()
+        page_length = dt_config.js_config.get('pageLength', 10)
+        expressions = dt_config.get_select_expressions(query_fields)
+        if expressions:
+            queryset = queryset.annotate(**expressions)
+        tiebreaker = dt_config.pk_column.query_name
+        for column in dt_config.columns.values():
+            if not column.orderable:
+                continue
+            ordered = queryset.order_by(column.query_name, tiebreaker).values_list(*query_fields)
+            self.stdout.write(self.style.MIGRATE_HEADING('{} order by {}'.format(dt_config.table_id, column.name)))
+            self.stdout.write(ordered[:page_length].explain())
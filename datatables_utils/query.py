@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+
+
+# 未设置Meta.max_page_length时，每页最多返回的行数
+DEFAULT_MAX_PAGE_LENGTH = 1000
+
+
+class InvalidRequest(ValueError):
+    """
+    : DataTables请求参数不合法
+    """
+    pass
+
+
+OrderSpec = namedtuple('OrderSpec', ['name', 'desc'])
+# prefix为True时使用前缀搜索，由CostGuard设置
+ColumnSearch = namedtuple('ColumnSearch', ['column', 'value', 'regex', 'prefix'], defaults=(False,))
+
+
+def _is_nullable(model, query_name):
+    """
+    : 查询路径的值是否可能为NULL：路径上的field允许NULL，或者经过反向关联(LEFT JOIN)
+    """
+    names = query_name.split('__')
+    for index, name in enumerate(names):
+        field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        if not field.concrete or field.null:
+            return True
+        if index < len(names) - 1:
+            model = field.related_model
+    return False
+
+
+class TablePlan(namedtuple('TablePlan', [
+    'columns', 'orderable', 'pk_name', 'max_page_length', 'nullable',
+])):
+    """
+    : ModelDataTable子类建立时预先生成的、不可变的请求处理计划
+    : columns: tuple, 按顺序排列的DataTablesColumn
+    : orderable: frozenset, 可以排序的列序号
+    : pk_name: pk_column的查询名字，作为排序的tiebreaker
+    : max_page_length: 每页最多返回的行数，为None时不限制
+    : nullable: frozenset, 值可能为NULL的可排序列的query_name，按这些列排序时keyset分页不进行seek
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_table(cls, dt_config, max_page_length=DEFAULT_MAX_PAGE_LENGTH):
+        columns = tuple(dt_config.columns.values())
+        for column in columns:
+            column._compile_lookups()
+        return cls(
+            columns=columns,
+            orderable=frozenset(index for index, c in enumerate(columns) if c.orderable),
+            pk_name=dt_config.pk_column.query_name,
+            max_page_length=max_page_length,
+            nullable=frozenset(
+                c.query_name for c in columns if c.orderable and _is_nullable(dt_config.Meta.model, c.query_name)
+            ),
+        )
+
+
+class DataTablesRequest(namedtuple('DataTablesRequest', [
+    'draw', 'start', 'length', 'search_value', 'search_regex', 'column_searches', 'ordering', 'cursor',
+    'search_prefix', 'hidden_columns',
+], defaults=(False, frozenset()))):
+    """
+    : 解析后的DataTables server side请求
+    : column_searches: tuple of ColumnSearch, 只包含不为空的列搜索
+    : ordering: tuple of OrderSpec, name为列的query_name，最后一项总是pk_column，保证排序稳定
+    : search_prefix: 全局搜索是否使用前缀搜索，由CostGuard设置
+    : hidden_columns: frozenset, 前端隐藏(columns[i][visible]为false)的列名
+    """
+    __slots__ = ()
+
+
+def _get_int(http_queryset, key, default=None):
+    value = http_queryset.get(key)
+    if value is None or value == '':
+        if default is None:
+            raise InvalidRequest('Missing request argument {}'.format(key))
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidRequest('Invalid request argument {}: {}'.format(key, value))
+
+
+def parse_request(plan, http_queryset):
+    """
+    : 将GET QueryDict解析为DataTablesRequest
+    : length为-1(全部)或超过plan.max_page_length时，被限制为plan.max_page_length
+    :raise InvalidRequest: 参数缺失或不合法
+    :return: DataTablesRequest
+    """
+    draw = _get_int(http_queryset, 'draw')
+    start = _get_int(http_queryset, 'start', 0)
+    length = _get_int(http_queryset, 'length', 10)
+    if draw < 0 or start < 0 or length < -1:
+        raise InvalidRequest('Negative draw, start or length')
+    if plan.max_page_length is not None and (length == -1 or length > plan.max_page_length):
+        length = plan.max_page_length
+
+    column_searches = []
+    hidden_columns = []
+    for index, column in enumerate(plan.columns):
+        value = http_queryset.get('columns[{}][search][value]'.format(index))
+        if value and column.searchable:
+            regex = http_queryset.get('columns[{}][search][regex]'.format(index)) == 'true'
+            column_searches.append(ColumnSearch(column, value, regex))
+        if http_queryset.get('columns[{}][visible]'.format(index)) == 'false':
+            hidden_columns.append(column.name)
+
+    ordering = []
+    ordered_names = set()
+    for i in range(len(plan.columns)):
+        key = 'order[{}][column]'.format(i)
+        if key not in http_queryset:
+            break
+        index = _get_int(http_queryset, key)
+        if not 0 <= index < len(plan.columns):
+            raise InvalidRequest('Invalid order column: {}'.format(index))
+        direction = http_queryset.get('order[{}][dir]'.format(i), 'asc')
+        if direction not in ('asc', 'desc'):
+            raise InvalidRequest('Invalid order direction: {}'.format(direction))
+        name = plan.columns[index].query_name
+        if index not in plan.orderable or name in ordered_names:
+            continue
+        ordering.append(OrderSpec(name, direction == 'desc'))
+        ordered_names.add(name)
+    if plan.pk_name not in ordered_names:
+        ordering.append(OrderSpec(plan.pk_name, False))
+
+    return DataTablesRequest(
+        draw=draw,
+        start=start,
+        length=length,
+        search_value=http_queryset.get('search[value]', ''),
+        search_regex=http_queryset.get('search[regex]') == 'true',
+        column_searches=tuple(column_searches),
+        ordering=tuple(ordering),
+        cursor=http_queryset.get('cursor'),
+        hidden_columns=frozenset(hidden_columns),
+    )
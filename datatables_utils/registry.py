@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import weakref
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+def _get_qualified_name(dt_config):
+    return '{}.{}'.format(dt_config.__module__, dt_config.__qualname__)
+
+
+class TableRegistry:
+    """
+    : 记录所有ModelDataTable子类，子类建立时由ModelDataTableMetaClass自动注册
+    : 同一个模块中重新定义的同名类(例如模块被重新加载)替换之前的类，
+    : 不同的类使用相同的table_id时视为冲突，参见get_collisions()
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # table_id -> {qualified name: weakref}
+        self._tables = {}
+        # model -> 解析后的model.datatables_class
+        self._model_tables = {}
+
+    def register(self, dt_config):
+        with self._lock:
+            tables = self._tables.setdefault(dt_config.table_id, {})
+            tables[_get_qualified_name(dt_config)] = weakref.ref(dt_config)
+            self._model_tables.clear()
+
+    def _get_live_tables(self, table_id):
+        tables = self._tables.get(table_id, {})
+        return [table for table in (ref() for ref in tables.values()) if table is not None]
+
+    def get(self, table_id):
+        """
+        :raise LookupError: 没有使用该table_id的类
+        :raise ImproperlyConfigured: 多个类使用该table_id
+        :return: ModelDataTable子类
+        """
+        with self._lock:
+            tables = self._get_live_tables(table_id)
+        if not tables:
+            raise LookupError('No ModelDataTable registered with table_id {}'.format(table_id))
+        if len(tables) > 1:
+            raise ImproperlyConfigured('table_id {} is used by multiple ModelDataTable classes: {}'.format(
+                table_id, ', '.join(_get_qualified_name(t) for t in tables)
+            ))
+        return tables[0]
+
+    def get_tables(self):
+        """
+        :return: list, 所有已注册的ModelDataTable子类
+        """
+        with self._lock:
+            return [table for table_id in list(self._tables) for table in self._get_live_tables(table_id)]
+
+    def get_collisions(self):
+        """
+        :return: dict, table_id -> 使用该table_id的多个ModelDataTable子类
+        """
+        with self._lock:
+            collisions = {}
+            for table_id in self._tables:
+                tables = self._get_live_tables(table_id)
+                if len(tables) > 1:
+                    collisions[table_id] = tables
+            return collisions
+
+    def get_for_model(self, model):
+        """
+        : 解析model.datatables_class(ModelDataTable子类或者其import路径)，
+        : 每个model只解析一次
+        :raise ImproperlyConfigured: 没有设置或者设置不正确
+        :return: ModelDataTable子类
+        """
+        datatables_class = self._model_tables.get(model)
+        if datatables_class is not None:
+            return datatables_class
+        datatables_class = self.resolve_model(model)
+        with self._lock:
+            self._model_tables[model] = datatables_class
+        return datatables_class
+
+    def resolve_model(self, model):
+        from .utils import ModelDataTable
+
+        try:
+            datatables_class = model.datatables_class
+        except AttributeError:
+            raise ImproperlyConfigured('No datatables class configured in {}:{}'
+                                       .format(model._meta.app_label, model._meta.verbose_name))
+        if isinstance(datatables_class, str):
+            try:
+                datatables_class = import_string(datatables_class)
+            except ImportError:
+                raise ImproperlyConfigured('Error in datatables configured in {}:{}'
+                                           .format(model._meta.app_label, model._meta.verbose_name))
+        if not isinstance(datatables_class, type) or not issubclass(datatables_class, ModelDataTable):
+            raise ImproperlyConfigured('Improperly configured datatables_class attr in {}:{}'
+                                       .format(model._meta.app_label, model._meta.verbose_name))
+        return datatables_class
+
+    def clear_cache(self):
+        with self._lock:
+            self._model_tables.clear()
+
+
+registry = TableRegistry()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .cache import get_model_write_time
+
+
+WRITE_COOKIE_NAME = 'dt_last_write'
+WRITE_COOKIE_SALT = 'datatables_utils.routing'
+# 写操作标记的最长保留时间(秒)，ReadRouting.read_your_writes不应超过该值
+WRITE_COOKIE_MAX_AGE = 600
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+def mark_write(response, timestamp=None):
+    """
+    : 在response的cookie中记录当前用户进行了写操作，
+    : 之后read_your_writes秒内，该用户的DataTables请求读取primary
+    """
+    response.set_signed_cookie(
+        WRITE_COOKIE_NAME, str(timestamp if timestamp is not None else time.time()), salt=WRITE_COOKIE_SALT,
+        max_age=WRITE_COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+    )
+
+
+def get_last_write(request):
+    """
+    :return: float, 用户最后一次写操作的时间；没有记录时返回None
+    """
+    value = request.get_signed_cookie(
+        WRITE_COOKIE_NAME, default=None, salt=WRITE_COOKIE_SALT, max_age=WRITE_COOKIE_MAX_AGE
+    )
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ReadYourWritesMiddleware:
+    """
+    : 非安全方法(POST, PUT, PATCH, DELETE)的请求成功后，调用mark_write()
+    : 需要使用ReadRouting的read_your_writes时加入MIDDLEWARE
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            mark_write(response)
+        return response
+
+
+class ReadRouting:
+    """
+    : DataTables读查询所使用的数据库，通过ModelDataTable的Meta.read_routing指定
+    : using: 当前页查询(以及client side的全部数据、导出)的alias，为None时使用queryset原本的db
+    : count_using: recordsTotal, recordsFiltered以及footer聚合的alias，默认与using相同
+    : read_your_writes: 用户进行写操作(参见ReadYourWritesMiddleware)后的秒数内，所有查询都使用primary，
+    : 避免用户在replica同步之前看不到自己的修改
+    : replication_lag: replica同步延迟的上限(秒)，响应以Meta.model的数据版本为key缓存时
+    : (ResponseCache以及不指定updated_field的ConditionalGet)，数据版本增加后的秒数内使用primary，
+    : 避免其他用户把replica上的旧数据缓存在新的数据版本下
+    """
+    def __init__(self, using=None, count_using=None, primary=DEFAULT_DB_ALIAS, read_your_writes=0,
+                 replication_lag=5):
+        if read_your_writes > WRITE_COOKIE_MAX_AGE:
+            raise ValueError('read_your_writes should not exceed {} seconds'.format(WRITE_COOKIE_MAX_AGE))
+        self.using = using
+        self.count_using = count_using
+        self.primary = primary
+        self.read_your_writes = read_your_writes
+        self.replication_lag = replication_lag
+
+    def bind(self, dt_config):
+        for alias in (self.using, self.count_using, self.primary):
+            if alias is not None and alias not in connections.databases:
+                raise ImproperlyConfigured('Database alias {} of {}.Meta.read_routing is not in DATABASES'
+                                           .format(alias, dt_config.__name__))
+
+    def has_recent_write(self, request):
+        """
+        : 用户是否在read_your_writes秒内进行过写操作
+        """
+        if not self.read_your_writes or request is None:
+            return False
+        last_write = get_last_write(request)
+        return last_write is not None and time.time() - last_write < self.read_your_writes
+
+    def has_recent_model_write(self, model, cache_alias='default'):
+        """
+        : model的数据版本是否在replication_lag秒内增加过
+        """
+        if not self.replication_lag:
+            return False
+        written = get_model_write_time(model, cache_alias)
+        return written is not None and time.time() - written < self.replication_lag
+
+    def get_aliases(self, request, default, cached_model=None, cache_alias='default'):
+        """
+        :param request: 当前请求，为None时不检查read_your_writes
+        :param default: queryset原本的db
+        :param cached_model: 响应以该model的数据版本为key缓存时指定，检查replication_lag
+        :param cache_alias: 保存数据版本的缓存
+        :return: tuple(当前页查询的alias, 计数查询的alias)
+        """
+        if self.has_recent_write(request) or (
+                cached_model is not None and self.has_recent_model_write(cached_model, cache_alias)):
+            return self.primary, self.primary
+        using = self.using or default
+        return using, self.count_using or using
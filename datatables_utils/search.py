@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+from functools import reduce
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_migrate, post_save
+
+
+def tokenize(pattern):
+    """
+    : 将搜索内容按空白字符切分为多个term
+    :return: list
+    """
+    return pattern.split()
+
+
+class SearchBackend:
+    """
+    : 全局搜索(search[value])的实现基类
+    : 通过ModelDataTable的Meta.search_backend指定，默认为ColumnSearchBackend
+    """
+    # 为True时，ModelDataTable子类建立时立即解析field并调用bind()，
+    # 否则在第一次使用该类时才调用
+    eager_bind = False
+
+    def bind(self, dt_config):
+        """
+        : 在ModelDataTable子类的field解析之后调用，用于检查配置，注册signal等
+        """
+        pass
+
+    def get_filter_q_object(self, dt_config, pattern, is_regex):
+        """
+        :param dt_config: ModelDataTable类
+        :param pattern: 搜索内容，不为空
+        :param is_regex: 是否为正则表达式
+        :return: django.db.models.Q对象
+        """
+        raise NotImplementedError('subclasses of SearchBackend must provide a get_filter_q_object() method')
+
+    def get_prefix_q_object(self, dt_config, pattern):
+        """
+        : CostGuard的fallback为'prefix'时使用，对各可搜索列进行前缀搜索(istartswith)，并进行OR操作
+        :return: django.db.models.Q对象
+        """
+        q_objects = [
+            c.get_filter_q_object(pattern, False, prefix=True) for c in self.get_searchable_columns(dt_config)
+        ]
+        # 空的Q()表示该列不适用
+        q_objects = [q for q in q_objects if q]
+        if not q_objects:
+            return Q(pk__in=[])
+        return reduce(lambda x, y: x | y, q_objects)
+
+    def get_searchable_columns(self, dt_config):
+        return [c for c in dt_config.columns.values() if c.searchable]
+
+
+class ColumnSearchBackend(SearchBackend):
+    """
+    : 对每个可搜索列产生lookup，并进行OR操作，
+    : 即col1__icontains OR col2__icontains ...
+    : tokenize为True时，搜索内容被切分为多个term，各term之间进行AND操作
+    """
+    def __init__(self, tokenize=False):
+        self.tokenize = tokenize
+
+    def get_filter_q_object(self, dt_config, pattern, is_regex):
+        columns = self.get_searchable_columns(dt_config)
+        if self.tokenize and not is_regex:
+            terms = tokenize(pattern)
+        else:
+            terms = [pattern]
+        return reduce(
+            lambda x, y: x & y,
+            [self.get_term_q_object(columns, term, is_regex) for term in terms],
+            Q()
+        )
+
+    def get_term_q_object(self, columns, term, is_regex):
+        q_objects = [c.get_filter_q_object(term, is_regex) for c in columns]
+        # 空的Q()表示该列不适用
+        q_objects = [q for q in q_objects if q]
+        if not q_objects:
+            # term不适用于任何一列时，不匹配任何数据
+            return Q(pk__in=[])
+        return reduce(lambda x, y: x | y, q_objects)
+
+
+class ShadowTableMixin:
+    """
+    : 需要将可搜索列同步到额外的索引结构中的backend，
+    : 要求可搜索列都是Meta.model自身的非relation字段
+    : 索引结构通过signal同步，需要在ModelDataTable子类建立时立即bind
+    """
+    eager_bind = True
+
+    def get_prefix_q_object(self, dt_config, pattern):
+        # 索引结构本身可以高效处理普通文本搜索
+        return self.get_filter_q_object(dt_config, pattern, False)
+
+    def get_index_columns(self, dt_config):
+        columns = self.get_searchable_columns(dt_config)
+        for column in columns:
+            field = column._field
+            if '__' in column.query_name or field.is_relation or field.model is not dt_config.Meta.model:
+                raise ImproperlyConfigured('{} only supports fields of the model itself, got {}'
+                                           .format(type(self).__name__, column.name))
+        return columns
+
+
+class SQLiteFTS5SearchBackend(ShadowTableMixin, SearchBackend):
+    """
+    : 使用SQLite FTS5 external content表进行搜索
+    : 影子表以及同步所需的触发器在post_migrate时自动建立，
+    : 也可以调用install()手动建立(例如在migration的RunPython中)
+    : 各term之间进行AND操作，prefix为True时每个term进行前缀匹配
+    : 正则搜索无法通过FTS5实现，交由fallback处理
+    """
+    def __init__(self, table_name=None, prefix=True, fallback=None):
+        self.table_name = table_name
+        self.prefix = prefix
+        self.fallback = fallback if fallback is not None else ColumnSearchBackend()
+
+    def get_table_name(self, dt_config):
+        if self.table_name is not None:
+            return self.table_name
+        return '{}_dt_fts'.format(dt_config.Meta.model._meta.db_table)
+
+    def bind(self, dt_config):
+        self.get_index_columns(dt_config)
+        model = dt_config.Meta.model
+
+        def install(sender, using, **kwargs):
+            if sender.label == model._meta.app_label:
+                self.install(dt_config, using=using)
+
+        post_migrate.connect(install, weak=False, dispatch_uid='datatables_utils.fts5.{}.{}'.format(
+            dt_config.__module__, dt_config.__qualname__
+        ))
+
+    def install(self, dt_config, using='default'):
+        """
+        : 建立FTS5影子表以及同步用的触发器，并重建索引
+        : 非SQLite数据库会被忽略
+        """
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            return
+        model = dt_config.Meta.model
+        qn = connection.ops.quote_name
+        fts_table = qn(self.get_table_name(dt_config))
+        base_table = qn(model._meta.db_table)
+        pk_column = qn(model._meta.pk.column)
+        columns = [qn(c._field.column) for c in self.get_index_columns(dt_config)]
+        column_list = ', '.join(columns)
+        new_values = ', '.join('new.' + c for c in columns)
+        old_values = ', '.join('old.' + c for c in columns)
+        trigger_prefix = self.get_table_name(dt_config)
+        statements = [
+            'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, content={}, content_rowid={})'.format(
+                fts_table, column_list, qn(model._meta.db_table), qn(model._meta.pk.column)
+            ),
+            'CREATE TRIGGER IF NOT EXISTS {} AFTER INSERT ON {} BEGIN '
+            'INSERT INTO {}(rowid, {}) VALUES (new.{}, {}); END'.format(
+                qn(trigger_prefix + '_ai'), base_table, fts_table, column_list, pk_column, new_values
+            ),
+            'CREATE TRIGGER IF NOT EXISTS {} AFTER DELETE ON {} BEGIN '
+            'INSERT INTO {}({}, rowid, {}) VALUES (\'delete\', old.{}, {}); END'.format(
+                qn(trigger_prefix + '_ad'), base_table, fts_table, fts_table, column_list, pk_column, old_values
+            ),
+            'CREATE TRIGGER IF NOT EXISTS {} AFTER UPDATE ON {} BEGIN '
+            'INSERT INTO {}({}, rowid, {}) VALUES (\'delete\', old.{}, {}); '
+            'INSERT INTO {}(rowid, {}) VALUES (new.{}, {}); END'.format(
+                qn(trigger_prefix + '_au'), base_table, fts_table, fts_table, column_list, pk_column, old_values,
+                fts_table, column_list, pk_column, new_values
+            ),
+            'INSERT INTO {}({}) VALUES (\'rebuild\')'.format(fts_table, fts_table),
+        ]
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    def get_match_query(self, pattern):
+        terms = ['"{}"'.format(term.replace('"', '""')) for term in tokenize(pattern)]
+        if self.prefix:
+            terms = [term + '*' for term in terms]
+        return ' '.join(terms)
+
+    def get_filter_q_object(self, dt_config, pattern, is_regex):
+        if is_regex:
+            return self.fallback.get_filter_q_object(dt_config, pattern, is_regex)
+        match_query = self.get_match_query(pattern)
+        if not match_query:
+            return Q()
+        fts_table = self.get_table_name(dt_config)
+        return Q(pk__in=RawSQL(
+            'SELECT rowid FROM "{0}" WHERE "{0}" MATCH %s'.format(fts_table), (match_query,)
+        ))
+
+
+class PostgresSearchBackend(ShadowTableMixin, SearchBackend):
+    """
+    : 使用PostgreSQL全文搜索，要求Meta.model中定义了SearchVectorField(vector_field)，
+    : 并建立了GIN索引
+    : sync为True时，通过post_save signal更新vector_field，
+    : 也可以设置sync为False，并通过数据库触发器维护vector_field
+    : 各term之间进行AND操作
+    """
+    def __init__(self, vector_field='search_vector', config='simple', sync=True, fallback=None):
+        self.vector_field = vector_field
+        self.config = config
+        self.sync = sync
+        self.fallback = fallback if fallback is not None else ColumnSearchBackend()
+
+    def bind(self, dt_config):
+        columns = self.get_index_columns(dt_config)
+        if not self.sync:
+            return
+        from django.contrib.postgres.search import SearchVector
+        model = dt_config.Meta.model
+        vector = SearchVector(*[c.query_name for c in columns], config=self.config)
+
+        def update_vector(sender, instance, raw=False, update_fields=None, **kwargs):
+            if raw or (update_fields is not None and set(update_fields) == {self.vector_field}):
+                return
+            sender._default_manager.filter(pk=instance.pk).update(**{self.vector_field: vector})
+
+        post_save.connect(update_vector, sender=model, weak=False, dispatch_uid='datatables_utils.pg.{}.{}'.format(
+            dt_config.__module__, dt_config.__qualname__
+        ))
+
+    def get_filter_q_object(self, dt_config, pattern, is_regex):
+        if is_regex:
+            return self.fallback.get_filter_q_object(dt_config, pattern, is_regex)
+        from django.contrib.postgres.search import SearchQuery
+        queries = [SearchQuery(term, config=self.config) for term in tokenize(pattern)]
+        if not queries:
+            return Q()
+        return Q(**{self.vector_field: reduce(lambda x, y: x & y, queries)})
+
+
+class TrigramSearchBackend(ColumnSearchBackend):
+    """
+    : PostgreSQL中，pg_trgm的GIN索引能够服务于icontains(UPPER(col::text) LIKE UPPER(...))，
+    : 调用install()建立pg_trgm扩展以及各可搜索列的索引
+    : 各term之间进行AND操作
+    """
+    def __init__(self):
+        super().__init__(tokenize=True)
+
+    def install(self, dt_config, using='default'):
+        connection = connections[using]
+        if connection.vendor != 'postgresql':
+            return
+        model = dt_config.Meta.model
+        qn = connection.ops.quote_name
+        statements = ['CREATE EXTENSION IF NOT EXISTS pg_trgm']
+        for column in self.get_searchable_columns(dt_config):
+            if '__' in column.query_name or column._field.is_relation:
+                continue
+            statements.append(
+                'CREATE INDEX IF NOT EXISTS {} ON {} USING gin ((UPPER({}::text)) gin_trgm_ops)'.format(
+                    qn('{}_{}_dt_trgm'.format(model._meta.db_table, column._field.column)[:63]),
+                    qn(model._meta.db_table),
+                    qn(column._field.column),
+                )
+            )
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
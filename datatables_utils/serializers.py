@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils.duration import duration_iso_string
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+WIRE_FORMAT_OBJECT = 'object'
+WIRE_FORMAT_ARRAY = 'array'
+WIRE_FORMATS = (WIRE_FORMAT_OBJECT, WIRE_FORMAT_ARRAY)
+
+
+def _convert_datetime(value):
+    # 与DjangoJSONEncoder的输出保持一致
+    r = value.isoformat()
+    if value.microsecond:
+        r = r[:23] + r[26:]
+    if r.endswith('+00:00'):
+        r = r[:-6] + 'Z'
+    return r
+
+
+def _convert_time(value):
+    r = value.isoformat()
+    if value.microsecond:
+        r = r[:12]
+    return r
+
+
+def _convert_date(value):
+    return value.isoformat()
+
+
+def _convert_duration(value):
+    return duration_iso_string(value)
+
+
+_FIELD_CONVERTERS = (
+    (models.DateTimeField, _convert_datetime),
+    (models.DateField, _convert_date),
+    (models.TimeField, _convert_time),
+    (models.DurationField, _convert_duration),
+    (models.DecimalField, str),
+    (models.UUIDField, str),
+)
+
+
+def get_value_converter(field):
+    """
+    : 根据field类型获取将数据库中的值转换为JSON值的函数
+    :return: callable或者None(不需要转换)
+    """
+    if field is None:
+        return None
+    if field.is_relation:
+        field = getattr(field, 'target_field', field)
+    for field_class, converter in _FIELD_CONVERTERS:
+        if isinstance(field, field_class):
+            return converter
+    return None
+
+
+class RowSerializer:
+    """
+    : 将values_list()的结果转换为DataTables所需的数据
+    : wire_format为'object'时每行为dict，为'array'时每行为list(与query fields的顺序一致)
+    : keys为object格式中各field所对应的key，默认为field name
+    : slots, width: array格式中各field在每行中的位置以及每行的长度，其余位置为None，
+    : 用于省略了部分field(例如前端隐藏的列)时保持各列的序号不变
+    """
+    def __init__(self, fields, converters, wire_format=WIRE_FORMAT_OBJECT, keys=None, slots=None, width=None):
+        self.fields = tuple(fields)
+        self.keys = tuple(keys) if keys is not None else self.fields
+        self.wire_format = wire_format
+        self.slots = tuple(slots) if slots is not None else None
+        self.width = width
+        self.converters = tuple(
+            (index, converters[name]) for index, name in enumerate(self.fields) if converters.get(name) is not None
+        )
+
+    def convert_row(self, row):
+        if not self.converters:
+            return row
+        row = list(row)
+        for index, converter in self.converters:
+            value = row[index]
+            if value is not None:
+                row[index] = converter(value)
+        return row
+
+    def place_row(self, row):
+        placed = [None] * self.width
+        for slot, value in zip(self.slots, row):
+            placed[slot] = value
+        return placed
+
+    def serialize(self, rows):
+        """
+        :param rows: values_list()的结果，或者由tuple组成的iterable
+        :return: list
+        """
+        convert_row = self.convert_row
+        if self.wire_format == WIRE_FORMAT_ARRAY:
+            if self.slots is None:
+                return [list(convert_row(row)) for row in rows]
+            return [self.place_row(convert_row(row)) for row in rows]
+        keys = self.keys
+        return [dict(zip(keys, convert_row(row))) for row in rows]
+
+
+# orjson无法处理的类型(Decimal, lazy str等)交由DjangoJSONEncoder处理
+_json_default = DjangoJSONEncoder().default
+
+
+def json_dumps(value):
+    """
+    : 默认的JSON编码，与JsonResponse的输出一致
+    :return: str
+    """
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def fast_json_dumps(value):
+    """
+    : 安装了orjson时使用orjson编码，否则使用json_dumps
+    : 可以设置为ModelDataTable的Meta.json_dumps
+    :return: str
+    """
+    if orjson is None:
+        return json_dumps(value)
+    return orjson.dumps(value, default=_json_default).decode('utf-8')
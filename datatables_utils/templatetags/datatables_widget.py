@@ -3,25 +3,138 @@
 from django.template import Library
 from django.utils.safestring import mark_safe
 from django.core.serializers.json import DjangoJSONEncoder
+from django.middleware.csrf import get_token
 import json
 
+from ..serializers import WIRE_FORMAT_ARRAY
+from ..utils import AGGREGATE_FUNCTIONS
+
 register = Library()
 
 
-@register.inclusion_tag('dt_templates/dt_tabel.html')
-def render_table(dt_config, class_=None):
+def _get_initial_page(context, dt_config):
+    """
+    : 通过context中的view生成第一页的数据，
+    : view不是使用该dt_config的DataTablesMixin，或者生成失败时返回None
+    """
+    view = context.get('view')
+    if view is None or not hasattr(view, 'get_initial_page'):
+        return None
+    # template中的dt_config变量被解析时，ModelDataTable类会被调用而生成实例
+    table_class = dt_config if isinstance(dt_config, type) else type(dt_config)
+    if view.get_dt_config() is not table_class:
+        return None
+    page = view.get_initial_page()
+    if 'error' in page:
+        return None
+    return page
+
+
+def _get_table_rows(dt_config, data):
+    """
+    : 将JSON数据转换为tbody中各行的(row_id, cells)
+    """
+    output_fields = dt_config.get_output_fields()
+    column_names = [c.name for c in dt_config.columns.values()]
+    if dt_config.wire_format == WIRE_FORMAT_ARRAY:
+        cell_keys = [output_fields.index(name) for name in column_names]
+        row_id_key = len(column_names) - len(dt_config.get_computed_columns())
+    else:
+        cell_keys = column_names
+        row_id_key = dt_config.pk_column.name if dt_config.pk_column is not None else None
+    return [
+        (row[row_id_key] if row_id_key is not None else None, [row[key] for key in cell_keys])
+        for row in data
+    ]
+
+
+AGGREGATE_LABELS = {'sum': '合计', 'avg': '平均', 'min': '最小', 'max': '最大'}
+
+
+def _get_footer_rows(dt_config, aggregates=None):
+    """
+    : 生成tfoot中各行的(聚合函数名, cells)，每个聚合函数一行
+    : cells为(列名, 值)，不进行聚合的列的列名为None，第一列为空时显示聚合函数的名称
+    """
+    columns = list(dt_config.columns.values())
+    aggregates = aggregates or {}
+    rows = []
+    for function in AGGREGATE_FUNCTIONS:
+        if not any(function in column.aggregates for column in columns):
+            continue
+        cells = []
+        for index, column in enumerate(columns):
+            if function in column.aggregates:
+                cells.append((column.name, aggregates.get(column.name, {}).get(function)))
+            else:
+                cells.append((None, AGGREGATE_LABELS[function] if index == 0 else None))
+        rows.append((function, cells))
+    return rows
+
+
+@register.inclusion_tag('dt_templates/dt_tabel.html', takes_context=True)
+def render_table(context, dt_config, class_=None, defer_loading=False):
+    """
+    : defer_loading为True时(仅serverSide)，在tbody中渲染第一页的数据，
+    : 需要与render_js_script的defer_loading一起使用
+    : 设置了列的aggregates时(仅serverSide)，渲染tfoot，其中的值由ajax响应中的aggregates更新
+    """
     titles = dt_config.get_titles()
-    return {'dt_config': dt_config, 'titles': titles, 'class': class_}
+    rows = None
+    aggregates = None
+    if defer_loading and dt_config.dt_serverSide:
+        page = _get_initial_page(context, dt_config)
+        if page is not None:
+            rows = _get_table_rows(dt_config, page['data'])
+            aggregates = page.get('aggregates')
+    footer = _get_footer_rows(dt_config, aggregates) if dt_config.dt_serverSide else []
+    return {'dt_config': dt_config, 'titles': titles, 'class': class_, 'rows': rows, 'footer': footer}
+
+
+@register.inclusion_tag('dt_templates/dt_jsscript.html', takes_context=True)
+def render_js_script(context, dt_config, defer_loading=False, batch_url=None):
+    """
+    : defer_loading为True时，第一页的数据在渲染HTML时生成，DataTables初始化时不再发出ajax请求:
+    : serverSide时设置deferLoading(数据由render_table渲染在tbody中)，
+    : 否则直接将全部数据设置为data
+    : 设置了Meta.delta_refresh时，提供dt_inst.deltaReload()进行增量刷新
+    : 设置了batch_url(DataTablesBatchView的url)时，同一时刻各table的ajax请求被合并为一个请求
+    """
+    config = dt_config.get_dt_config()
+    initial_cursor = None
+    initial_version = None
+    page = _get_initial_page(context, dt_config) if defer_loading else None
+    if page is not None:
+        if dt_config.dt_serverSide:
+            config['deferLoading'] = [page['recordsFiltered'], page['recordsTotal']]
+            initial_cursor = page.get('cursor')
+            initial_version = page.get('version')
+        else:
+            config['data'] = page['data']
+            config.pop('ajax', None)
+    request = context.get('request')
+    return {
+        'dt_config': dt_config,
+        'config': config,
+        'has_aggregates': dt_config.dt_serverSide and any(c.aggregates for c in dt_config.columns.values()),
+        'initial_cursor': initial_cursor,
+        'initial_version': initial_version,
+        'batch_url': batch_url,
+        'csrf_token': get_token(request) if batch_url and request is not None else None,
+    }
 
 
-@register.inclusion_tag('dt_templates/dt_jsscript.html')
-def render_js_script(dt_config):
-    return {'dt_config': dt_config}
+# 避免数据中的"</script>"等内容破坏<script>标签
+_json_script_escapes = {
+    ord('<'): '\\u003C',
+    ord('>'): '\\u003E',
+    ord('&'): '\\u0026',
+}
 
 
 @register.filter(name='json')
 def json_filter(value):
-    return mark_safe(json.dumps(value, cls=DjangoJSONEncoder))
+    return mark_safe(json.dumps(value, cls=DjangoJSONEncoder).translate(_json_script_escapes))
 
 
 @register.simple_tag(takes_context=True)
@@ -1,10 +1,29 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+import threading
 from collections import OrderedDict
-from django.core.exceptions import ImproperlyConfigured, FieldDoesNotExist
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, FieldDoesNotExist, ValidationError
+from django.db import models
 from django.db.models.base import ModelBase
 from django.db.models.fields import Field
-from django.db.models import Q
+from django.db.models import Avg, Case, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Concat, Length, Substr
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .cache import ConditionalGet, DeltaRefresh, ResponseCache
+from .counts import CountStrategy, ExactCount
+from .guard import CostGuard
+from .query import DEFAULT_MAX_PAGE_LENGTH, TablePlan
+from .registry import registry
+from .routing import ReadRouting
+from .search import ColumnSearchBackend, SearchBackend
+from .serializers import (
+    WIRE_FORMAT_ARRAY, WIRE_FORMAT_OBJECT, WIRE_FORMATS, RowSerializer, get_value_converter, json_dumps,
+)
 
 
 def _get_field(model, field_name):
@@ -24,12 +43,77 @@ def _get_field(model, field_name):
         return field
 
 
+# 设置了max_length的列，被截断的值以此结尾
+TRUNCATION_MARKER = '\u2026'
+
+# 列的footer所支持的聚合函数
+AGGREGATE_FUNCTIONS = OrderedDict([('sum', Sum), ('avg', Avg), ('min', Min), ('max', Max)])
+_SUMMABLE_FIELD_TYPES = (models.IntegerField, models.FloatField, models.DecimalField, models.DurationField)
+
+SEARCH_TYPE_TEXT = 'text'
+SEARCH_TYPE_RANGE = 'range'
+SEARCH_TYPE_DATETIME = 'datetime'
+SEARCH_TYPE_EXACT = 'exact'
+
+_RANGE_FIELD_TYPES = (
+    models.AutoField, models.IntegerField, models.FloatField, models.DecimalField,
+    models.DateField, models.TimeField, models.DurationField,
+)
+_EXACT_FIELD_TYPES = (models.BooleanField, models.UUIDField)
+
+
+def _get_search_type(field):
+    """
+    : 根据field类型确定搜索方式
+    :return: SEARCH_TYPE_*
+    """
+    if field.is_relation:
+        field = getattr(field, 'target_field', field)
+    if isinstance(field, models.DateTimeField):
+        return SEARCH_TYPE_DATETIME
+    if isinstance(field, _RANGE_FIELD_TYPES):
+        return SEARCH_TYPE_RANGE
+    if isinstance(field, _EXACT_FIELD_TYPES):
+        return SEARCH_TYPE_EXACT
+    return SEARCH_TYPE_TEXT
+
+
+def _get_display_field(model, field, column):
+    """
+    : 获取ForeignKey, OneToOne列的display_field所对应的关联model的field
+    """
+    if not (field.many_to_one or field.one_to_one):
+        raise ImproperlyConfigured('display_field can only be used on ForeignKey or OneToOne columns: {}'
+                                   .format(column.name))
+    try:
+        display_field = _get_field(model, column.query_name)
+    except FieldDoesNotExist:
+        display_field = None
+    if display_field is None:
+        raise ImproperlyConfigured('No field was found matching display_field: {}'.format(column.query_name))
+    return display_field
+
+
 class DataTablesColumn:
-    def __init__(self, title=None, searchable=True, orderable=True, field=None):
+    # 计算列的值不来自数据库中的field
+    computed = False
+
+    def __init__(self, title=None, searchable=True, orderable=True, width=None, field=None, display_field=None,
+                 max_length=None, aggregates=(), prefix_search=False):
         self.title = title
         self.searchable = searchable
         self.orderable = orderable
         self.width = width
+        # ForeignKey, OneToOne列所显示(以及搜索、排序)的关联model的field
+        self.display_field = display_field
+        # 文本列在数据库中截断后返回的最大长度，搜索以及排序仍然使用完整的值
+        self.max_length = max_length
+        # 对搜索过滤后的全部数据进行的聚合(AGGREGATE_FUNCTIONS)，显示在footer中
+        self.aggregates = tuple(aggregates)
+        # 文本列使用istartswith进行前缀搜索，而不是icontains
+        # 普通的B-tree索引不能用于istartswith，需要建立对应的表达式索引(参见README)
+        self.prefix_search = prefix_search
+        self._lookups = None
         if field is not None:
             self._initialize_from_field(field)
         else:
@@ -52,8 +136,60 @@ class DataTablesColumn:
         self._bound = True
         if field.is_relation:
             # 如果指定的field为ForeignKey, OneToOne等relationship
-            # 则该列强制为不能搜索
+            # 则该列强制为不能搜索，可以通过display_field指定搜索所用的关联model的field
             self.searchable = False
+        self._search_type = _get_search_type(field)
+
+    @property
+    def query_name(self):
+        """
+        : 查询时所使用的field路径，设置了display_field时为关联model的field
+        """
+        if self.display_field is None:
+            return self.name
+        return '{}__{}'.format(self.name, self.display_field)
+
+    @property
+    def select_name(self):
+        """
+        : values_list()中所使用的名字，设置了max_length时为截断后的值的annotation
+        """
+        if self.max_length is None:
+            return self.query_name
+        return 'dt_preview_{}'.format(self.name.replace('__', '_'))
+
+    def get_aggregate_expressions(self):
+        """
+        :return: list of tuple(聚合函数名, Expression)
+        """
+        field = self._field.target_field if self._field.is_relation else self._field
+        expressions = []
+        for function in self.aggregates:
+            if function not in AGGREGATE_FUNCTIONS:
+                raise ImproperlyConfigured('Unknown aggregate function {} for column {}, should be one of {}'
+                                           .format(function, self.name, ', '.join(AGGREGATE_FUNCTIONS)))
+            if function in ('sum', 'avg') and not isinstance(field, _SUMMABLE_FIELD_TYPES):
+                raise ImproperlyConfigured('{} can only be used on numeric columns: {}'.format(function, self.name))
+            expressions.append((function, AGGREGATE_FUNCTIONS[function](self.query_name)))
+        return expressions
+
+    def get_select_expression(self):
+        """
+        : 设置了max_length时，在数据库中截断文本，超过max_length的值以TRUNCATION_MARKER结尾
+        :return: django.db.models.Expression
+        """
+        field = self._field.target_field if self._field.is_relation else self._field
+        if not isinstance(field, (models.CharField, models.TextField)):
+            raise ImproperlyConfigured('max_length can only be used on text columns: {}'.format(self.name))
+        query_name = self.query_name
+        return Case(
+            When(
+                GreaterThan(Length(query_name), self.max_length),
+                then=Concat(Substr(query_name, 1, self.max_length), Value(TRUNCATION_MARKER)),
+            ),
+            default=F(query_name),
+            output_field=models.TextField(),
+        )
 
     def get_dt_column_config(self):
         dt__column_config = {}
@@ -64,19 +200,99 @@ class DataTablesColumn:
             dt__column_config.update(width=self.width)
         return dt__column_config
 
-    def get_filter_q_object(self, pattern, is_regex):
+    def get_filter_q_object(self, pattern, is_regex, prefix=False):
         """
         : 产生filter用的Q对象，在DataTabelsMixin中处理请求中filter相关功能时使用
+        : 根据列所对应的field类型选择lookup:
+        : 文本列使用icontains(设置了prefix_search时使用istartswith)，
+        : 数字、日期列使用exact，或者通过"min..max"的形式使用range
         :param pattern: 
         :param is_regex: 
-        :return: django.db.models.Q对象
+        :param prefix: 为True时文本列使用istartswith，由CostGuard设置
+        :return: django.db.models.Q对象，该列不能搜索，或者pattern不适用于该列(例如在数字列中搜索文字)时返回空的Q()
         """
         if not self.searchable:
             # 不能返回None, Q对象不能跟None进行OR操作
             return Q()
-        lookup_str = '__iregex' if is_regex else '__icontains'
-        lookup_str = self.name + lookup_str
-        return Q(**{lookup_str: pattern})
+        lookups = self._lookups if self._lookups is not None else self._compile_lookups()
+        search_type = self._search_type if self._bound else SEARCH_TYPE_TEXT
+        if search_type == SEARCH_TYPE_TEXT:
+            if is_regex:
+                return Q(**{lookups['regex']: pattern})
+            return Q(**{lookups['prefix' if prefix else 'search']: pattern})
+        if is_regex:
+            return Q()
+
+        pattern = pattern.strip()
+        if search_type != SEARCH_TYPE_EXACT and '..' in pattern:
+            lower, upper = [self._to_search_bounds(value) for value in pattern.split('..', 1)]
+            if lower is None and upper is None:
+                return Q()
+            q_kwargs = {}
+            if lower is not None:
+                q_kwargs[lookups['gte']] = lower[0]
+            if upper is not None:
+                upper_value, upper_end = upper
+                if upper_end is None:
+                    q_kwargs[lookups['lte']] = upper_value
+                else:
+                    q_kwargs[lookups['lt']] = upper_end
+            return Q(**q_kwargs)
+
+        bounds = self._to_search_bounds(pattern)
+        if bounds is None:
+            return Q()
+        lower, upper = bounds
+        if upper is None:
+            return Q(**{lookups['exact']: lower})
+        # 只指定了日期的datetime列，转换为当天的范围，而不是使用__date对数据库中的值进行转换
+        return Q(**{lookups['gte']: lower, lookups['lt']: upper})
+
+    def _compile_lookups(self):
+        """
+        : 预先生成该列搜索所用的lookup字符串，在ModelDataTable生成请求处理计划时调用
+        :return: dict
+        """
+        query_name = self.query_name
+        self._lookups = {
+            'search': query_name + ('__istartswith' if self.prefix_search else '__icontains'),
+            'regex': query_name + '__iregex',
+            'prefix': query_name + '__istartswith',
+            'exact': query_name,
+            'gte': query_name + '__gte',
+            'lte': query_name + '__lte',
+            'lt': query_name + '__lt',
+        }
+        return self._lookups
+
+    def _to_search_bounds(self, value):
+        """
+        : 将搜索内容转换为field对应的python值
+        :return: tuple(lower, upper)，upper不为None时表示[lower, upper)的范围；
+        : value为空或者无法转换时返回None
+        """
+        value = value.strip()
+        if not value:
+            return None
+        field = self._field.target_field if self._field.is_relation else self._field
+        if self._search_type == SEARCH_TYPE_DATETIME and 'T' not in value.upper() and ':' not in value:
+            day = parse_date(value)
+            if day is None:
+                return None
+            lower = datetime.datetime.combine(day, datetime.time())
+            upper = lower + datetime.timedelta(days=1)
+            if settings.USE_TZ:
+                lower, upper = timezone.make_aware(lower), timezone.make_aware(upper)
+            return lower, upper
+        try:
+            value = field.to_python(value)
+        except (ValidationError, ValueError, TypeError):
+            return None
+        if value is None:
+            return None
+        if self._search_type == SEARCH_TYPE_DATETIME and settings.USE_TZ and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value, None
 
     @classmethod
     def get_instance_from_field(cls, field):
@@ -84,6 +300,60 @@ class DataTablesColumn:
         return dt_column
 
 
+class ComputedColumn(DataTablesColumn):
+    """
+    : 计算列，值由resolver批量计算，不能搜索及排序
+    : resolver接收当前页所有行的dt_rowId值组成的list，返回{dt_rowId值: 列的值}的dict，
+    : 每页只调用一次，应该通过一次批量查询完成计算，而不是每行进行一次查询
+    """
+    computed = True
+
+    def __init__(self, resolver, title=None, width=None):
+        if not callable(resolver):
+            raise ValueError('resolver of ComputedColumn should be a callable')
+        super().__init__(title=title, searchable=False, orderable=False, width=width)
+        self.resolver = resolver
+
+    @property
+    def query_name(self):
+        return None
+
+    def _compile_lookups(self):
+        self._lookups = {}
+        return self._lookups
+
+    def resolve(self, pks):
+        """
+        :param pks: 当前页所有行的dt_rowId值
+        :return: dict
+        """
+        return self.resolver(pks)
+
+
+# 第一次访问时才生成的类属性，生成时需要解析各列所对应的field
+LAZY_ATTRIBUTES = ('_declared_columns', '_meta_defined_columns', 'columns', 'pk_column', 'plan')
+
+_bind_lock = threading.RLock()
+
+# 每个table类最多缓存的RowSerializer数量：隐藏列的组合由客户端决定，最多有2^n种
+ROW_SERIALIZER_CACHE_SIZE = 32
+
+_row_serializers_lock = threading.Lock()
+
+
+class _LazyBinding:
+    """
+    : LAZY_ATTRIBUTES的描述符，第一次访问时调用bind_fields()，
+    : 之后类属性被替换为实际的值，不再经过描述符
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        owner.bind_fields()
+        return owner.__dict__[self.name]
+
+
 class ModelDataTableMetaClass(type):
     def __new__(mcls, name, bases, attrs):
         if not bases:
@@ -99,51 +369,17 @@ class ModelDataTableMetaClass(type):
         if not isinstance(model, ModelBase):
             raise ImproperlyConfigured('The model specified in Meta is not a models.Model instance.')
 
-        # 处理声明式定义的columns
+        # 声明式定义的columns，对应的field在bind_fields()中解析
         d = dict(attrs)
-        declared_columns = []
-        for name, value in attrs.items():
+        pending_columns = []
+        for column_name, value in attrs.items():
             if isinstance(value, DataTablesColumn):
-                field = _get_field(model, name)
-                if field is None:
-                    continue
-                value.name = name
-                value.field = field
-                declared_columns.append((name, value))
-                d.pop(name)
-        d['_declared_columns'] = OrderedDict(declared_columns)
-
-        # 处理从Meta class属性中读取fields-columns的信息
-        # todo: 实现从Fields中读取更多的配置信息，这里之实现了读取field_name
-        meta_defined_columns = []
-        field_names = getattr(meta, 'fields', [])
-        titles = getattr(meta, 'titles', {})
-        for field_name in field_names:
-            field = _get_field(model, field_name)
-            if field is None:
-                continue
-            dt_column = DataTablesColumn.get_instance_from_field(field)
-            dt_column.name = field_name
-            if titles.get(field_name):
-                dt_column.title = titles.get(field_name)
-            meta_defined_columns.append((field_name, dt_column))
-        d['_meta_defined_columns'] = OrderedDict(meta_defined_columns)
-
-        # 处理两种columns源的order，并生成最终的columns属性
-        column_order = getattr(meta, 'column_order', None)
-        if column_order is None:
-            columns = OrderedDict(declared_columns)
-            for name, column in d['_meta_defined_columns'].items():
-                if name not in columns:
-                    columns[name] = column
-        else:
-            columns = OrderedDict()
-            for name in column_order:
-                if name in d['_declared_columns']:
-                    columns[name] = d['_declared_columns'][name]
-                elif name in d['_meta_defined_columns']:
-                    columns[name] = d['_meta_defined_columns'][name]
-        d['columns'] = columns
+                pending_columns.append((column_name, value))
+                d.pop(column_name)
+        d['_pending_columns'] = pending_columns
+        for attr_name in LAZY_ATTRIBUTES:
+            d[attr_name] = _LazyBinding(attr_name)
+        d['_fields_bound'] = False
 
         # 处理js配置属性，dt_开头的类属性
         js_config = {}
@@ -151,19 +387,8 @@ class ModelDataTableMetaClass(type):
             if fname.startswith('dt_'):
                 attr_name = fname.split('dt_', 1)[1]
                 js_config[attr_name] = value
-                if attr_name == 'rowId' and value is not None:
-                    if not isinstance(value, str):
-                        raise ImproperlyConfigured('dt_rowId should be configured as a str')
-                    # 处理dt_rowId,自动生成pk_column
-                    if value == 'pk':
-                        pk_field = _get_field(model, 'id')
-                    else:
-                        pk_field = _get_field(model, value)
-                    if pk_field is None:
-                        raise ImproperlyConfigured('No field was found matching dt_rowId: {}'.format(value))
-                    pk_column = DataTablesColumn.get_instance_from_field(pk_field)
-                    pk_column.name = value
-                    d['pk_column'] = pk_column
+                if attr_name == 'rowId' and value is not None and not isinstance(value, str):
+                    raise ImproperlyConfigured('dt_rowId should be configured as a str')
         d['js_config'] = js_config
 
         # 处理detail_url相关
@@ -176,16 +401,208 @@ class ModelDataTableMetaClass(type):
             d['handle_row_click'] = True
             d['detail_url_format'] = detail_url_format
 
-        # 生成table_id
-        d['table_id'] = 'dt-{}'.format(model._meta.model_name)
+        # 处理Meta.keyset_pagination
+        # 开启后，连续翻页时根据上一页最后一行的排序值进行seek，而不是OFFSET
+        d['keyset_pagination'] = bool(getattr(meta, 'keyset_pagination', False))
 
-        # 处理Meta.width
-        width = getattr(meta, 'width', {})
-        for name, w in width.items():
-            if name in d['columns']:
-                d['columns'][name].width = w
+        # 处理Meta.count_strategy
+        count_strategy = getattr(meta, 'count_strategy', None)
+        if count_strategy is None:
+            count_strategy = ExactCount()
+        elif not isinstance(count_strategy, CountStrategy):
+            raise ImproperlyConfigured('Meta.count_strategy should be a CountStrategy instance')
+        d['count_strategy'] = count_strategy
 
-        return super().__new__(mcls, name, bases, d)
+        # 处理Meta.search_backend
+        search_backend = getattr(meta, 'search_backend', None)
+        if search_backend is None:
+            search_backend = ColumnSearchBackend()
+        elif not isinstance(search_backend, SearchBackend):
+            raise ImproperlyConfigured('Meta.search_backend should be a SearchBackend instance')
+        d['search_backend'] = search_backend
+
+        # 处理Meta.response_cache
+        response_cache = getattr(meta, 'response_cache', None)
+        if response_cache is not None and not isinstance(response_cache, ResponseCache):
+            raise ImproperlyConfigured('Meta.response_cache should be a ResponseCache instance')
+        d['response_cache'] = response_cache
+
+        # 处理Meta.conditional_get
+        conditional_get = getattr(meta, 'conditional_get', None)
+        if conditional_get is not None and not isinstance(conditional_get, ConditionalGet):
+            raise ImproperlyConfigured('Meta.conditional_get should be a ConditionalGet instance')
+        d['conditional_get'] = conditional_get
+
+        # 处理Meta.cost_guard
+        cost_guard = getattr(meta, 'cost_guard', None)
+        if cost_guard is not None and not isinstance(cost_guard, CostGuard):
+            raise ImproperlyConfigured('Meta.cost_guard should be a CostGuard instance')
+        d['cost_guard'] = cost_guard
+
+        # 处理Meta.read_routing
+        read_routing = getattr(meta, 'read_routing', None)
+        if read_routing is not None and not isinstance(read_routing, ReadRouting):
+            raise ImproperlyConfigured('Meta.read_routing should be a ReadRouting instance')
+        d['read_routing'] = read_routing
+
+        # 处理Meta.delta_refresh
+        delta_refresh = getattr(meta, 'delta_refresh', None)
+        if delta_refresh is not None and not isinstance(delta_refresh, DeltaRefresh):
+            raise ImproperlyConfigured('Meta.delta_refresh should be a DeltaRefresh instance')
+        d['delta_refresh'] = delta_refresh
+
+        # 处理Meta.wire_format以及Meta.json_dumps
+        wire_format = getattr(meta, 'wire_format', WIRE_FORMAT_OBJECT)
+        if wire_format not in WIRE_FORMATS:
+            raise ImproperlyConfigured('Meta.wire_format should be one of {}'.format(', '.join(WIRE_FORMATS)))
+        d['wire_format'] = wire_format
+        dumps = getattr(meta, 'json_dumps', None)
+        if dumps is not None and not callable(dumps):
+            raise ImproperlyConfigured('Meta.json_dumps should be a callable')
+        d['json_dumps'] = staticmethod(dumps) if dumps is not None else None
+        d['_row_serializers'] = OrderedDict()
+
+        # 生成table_id，可以通过Meta.table_id指定
+        table_id = getattr(meta, 'table_id', None)
+        # 只有显式指定的table_id冲突时才由system check报告
+        d['table_id_declared'] = table_id is not None
+        if table_id is None:
+            table_id = 'dt-{}'.format(model._meta.model_name)
+        elif not isinstance(table_id, str):
+            raise ImproperlyConfigured('Meta.table_id should be a str')
+        d['table_id'] = table_id
+
+        cls = super().__new__(mcls, name, bases, d)
+        if cls.response_cache is not None:
+            cls.response_cache.bind(cls)
+        if cls.conditional_get is not None:
+            cls.conditional_get.bind(cls)
+        if cls.read_routing is not None:
+            cls.read_routing.bind(cls)
+        if cls.delta_refresh is not None:
+            cls.delta_refresh.bind(cls)
+        if search_backend.eager_bind:
+            # 需要在migrate之前注册signal的backend，立即解析field
+            cls.bind_fields()
+        registry.register(cls)
+        return cls
+
+    def bind_fields(cls):
+        """
+        : 解析各列所对应的field，生成columns, pk_column以及plan等LAZY_ATTRIBUTES
+        : 在第一次访问这些属性时自动调用，每个类只执行一次
+        """
+        with _bind_lock:
+            if cls.__dict__.get('_fields_bound', True):
+                return
+            meta = cls.Meta
+            model = meta.model
+
+            # 处理声明式定义的columns
+            declared_columns = []
+            for column_name, value in cls._pending_columns:
+                if isinstance(value, ComputedColumn):
+                    value.name = column_name
+                    if value.title is None:
+                        value.title = column_name
+                    declared_columns.append((column_name, value))
+                    continue
+                field = _get_field(model, column_name)
+                if field is None:
+                    continue
+                value.name = column_name
+                if value.display_field is not None:
+                    field = _get_display_field(model, field, value)
+                value.field = field
+                declared_columns.append((column_name, value))
+            declared_columns = OrderedDict(declared_columns)
+
+            # 处理从Meta class属性中读取fields-columns的信息
+            # todo: 实现从Fields中读取更多的配置信息，这里之实现了读取field_name
+            meta_defined_columns = []
+            field_names = getattr(meta, 'fields', [])
+            titles = getattr(meta, 'titles', {})
+            display_fields = getattr(meta, 'display_fields', {})
+            for field_name in field_names:
+                field = _get_field(model, field_name)
+                if field is None:
+                    continue
+                if field_name in display_fields:
+                    dt_column = DataTablesColumn(title=field.verbose_name, display_field=display_fields[field_name])
+                    dt_column.name = field_name
+                    dt_column.field = _get_display_field(model, field, dt_column)
+                else:
+                    dt_column = DataTablesColumn.get_instance_from_field(field)
+                dt_column.name = field_name
+                if titles.get(field_name):
+                    dt_column.title = titles.get(field_name)
+                meta_defined_columns.append((field_name, dt_column))
+            meta_defined_columns = OrderedDict(meta_defined_columns)
+
+            # 处理两种columns源的order，并生成最终的columns属性
+            column_order = getattr(meta, 'column_order', None)
+            if column_order is None:
+                columns = OrderedDict(declared_columns)
+                for column_name, column in meta_defined_columns.items():
+                    if column_name not in columns:
+                        columns[column_name] = column
+            else:
+                columns = OrderedDict()
+                for column_name in column_order:
+                    if column_name in declared_columns:
+                        columns[column_name] = declared_columns[column_name]
+                    elif column_name in meta_defined_columns:
+                        columns[column_name] = meta_defined_columns[column_name]
+
+            # 处理dt_rowId,自动生成pk_column
+            pk_column = None
+            row_id = cls.js_config.get('rowId')
+            if row_id is not None:
+                if row_id == 'pk':
+                    pk_field = _get_field(model, 'id')
+                else:
+                    pk_field = _get_field(model, row_id)
+                if pk_field is None:
+                    raise ImproperlyConfigured('No field was found matching dt_rowId: {}'.format(row_id))
+                pk_column = DataTablesColumn.get_instance_from_field(pk_field)
+                pk_column.name = row_id
+
+            # 处理Meta.width
+            width = getattr(meta, 'width', {})
+            for column_name, w in width.items():
+                if column_name in columns:
+                    columns[column_name].width = w
+
+            # 处理Meta.max_lengths
+            max_lengths = getattr(meta, 'max_lengths', {})
+            for column_name, max_length in max_lengths.items():
+                if column_name in columns:
+                    columns[column_name].max_length = max_length
+
+            # 处理Meta.aggregates
+            aggregates = getattr(meta, 'aggregates', {})
+            for column_name, functions in aggregates.items():
+                if column_name in columns:
+                    columns[column_name].aggregates = tuple(functions)
+            for column in columns.values():
+                if column.computed:
+                    if column.aggregates:
+                        raise ImproperlyConfigured('Computed column {} can not be aggregated'.format(column.name))
+                    continue
+                if column.max_length is not None:
+                    column.get_select_expression()
+                column.get_aggregate_expressions()
+
+            cls._declared_columns = declared_columns
+            cls._meta_defined_columns = meta_defined_columns
+            cls.columns = columns
+            cls.pk_column = pk_column
+            # 生成请求处理计划
+            cls.plan = TablePlan.from_table(
+                cls, max_page_length=getattr(meta, 'max_page_length', DEFAULT_MAX_PAGE_LENGTH)
+            )
+            cls._fields_bound = True
+            cls.search_backend.bind(cls)
 
     @classmethod
     def __prepare__(mcls, name, bases):
@@ -216,16 +633,167 @@ class ModelDataTable(metaclass=ModelDataTableMetaClass):
     dt_buttons = None
 
     @classmethod
-    def get_query_fields(cls):
+    def get_query_fields(cls, hidden=(), preview=True):
         """
         : 指定json数据中包含的fields，用于对请求的处理函数中
+        :param hidden: 前端隐藏的列名，这些列不进行查询
+        :param preview: 为True时设置了max_length的列使用截断后的值(参见get_select_expressions())
         :return: list，json数据中应该包含的fields
         """
-        query_fields = [c.name for c in cls.columns.values()]
+        # 设置了display_field的列查询关联model的field，values_list()只join所需的表
+        # 计算列不参与查询
+        query_fields = [
+            c.select_name if preview else c.query_name
+            for c in cls.columns.values() if not c.computed and c.name not in hidden
+        ]
         # 加入pk_column对应的名字
-        query_fields.append(cls.pk_column.name)
+        query_fields.append(cls.pk_column.query_name)
         return query_fields
 
+    @classmethod
+    def get_select_expressions(cls, query_fields):
+        """
+        : query_fields中截断后的值所需的annotation
+        :return: dict, select_name -> Expression
+        """
+        return {
+            c.select_name: c.get_select_expression() for c in cls.columns.values()
+            if not c.computed and c.max_length is not None and c.select_name in query_fields
+        }
+
+    @classmethod
+    def get_aggregate_expressions(cls, hidden=()):
+        """
+        : 各列footer所需的聚合，由CountStrategy与recordsFiltered在同一条查询中计算
+        :param hidden: 前端隐藏的列名，这些列不进行聚合
+        :return: dict, alias -> Expression
+        """
+        expressions = OrderedDict()
+        for index, column in enumerate(cls.columns.values()):
+            if column.aggregates and column.name not in hidden:
+                for function, expression in column.get_aggregate_expressions():
+                    expressions['dt_{}_{}'.format(function, index)] = expression
+        return expressions
+
+    @classmethod
+    def get_aggregate_values(cls, values):
+        """
+        : 将聚合查询的结果转换为JSON数据
+        :param values: dict, alias -> 聚合值
+        :return: dict, 列名 -> {聚合函数名: 值}
+        """
+        aggregates = OrderedDict()
+        for index, column in enumerate(cls.columns.values()):
+            converter = None if column.computed else get_value_converter(column._field)
+            for function in column.aggregates:
+                alias = 'dt_{}_{}'.format(function, index)
+                if alias not in values:
+                    continue
+                value = values[alias]
+                if value is not None and converter is not None:
+                    value = converter(value)
+                aggregates.setdefault(column.name, OrderedDict())[function] = value
+        return aggregates
+
+    @classmethod
+    def get_computed_columns(cls):
+        return [c for c in cls.columns.values() if c.computed]
+
+    @classmethod
+    def get_output_fields(cls):
+        """
+        : json数据中每行所包含的key，array格式时即为每行数据的顺序:
+        : 非计算列，pk_column，计算列
+        :return: list
+        """
+        output_fields = [c.name for c in cls.columns.values() if not c.computed]
+        output_fields.append(cls.pk_column.name)
+        output_fields.extend(c.name for c in cls.get_computed_columns())
+        return output_fields
+
+    @classmethod
+    def get_row_serializer(cls, query_fields, wire_format=None):
+        """
+        : 获取将values_list(*query_fields)的结果转换为JSON数据的RowSerializer
+        : 按最近使用的顺序缓存ROW_SERIALIZER_CACHE_SIZE组query_fields
+        :param wire_format: 默认为Meta.wire_format
+        :return: RowSerializer
+        """
+        query_fields = tuple(query_fields)
+        wire_format = wire_format or cls.wire_format
+        key = (query_fields, wire_format)
+        with _row_serializers_lock:
+            serializer = cls._row_serializers.get(key)
+            if serializer is not None:
+                cls._row_serializers.move_to_end(key)
+        if serializer is None:
+            columns = [c for c in cls.columns.values() if not c.computed]
+            columns.append(cls.pk_column)
+            converters = {c.query_name: get_value_converter(getattr(c, '_field', None)) for c in columns}
+            names = {c.query_name: c.name for c in columns}
+            # 截断后的值为文本，不需要转换
+            names.update((c.select_name, c.name) for c in columns)
+            slots = width = None
+            base_fields = tuple(c.select_name for c in columns)
+            if (wire_format == WIRE_FORMAT_ARRAY and query_fields != base_fields
+                    and query_fields[-1:] == base_fields[-1:]):
+                # 省略了隐藏列的query_fields，各列仍然位于get_output_fields()中的位置，pk_column总是在最后
+                slots = [base_fields.index(f) for f in query_fields[:-1]] + [len(base_fields) - 1]
+                width = len(base_fields)
+            serializer = RowSerializer(
+                query_fields, converters, wire_format, keys=[names.get(f, f) for f in query_fields],
+                slots=slots, width=width,
+            )
+            with _row_serializers_lock:
+                cls._row_serializers[key] = serializer
+                while len(cls._row_serializers) > ROW_SERIALIZER_CACHE_SIZE:
+                    cls._row_serializers.popitem(last=False)
+        return serializer
+
+    @classmethod
+    def serialize_rows(cls, query_fields, rows, wire_format=None, hidden=()):
+        """
+        : 将values_list(*query_fields)的结果转换为JSON数据，
+        : 并通过各计算列的resolver为当前页的全部行批量计算计算列的值
+        :param wire_format: 默认为Meta.wire_format
+        :param hidden: 前端隐藏的列名，隐藏的计算列不进行计算
+        :return: list
+        """
+        wire_format = wire_format or cls.wire_format
+        computed_columns = cls.get_computed_columns()
+        if not computed_columns:
+            return cls.get_row_serializer(query_fields, wire_format).serialize(rows)
+        rows = list(rows)
+        data = cls.get_row_serializer(query_fields, wire_format).serialize(rows)
+        if not rows:
+            return data
+        pk_index = list(query_fields).index(cls.pk_column.query_name)
+        pks = [row[pk_index] for row in rows]
+        for column in computed_columns:
+            if column.name in hidden:
+                if wire_format == WIRE_FORMAT_ARRAY:
+                    for row in data:
+                        row.append(None)
+                continue
+            values = column.resolve(pks)
+            if wire_format == WIRE_FORMAT_ARRAY:
+                for row, pk in zip(data, pks):
+                    row.append(values.get(pk))
+            else:
+                for row, pk in zip(data, pks):
+                    row[column.name] = values.get(pk)
+        return data
+
+    @classmethod
+    def dumps(cls, value):
+        """
+        : 使用Meta.json_dumps(未设置时使用DjangoJSONEncoder)进行JSON编码
+        :return: str
+        """
+        if cls.json_dumps is not None:
+            return cls.json_dumps(value)
+        return json_dumps(value)
+
     @classmethod
     def get_titles(cls):
         """
@@ -240,7 +808,17 @@ class ModelDataTable(metaclass=ModelDataTableMetaClass):
         用于生成DataTables cloumns相关的配置属性
         :return: list，每个元素代表一个column的配置
         """
-        return [c.get_dt_column_config() for c in cls.columns.values()]
+        dt_config_columns = [c.get_dt_column_config() for c in cls.columns.values()]
+        if cls.dt_serverSide:
+            # 前端隐藏的列不包含在数据中
+            for dt_column_config in dt_config_columns:
+                dt_column_config.setdefault('defaultContent', '')
+        if cls.wire_format == WIRE_FORMAT_ARRAY:
+            # array格式的数据中，各列通过序号获取
+            output_fields = cls.get_output_fields()
+            for column, dt_column_config in zip(cls.columns.values(), dt_config_columns):
+                dt_column_config['data'] = output_fields.index(column.name)
+        return dt_config_columns
 
     @classmethod
     def get_dt_config(cls):
@@ -250,6 +828,9 @@ class ModelDataTable(metaclass=ModelDataTableMetaClass):
         """
         config = dict(cls.js_config)
         config['columns'] = cls.get_dt_config_columns()
+        if cls.wire_format == WIRE_FORMAT_ARRAY and config.get('rowId') is not None:
+            # get_output_fields()中pk_column位于非计算列之后
+            config['rowId'] = len(cls.columns) - len(cls.get_computed_columns())
         # 因为在ModelDataTable的子类建立的时候（MetaClass处理过程)中，
         # 访问不到_default_buttons，
         # 所以对_default_buttons的处理放在类方法中
@@ -1,10 +1,136 @@
+import asyncio
+import csv
+import datetime
+import gzip
+import hashlib
+import itertools
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
 from functools import reduce
+from asgiref.sync import sync_to_async
 from django.views import generic
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, QueryDict, StreamingHttpResponse
+from django.core import signing
 from django.core.exceptions import ImproperlyConfigured, SuspiciousOperation
-from django.utils.module_loading import import_string
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
 
-from .utils import ModelDataTable
+from .cache import CHANGE_UPDATED
+from .counts import CountStrategy
+from .guard import CostExceeded, QueryTimeout
+from .instrumentation import RequestTimings, dt_request_finished, instrument, logger as slow_request_logger, phase
+from .query import InvalidRequest, parse_request
+from .registry import registry
+from .serializers import WIRE_FORMAT_OBJECT
+
+
+CURSOR_SALT = 'datatables_utils.cursor'
+
+_gzip_re = re.compile(r'\bgzip\b')
+
+
+def _get_order_by(ordering, reverse=False):
+    """
+    : 将[(name, desc), ...]形式的排序转换为order_by()的参数
+    """
+    return [('-' if desc != reverse else '') + name for name, desc in ordering]
+
+
+def _is_ajax(request):
+    return request.META.get('HTTP_X_REQUESTED_WITH') == 'XMLHttpRequest'
+
+
+def _accepts_gzip(request):
+    return bool(_gzip_re.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+def _close_connections_after(fn):
+    """
+    : 在独立线程中执行查询后，关闭该线程的数据库连接
+    """
+    def wrapper():
+        try:
+            return fn()
+        finally:
+            connections.close_all()
+    return wrapper
+
+
+class _Echo:
+    """
+    : 供csv.writer使用的伪文件对象，write()直接返回写入的内容
+    """
+    def write(self, value):
+        return value
+
+
+def _get_page(queryset, start, length):
+    """
+    : OFFSET分页，length为-1时返回start之后的全部数据
+    """
+    if length < 0:
+        return queryset[start:]
+    return queryset[start:start + length]
+
+
+def _get_search_key(value, regex):
+    """
+    : 规范化的搜索条件，普通文本搜索不区分大小写；
+    : 正则表达式保持原样，例如\\d与\\D的含义不同
+    """
+    return value if regex else value.lower()
+
+
+def _get_seek_q_object(ordering, values, reverse=False):
+    """
+    : 生成keyset分页所用的Q对象，即(a, b, c) > (va, vb, vc)按各列排序方向展开后的形式:
+    : a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND c > vc)
+    """
+    q = Q()
+    equal_lookups = {}
+    for (name, desc), value in zip(ordering, values):
+        lookup = name + ('__lt' if desc != reverse else '__gt')
+        q |= Q(**dict(equal_lookups, **{lookup: value}))
+        equal_lookups[name] = value
+    return q
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    """
+    : DjangoJSONEncoder将datetime, time截断到毫秒，同一毫秒内的行在seek时会被跳过或者重复，
+    : cursor中的排序值需要保留完整的精度
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _dump_cursor(cursor):
+    # 将date, Decimal等值转换为字符串，datetime, time保留微秒
+    cursor = json.loads(json.dumps(cursor, cls=_CursorEncoder))
+    return signing.dumps(cursor, salt=CURSOR_SALT, compress=True)
+
+
+def _load_cursor(value, cursor_key):
+    """
+    : 解析前端传回的cursor，cursor无效或与当前排序、搜索条件不符时返回None
+    """
+    if not value:
+        return None
+    try:
+        cursor = signing.loads(value, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(cursor, dict) or cursor.get('key') != cursor_key:
+        return None
+    return cursor
 
 
 class JsonContextMixin:
@@ -38,6 +164,17 @@ class DataTablesMixin(JsonResponseMixin, JsonContextMixin):
     dt_config = None
     dt_column_fields = None
     dt_table_name = None
+    # 请求中包含dt_export_param参数时，导出数据
+    dt_export_param = 'dt_export'
+    dt_export_formats = ('csv', 'ndjson')
+    dt_export_chunk_size = 2000
+    # 在响应中加入Server-Timing头，包含各阶段的耗时以及查询次数
+    dt_server_timing = False
+    # 处理时间(秒)超过该值的请求，被记录进datatables_utils.slow_requests logger
+    dt_slow_request_threshold = None
+    # 当前请求中前端隐藏的列名，这些列不进行查询以及序列化
+    dt_hidden_columns = frozenset()
+    _dt_initial_page = None
 
     def get_dt_data_src(self):
         return self.dt_data_src
@@ -53,6 +190,16 @@ class DataTablesMixin(JsonResponseMixin, JsonContextMixin):
         dt_config = self.get_dt_config()
         return self.dt_config.table_id
 
+    def render_to_json_response(self, context, **response_kwargs):
+        """
+        : 设置了Meta.json_dumps时，使用其进行JSON编码
+        """
+        with phase('encode'):
+            if self.dt_config.json_dumps is None:
+                return super().render_to_json_response(context, **response_kwargs)
+            response_kwargs.setdefault('content_type', 'application/json')
+            return HttpResponse(self.dt_config.dumps(context), **response_kwargs)
+
     def is_server_side(self):
         return bool(self.dt_config.dt_serverSide)
 
@@ -70,7 +217,7 @@ class DataTablesMixin(JsonResponseMixin, JsonContextMixin):
         #     return []
         # else:
         #     return dt_column_fields
-        return self.dt_config.get_query_fields()
+        return self.dt_config.get_query_fields(self.dt_hidden_columns)
 
     def process_http_queryset(self, queryset):
         pass
@@ -78,56 +225,524 @@ class DataTablesMixin(JsonResponseMixin, JsonContextMixin):
     def get_json_context_data(self, http_queryset=None):
         """
         : 依赖于其他class的get_queryset()方法
+        : 设置了Meta.cost_guard的statement_timeout时，查询超时后返回DataTables的error
+        :return: dict
+        """
+        try:
+            with self.limit_statements(self.get_queryset()):
+                return self.get_dt_json_context_data(http_queryset)
+        except QueryTimeout:
+            return super().get_json_context_data(error='Query timeout')
+
+    def get_dt_json_context_data(self, http_queryset=None):
+        """
         : 包含了数据获取，处理的逻辑
         :return: dict
         """
         json_context = {}
 
         self.process_http_queryset(http_queryset)
-        dt_column_fields = self.get_dt_query_fields()
-        queryset = self.get_queryset()
+        self.dt_hidden_columns = frozenset()
+        queryset, count_queryset = self.route_queryset(self.get_queryset())
         if self.is_server_side():
             if http_queryset is None:
                 raise ValueError('No GET queryset passed in for server-side mode')
 
             try:
-                draw = int(http_queryset.get('draw'))
-            except ValueError:
+                dt_request = parse_request(self.dt_config.plan, http_queryset)
+            except InvalidRequest:
                 json_context.update(error='Invalid request arguments')
                 return super().get_json_context_data(**json_context)
-            else:
-                json_context.update(draw=draw)
-            records_total = queryset.count()
-            json_context.update(recordsTotal=records_total)
+            json_context.update(draw=dt_request.draw)
+            try:
+                dt_request = self.apply_cost_guard(dt_request)
+            except CostExceeded:
+                json_context.update(error='Search pattern is too expensive')
+                return super().get_json_context_data(**json_context)
+            self.dt_hidden_columns = self.get_hidden_columns(dt_request)
 
             # 处理filter
-            # 只实现了对全局的搜索
-            # 没有实现对指定列的搜索
-            pattern = http_queryset.get('search[value]')
-            is_regex = http_queryset.get('search[regex]') == 'true'
-            queryset = queryset.filter(
-                reduce(
-                    lambda x, y: x | y,
-                    [c.get_filter_q_object(pattern, is_regex) for c in self.dt_config.columns.values()]
+            filter_q, search_key = self.get_filter_q_object(dt_request)
+            delta_refresh = self.dt_config.delta_refresh
+            if delta_refresh is not None:
+                # 在查询数据之前读取，之后的变化都会在下一次增量刷新中返回
+                json_context.update(version=delta_refresh.get_version(self.dt_config))
+                if 'dt_since' in http_queryset:
+                    self.get_delta_json_context_data(queryset, dt_request, filter_q, http_queryset, json_context)
+                    return super().get_json_context_data(**json_context)
+            # footer的聚合值与recordsFiltered在同一条查询中计算
+            aggregates = self.dt_config.get_aggregate_expressions(self.dt_hidden_columns)
+            records_total, records_filtered, aggregate_values = \
+                self.dt_config.count_strategy.get_counts_and_aggregates(
+                    self.dt_config, count_queryset, filter_q, search_key, aggregates
                 )
-            )
-            records_filtered = queryset.count()
+            json_context.update(recordsTotal=records_total)
             json_context.update(recordsFiltered=records_filtered)
+            if aggregates:
+                json_context.update(aggregates=self.dt_config.get_aggregate_values(aggregate_values))
+            if filter_q is not None:
+                queryset = queryset.filter(filter_q)
 
-            # 处理order
-            order_dir = '' if http_queryset['order[0][dir]'] == 'asc' else '-'
-            order_column = list(self.dt_config.columns.values())[int(http_queryset['order[0][column]'])].name
-            queryset = queryset.order_by(order_dir + order_column)
-
-            # 处理分页
-            page_start = int(http_queryset['start'])
-            page_length = int(http_queryset['length'])
-            queryset = queryset[page_start:page_start + page_length]
+            # 处理order以及分页
+            if self.dt_config.keyset_pagination:
+                with phase('page'):
+                    json_context[self.dt_data_src] = self.get_keyset_page_data(
+                        queryset, dt_request, json_context, search_key
+                    )
+                return super().get_json_context_data(**json_context)
+            queryset = queryset.order_by(*_get_order_by(dt_request.ordering))
+            queryset = _get_page(queryset, dt_request.start, dt_request.length)
 
-        json_context[self.dt_data_src] = list(queryset.values(*dt_column_fields))
+        with phase('page'):
+            rows = list(self.get_dt_values(queryset, self.get_dt_query_fields()))
+        with phase('serialize'):
+            json_context[self.dt_data_src] = self.serialize_rows(rows)
 
         return super().get_json_context_data(**json_context)
 
+    def get_delta_json_context_data(self, queryset, dt_request, filter_q, http_queryset, json_context):
+        """
+        : 增量刷新(参见DeltaRefresh)：只返回当前页中发生了变化的行，ids为这些行的行id，
+        : 无法只更新这些行时返回reload
+        : 没有变化时不进行任何查询；否则只查询当前页的行id以及发生了变化的行，不进行计数
+        """
+        json_context.update({self.dt_data_src: [], 'ids': []})
+        try:
+            since = int(http_queryset.get('dt_since'))
+        except ValueError:
+            json_context.update(error='Invalid request arguments')
+            return json_context
+        ids = [row_id for row_id in http_queryset.get('dt_ids', '').split(',') if row_id]
+        max_page_length = self.dt_config.plan.max_page_length
+        if max_page_length is not None and len(ids) > max_page_length:
+            json_context.update(error='Invalid request arguments')
+            return json_context
+
+        changes = self.dt_config.delta_refresh.get_changes(self.dt_config, since, json_context['version'])
+        if changes is None or any(kind != CHANGE_UPDATED for kind in changes.values()):
+            json_context.update(reload=True)
+            return json_context
+        if not changes:
+            return json_context
+
+        if filter_q is not None:
+            queryset = queryset.filter(filter_q)
+        pk_name = self.dt_config.pk_column.query_name
+        with phase('page'):
+            page = _get_page(queryset.order_by(*_get_order_by(dt_request.ordering)), dt_request.start, dt_request.length)
+            page_ids = [str(row_id) for row_id in page.values_list(pk_name, flat=True)]
+        if page_ids != ids:
+            # 变化影响了当前页包含的行或者行的顺序
+            json_context.update(reload=True)
+            return json_context
+        changed = [row_id for row_id in page_ids if row_id in changes]
+        if not changed:
+            return json_context
+        query_fields = self.get_dt_query_fields()
+        with phase('page'):
+            rows = list(self.get_dt_values(queryset.filter(**{pk_name + '__in': changed}), query_fields))
+        pk_index = list(query_fields).index(pk_name)
+        json_context['ids'] = [str(row[pk_index]) for row in rows]
+        with phase('serialize'):
+            json_context[self.dt_data_src] = self.serialize_rows(rows)
+        return json_context
+
+    def apply_cost_guard(self, dt_request):
+        """
+        : 根据Meta.cost_guard检查请求中的搜索内容
+        :raise CostExceeded:
+        :return: DataTablesRequest
+        """
+        if self.dt_config.cost_guard is None:
+            return dt_request
+        return self.dt_config.cost_guard.apply(dt_request)
+
+    def get_read_aliases(self, queryset):
+        """
+        : 根据Meta.read_routing选择当前页查询以及计数查询所使用的数据库
+        :return: tuple(当前页查询的alias, 计数查询的alias)
+        """
+        read_routing = self.dt_config.read_routing
+        if read_routing is None:
+            return queryset.db, queryset.db
+        version_cache = self.get_version_cache()
+        if version_cache is None:
+            return read_routing.get_aliases(getattr(self, 'request', None), queryset.db)
+        return read_routing.get_aliases(
+            getattr(self, 'request', None), queryset.db, self.dt_config.Meta.model, version_cache.cache_alias
+        )
+
+    def get_version_cache(self):
+        """
+        : 以Meta.model的数据版本为key缓存响应时，返回所使用的ResponseCache或者ConditionalGet
+        :return: ResponseCache, ConditionalGet或者None
+        """
+        if self.is_server_side():
+            return self.dt_config.response_cache
+        conditional_get = self.dt_config.conditional_get
+        if conditional_get is not None and conditional_get.updated_field is None:
+            return conditional_get
+        return None
+
+    def has_recent_write(self):
+        """
+        : 当前用户是否在Meta.read_routing的read_your_writes时间内进行过写操作，
+        : 此时查询使用primary，并且不使用缓存的响应
+        """
+        read_routing = self.dt_config.read_routing
+        return read_routing is not None and read_routing.has_recent_write(getattr(self, 'request', None))
+
+    def route_queryset(self, queryset):
+        """
+        :return: tuple(当前页查询的queryset, 计数查询的queryset)
+        """
+        if self.dt_config.read_routing is None:
+            return queryset, queryset
+        page_alias, count_alias = self.get_read_aliases(queryset)
+        return queryset.using(page_alias), queryset.using(count_alias)
+
+    def limit_statements(self, queryset):
+        """
+        : 根据Meta.cost_guard的statement_timeout限制queryset读查询所在数据库的查询时间
+        :return: context manager
+        """
+        if self.dt_config.cost_guard is None:
+            return nullcontext()
+        stack = ExitStack()
+        for alias in dict.fromkeys(self.get_read_aliases(queryset)):
+            stack.enter_context(self.dt_config.cost_guard.limit_statements(alias))
+        return stack
+
+    def is_instrumented(self):
+        """
+        : 设置了dt_server_timing, dt_slow_request_threshold，
+        : 或者dt_request_finished signal有receiver时，记录请求各阶段的耗时
+        """
+        return (self.dt_server_timing or self.dt_slow_request_threshold is not None
+                or dt_request_finished.has_listeners(self.dt_config))
+
+    def report_timings(self, timings, response):
+        """
+        : 发送dt_request_finished signal，加入Server-Timing头，并记录慢请求
+        """
+        dt_request_finished.send(sender=self.dt_config, timings=timings, view=self)
+        if self.dt_server_timing:
+            response['Server-Timing'] = timings.as_server_timing()
+        threshold = self.dt_slow_request_threshold
+        if threshold is not None and timings.duration >= threshold:
+            slow_request_logger.warning('Slow DataTables request: %s', timings,
+                                        extra={'dt_timings': timings.as_dict()})
+
+    def get_json_response(self, http_queryset):
+        """
+        : 处理ajax请求，生成JSON响应
+        : 需要时记录各阶段的耗时以及查询次数，参见is_instrumented()
+        :return: HttpResponse
+        """
+        if not self.is_instrumented():
+            return self.build_json_response(http_queryset)
+        timings = RequestTimings(self.dt_config, http_queryset)
+        with instrument(timings, using=self.get_read_aliases(self.get_queryset())):
+            response = self.build_json_response(http_queryset)
+        self.report_timings(timings, response)
+        return response
+
+    def build_json_response(self, http_queryset):
+        """
+        : 生成JSON响应
+        : 设置了Meta.response_cache时，从缓存中读取JSON，只替换其中的draw
+        : client side模式下设置了Meta.conditional_get时，处理ETag以及Last-Modified
+        :return: HttpResponse
+        """
+        if self.dt_config.conditional_get is not None and not self.is_server_side():
+            return self.build_conditional_json_response(http_queryset)
+        response_cache = self.dt_config.response_cache
+        if (response_cache is None or not self.is_server_side() or self.has_recent_write()
+                or 'dt_since' in http_queryset):
+            return self.render_to_json_response(self.get_json_context_data(http_queryset))
+        try:
+            draw = int(http_queryset.get('draw'))
+        except (TypeError, ValueError):
+            return self.render_to_json_response(self.get_json_context_data(http_queryset))
+        cache_key = response_cache.get_cache_key(self.dt_config, self.get_queryset(), http_queryset)
+        if cache_key is None:
+            return self.render_to_json_response(self.get_json_context_data(http_queryset))
+
+        def compute():
+            json_context = self.get_json_context_data(http_queryset)
+            return json_context, 'error' not in json_context
+
+        body = response_cache.get_body(cache_key, compute, dumps=self.dt_config.dumps)
+        return HttpResponse(response_cache.patch_draw(body, draw), content_type='application/json')
+
+    def build_conditional_json_response(self, http_queryset):
+        """
+        : 数据没有变化(If-None-Match, If-Modified-Since)时返回304，
+        : 否则返回全部数据，设置了snapshot时使用缓存中gzip压缩后的JSON
+        :return: HttpResponse
+        """
+        conditional_get = self.dt_config.conditional_get
+        request = getattr(self, 'request', None)
+        with phase('validate'):
+            etag, last_modified = conditional_get.get_validators(
+                self.dt_config, self.route_queryset(self.get_queryset())[0]
+            )
+        if etag is None:
+            return self.render_to_json_response(self.get_json_context_data(http_queryset))
+        if request is not None:
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+
+        accepts_gzip = request is not None and _accepts_gzip(request)
+        compressed = conditional_get.get_snapshot(self.dt_config, etag) if conditional_get.snapshot else None
+        if compressed is not None and accepts_gzip:
+            response = HttpResponse(compressed, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        elif compressed is not None:
+            response = HttpResponse(gzip.decompress(compressed), content_type='application/json')
+        else:
+            json_context = self.get_json_context_data(http_queryset)
+            response = self.render_to_json_response(json_context)
+            if 'error' in json_context:
+                # 查询超时等错误不进行缓存
+                return response
+            if conditional_get.snapshot:
+                compressed = conditional_get.set_snapshot(self.dt_config, etag, response.content)
+                if accepts_gzip:
+                    response = HttpResponse(compressed, content_type='application/json')
+                    response['Content-Encoding'] = 'gzip'
+        if conditional_get.snapshot:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # 每次使用前都需要向服务器确认
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_export_response(self, http_queryset, export_format):
+        """
+        : 按照请求中的搜索以及排序条件，以流的形式导出全部数据(不分页)
+        : 通过queryset.iterator()分批读取，内存占用与数据量无关
+        :param export_format: 'csv'或者'ndjson'
+        :return: StreamingHttpResponse
+        """
+        if export_format not in self.dt_export_formats:
+            return HttpResponseBadRequest('Unsupported export format')
+        # 导出请求可以不包含draw
+        http_queryset = http_queryset.copy()
+        http_queryset.setdefault('draw', '0')
+        try:
+            dt_request = parse_request(self.dt_config.plan, http_queryset)
+        except InvalidRequest:
+            return HttpResponseBadRequest('Invalid request arguments')
+        try:
+            dt_request = self.apply_cost_guard(dt_request)
+        except CostExceeded:
+            return HttpResponseBadRequest('Search pattern is too expensive')
+
+        queryset = self.route_queryset(self.get_queryset())[0]
+        filter_q, _ = self.get_filter_q_object(dt_request)
+        if filter_q is not None:
+            queryset = queryset.filter(filter_q)
+        queryset = queryset.order_by(*_get_order_by(dt_request.ordering))
+        column_names = [c.name for c in self.dt_config.columns.values()]
+        # 导出完整的值，不进行截断
+        query_fields = self.dt_config.get_query_fields(preview=False)
+        rows = queryset.values_list(*query_fields).iterator(chunk_size=self.dt_export_chunk_size)
+        # 按chunk转换数据，每个chunk中的计算列只进行一次批量计算
+        records = (
+            record
+            for chunk in self.iter_export_chunks(queryset, rows)
+            for record in self.dt_config.serialize_rows(query_fields, chunk, WIRE_FORMAT_OBJECT)
+        )
+
+        if export_format == 'csv':
+            writer = csv.writer(_Echo())
+            lines = itertools.chain(
+                [writer.writerow(self.dt_config.get_titles())],
+                (writer.writerow([record[name] for name in column_names]) for record in records),
+            )
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            encoder = DjangoJSONEncoder()
+            lines = (
+                encoder.encode({name: record[name] for name in column_names}) + '\n' for record in records
+            )
+            content_type = 'application/x-ndjson'
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(
+            self.get_dt_table_name(), export_format
+        )
+        return response
+
+    def iter_export_chunks(self, queryset, rows):
+        """
+        : 分批读取导出的数据，设置了Meta.cost_guard的statement_timeout时，限制每一批的读取时间，
+        : 超时后抛出QueryTimeout，中断下载
+        :param rows: queryset.values_list().iterator()
+        """
+        cost_guard = self.dt_config.cost_guard
+        limit = cost_guard.limit_statements(queryset.db) if cost_guard is not None else nullcontext(lambda: None)
+        with limit as restart:
+            while True:
+                restart()
+                chunk = list(itertools.islice(rows, self.dt_export_chunk_size))
+                if not chunk:
+                    return
+                yield chunk
+
+    def get_filter_q_object(self, dt_request):
+        """
+        : 处理全局搜索(search[value])以及各列的搜索(columns[i][search][value])，
+        : 各搜索条件之间进行AND操作
+        :return: tuple(filter_q, search_key)，没有搜索条件时filter_q为None，
+        : search_key为规范化后的搜索条件
+        """
+        q_objects = []
+        search_keys = []
+        search_backend = self.dt_config.search_backend
+        if dt_request.search_prefix:
+            q_objects.append(search_backend.get_prefix_q_object(self.dt_config, dt_request.search_value))
+            search_keys.append('{}|prefix'.format(dt_request.search_value.lower()))
+        elif dt_request.search_value:
+            q_objects.append(search_backend.get_filter_q_object(
+                self.dt_config, dt_request.search_value, dt_request.search_regex
+            ))
+            search_keys.append('{}|{}'.format(
+                _get_search_key(dt_request.search_value, dt_request.search_regex), dt_request.search_regex
+            ))
+        for column_search in dt_request.column_searches:
+            column, value = column_search.column, column_search.value
+            q = column.get_filter_q_object(value, column_search.regex, prefix=column_search.prefix)
+            # 搜索内容不适用于该列时，不匹配任何数据
+            q_objects.append(q if q else Q(pk__in=[]))
+            search_keys.append('{}:{}|{}'.format(
+                column.name, _get_search_key(value, column_search.regex),
+                'prefix' if column_search.prefix else column_search.regex
+            ))
+        if not q_objects:
+            return None, ''
+        return reduce(lambda x, y: x & y, q_objects), '&'.join(search_keys)
+
+    def get_cursor_key(self, ordering, search_key):
+        """
+        : 生成cursor的标识，排序或搜索条件变化后，旧的cursor不再有效
+        :return: str
+        """
+        key = '{}|{}|{}'.format(self.dt_config.table_id, ordering, search_key)
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def get_keyset_page_data(self, queryset, dt_request, json_context, search_key=''):
+        """
+        : keyset(seek)分页
+        : 请求的页紧接在cursor所记录的页之后(或之前)时，通过排序值进行seek，
+        : 否则(随机跳页)退回到OFFSET分页
+        : 新的cursor会被加入json_context，由前端在下一次请求中原样传回
+        :return: list, 当前页的数据
+        """
+        dt_column_fields = self.get_dt_query_fields()
+        # dt_request.ordering的最后一项总是pk_column，保证排序值唯一
+        ordering = dt_request.ordering
+        # 生成cursor需要完整的排序值，隐藏或者截断的排序列额外进行查询，但不进行序列化
+        fetch_fields = dt_column_fields + [name for name, desc in ordering if name not in dt_column_fields]
+        page_start, page_length = dt_request.start, dt_request.length
+        cursor_key = self.get_cursor_key(ordering, search_key)
+        cursor = _load_cursor(dt_request.cursor, cursor_key)
+        # 比较运算不能匹配NULL，按可能为NULL的列排序时只使用OFFSET分页
+        seekable = not any(name in self.dt_config.plan.nullable for name, desc in ordering)
+
+        rows = None
+        if page_length > 0 and cursor is not None and seekable:
+            if page_start == cursor['end']:
+                # 下一页
+                seek_q = _get_seek_q_object(ordering, cursor['last'])
+                rows = list(self.get_dt_values(
+                    queryset.filter(seek_q).order_by(*_get_order_by(ordering)), fetch_fields
+                )[:page_length])
+            elif page_start + page_length == cursor['start']:
+                # 上一页，反向排序后seek，再将结果反转
+                seek_q = _get_seek_q_object(ordering, cursor['first'], reverse=True)
+                rows = list(self.get_dt_values(
+                    queryset.filter(seek_q).order_by(*_get_order_by(ordering, reverse=True)), fetch_fields
+                )[:page_length])
+                rows.reverse()
+        if rows is None:
+            queryset = queryset.order_by(*_get_order_by(ordering))
+            rows = list(self.get_dt_values(_get_page(queryset, page_start, page_length), fetch_fields))
+
+        if rows:
+            ordering_indexes = [fetch_fields.index(name) for name, desc in ordering]
+            json_context.update(cursor=_dump_cursor({
+                'key': cursor_key,
+                'start': page_start,
+                'end': page_start + len(rows),
+                'first': [rows[0][index] for index in ordering_indexes],
+                'last': [rows[-1][index] for index in ordering_indexes],
+            }))
+        if len(fetch_fields) > len(dt_column_fields):
+            rows = [row[:len(dt_column_fields)] for row in rows]
+        return self.serialize_rows(rows)
+
+    def serialize_rows(self, rows):
+        """
+        : 将values_list()的结果转换为JSON数据，格式由Meta.wire_format决定
+        :return: list
+        """
+        return self.dt_config.serialize_rows(self.get_dt_query_fields(), rows, hidden=self.dt_hidden_columns)
+
+    def get_hidden_columns(self, dt_request):
+        """
+        : 前端隐藏的列仍然参与搜索以及排序，只是不进行查询以及序列化
+        :return: frozenset, 列名
+        """
+        return dt_request.hidden_columns
+
+    def get_dt_values(self, queryset, query_fields):
+        """
+        : 对queryset进行values_list()，设置了max_length的列在数据库中截断
+        :return: QuerySet
+        """
+        expressions = self.dt_config.get_select_expressions(query_fields)
+        if expressions:
+            queryset = queryset.annotate(**expressions)
+        return queryset.values_list(*query_fields)
+
+    def get_initial_http_queryset(self):
+        """
+        : 生成与DataTables初始化后第一次ajax请求相同的参数，
+        : 包括dt_pageLength, dt_displayStart, dt_order以及dt_search的设置
+        :return: QueryDict
+        """
+        js_config = self.dt_config.js_config
+        http_queryset = QueryDict(mutable=True)
+        http_queryset.update({
+            'draw': '1',
+            'start': str(js_config.get('displayStart') or 0),
+            'length': str(js_config.get('pageLength') or 10),
+            'search[value]': (js_config.get('search') or {}).get('search', ''),
+            'search[regex]': 'false',
+        })
+        order = js_config.get('order')
+        if order is None:
+            # DataTables的默认排序
+            order = [[0, 'asc']]
+        for i, (column, direction) in enumerate(order):
+            http_queryset['order[{}][column]'.format(i)] = str(column)
+            http_queryset['order[{}][dir]'.format(i)] = direction
+        return http_queryset
+
+    def get_initial_page(self):
+        """
+        : 在渲染HTML时生成第一页的数据，供render_table, render_js_script的defer_loading使用，
+        : 同一个请求中只生成一次
+        :return: dict, 与ajax请求的JSON数据相同
+        """
+        if self._dt_initial_page is None:
+            self._dt_initial_page = self.get_json_context_data(self.get_initial_http_queryset())
+        return self._dt_initial_page
+
     def get_context_data(self, **kwargs):
         """
         : 将ModelDataTables类添加进context
@@ -149,23 +764,12 @@ class ModelDataTablesMixin(DataTablesMixin):
     包括ajax请求
     """
     def config_datatables_from_model(self, dt_config=None):
+        """
+        : model.datatables_class通过registry解析，每个进程中只解析一次
+        """
         if self.dt_config is not None:
             return
-        try:
-            datatables_class = self.model.datatables_class
-        except AttributeError:
-            raise ImproperlyConfigured('No datatables class configured in {}:{}'
-                                       .format(self.model._meta.app_label, self.model._meta.verbose_name))
-        if isinstance(datatables_class, str):
-            try:
-                datatables_class = import_string(datatables_class)
-            except ImportError:
-                raise ImproperlyConfigured('Error in datatables configured in {}:{}'
-                                           .format(self.model._meta.app_label, self.model._meta.verbose_name))
-        if not issubclass(datatables_class, ModelDataTable):
-            raise ImproperlyConfigured('Improperly configured datatables_class attr in {}:{}'
-                                       .format(self.model._meta.app_label, self.model._meta.verbose_name))
-        self.dt_config = datatables_class
+        self.dt_config = registry.get_for_model(self.model)
 
     def get_context_data(self, **kwargs):
         # 注意：这里也需要对kwargs中的dt_config参数进行判断
@@ -179,11 +783,300 @@ class ModelDataTablesMixin(DataTablesMixin):
         self.config_datatables_from_model()
         return super().get_json_context_data(*args, **kwargs)
 
+    def get_export_response(self, *args, **kwargs):
+        self.config_datatables_from_model()
+        return super().get_export_response(*args, **kwargs)
+
+    def get_initial_page(self, *args, **kwargs):
+        self.config_datatables_from_model()
+        return super().get_initial_page(*args, **kwargs)
+
+    def get_json_response(self, *args, **kwargs):
+        self.config_datatables_from_model()
+        return super().get_json_response(*args, **kwargs)
+
 
 class DataTablesListView(ModelDataTablesMixin, generic.ListView):
 
     def get(self, request, *args, **kwargs):
-        if request.is_ajax():
+        export_format = request.GET.get(self.dt_export_param)
+        if export_format:
+            return self.get_export_response(request.GET, export_format)
+        if _is_ajax(request):
             # if not self.dt_config.dt_serverSide:
-            return self.render_to_json_response(self.get_json_context_data(request.GET))
+            return self.get_json_response(request.GET)
         return super().get(request, *args, **kwargs)
+
+
+class _BatchTableView(DataTablesMixin):
+    """
+    : DataTablesBatchView中处理单个table的请求，queryset由DataTablesBatchView提供
+    """
+    def __init__(self, batch_view, dt_config):
+        self.batch_view = batch_view
+        self.request = batch_view.request
+        self.dt_config = dt_config
+
+    def get_queryset(self):
+        return self.batch_view.get_queryset(self.dt_config)
+
+    def build_conditional_json_response(self, http_queryset):
+        # 各table的JSON被嵌入同一个响应，不能返回304或者gzip压缩后的数据
+        return self.render_to_json_response(self.get_json_context_data(http_queryset))
+
+
+class DataTablesBatchView(generic.View):
+    """
+    : 在一个请求中处理同一页面中多个table的ajax请求，返回{table_id: JSON数据}
+    : 请求为POST的JSON: {"tables": {table_id: 该table的请求参数(urlencoded)}}，
+    : 由render_js_script的batch_url选项生成的JS自动合并同一时刻各table的请求
+    : 只处理dt_tables中列出的table(ModelDataTable子类或者table_id)
+    : dt_concurrent_queries为False时，各table在当前线程中依次处理，共享请求的数据库连接；
+    : 为True时，各table在线程池中同时处理，每个线程使用独立的数据库连接
+    """
+    http_method_names = ['post']
+    dt_tables = ()
+    dt_max_tables = 20
+    dt_concurrent_queries = False
+    dt_max_workers = 4
+
+    def get_tables(self):
+        """
+        :raise ImproperlyConfigured: dt_tables中的多个类使用相同的table_id
+        :return: dict, table_id -> ModelDataTable子类
+        """
+        tables = {}
+        for table in self.dt_tables:
+            if isinstance(table, str):
+                table = registry.get(table)
+            if tables.get(table.table_id, table) is not table:
+                raise ImproperlyConfigured('table_id {} is used by multiple tables in dt_tables'.format(table.table_id))
+            tables[table.table_id] = table
+        return tables
+
+    def get_queryset(self, dt_config):
+        """
+        : 各table所使用的queryset，需要根据用户过滤数据时重写该方法
+        """
+        return dt_config.Meta.model._default_manager.all()
+
+    def get_table_body(self, dt_config, params):
+        """
+        :return: str, 该table的JSON数据
+        """
+        if not isinstance(params, str):
+            return json.dumps({'error': 'Invalid request arguments'})
+        response = _BatchTableView(self, dt_config).get_json_response(QueryDict(params))
+        return response.content.decode(response.charset)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            payload = json.loads(request.body.decode('utf-8'))
+            requested = payload['tables']
+        except (ValueError, TypeError, KeyError):
+            return HttpResponseBadRequest('Invalid request arguments')
+        if not isinstance(requested, dict) or len(requested) > self.dt_max_tables:
+            return HttpResponseBadRequest('Invalid request arguments')
+
+        tables = self.get_tables()
+        unknown = [table_id for table_id in requested if table_id not in tables]
+        jobs = [(table_id, tables[table_id], params) for table_id, params in requested.items() if table_id in tables]
+        if self.dt_concurrent_queries and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.dt_max_workers, len(jobs))) as executor:
+                bodies = list(executor.map(
+                    lambda job: _close_connections_after(lambda: self.get_table_body(job[1], job[2]))(), jobs
+                ))
+        else:
+            bodies = [self.get_table_body(dt_config, params) for table_id, dt_config, params in jobs]
+
+        items = ['{}: {}'.format(json.dumps(job[0]), body) for job, body in zip(jobs, bodies)]
+        items.extend('{}: {}'.format(json.dumps(table_id), json.dumps({'error': 'Unknown table'}))
+                     for table_id in unknown)
+        return HttpResponse('{' + ', '.join(items) + '}', content_type='application/json')
+
+
+class AsyncDataTablesMixin(DataTablesMixin):
+    """
+    : DataTablesMixin的异步版本，用于ASGI
+    : recordsTotal, recordsFiltered以及当前页的查询通过asyncio.gather()同时发出，
+    : 默认使用Django的异步ORM(acount(), async for)
+    : 注意：Django的异步ORM目前仍然在同一个线程中依次执行查询，
+    : 设置dt_concurrent_queries为True时，各查询在独立的线程(以及数据库连接)中执行，查询之间才会真正并行，
+    : 每个查询都会建立新的数据库连接，适合配合数据库连接池使用
+    """
+    dt_concurrent_queries = False
+
+    async def arun_query(self, fn):
+        """
+        : 在线程中执行包含数据库查询的函数，设置了Meta.cost_guard的statement_timeout时限制其查询时间
+        """
+        def run():
+            with self.limit_statements(self.get_queryset()):
+                return fn()
+
+        if not self.dt_concurrent_queries:
+            return await sync_to_async(run)()
+        return await sync_to_async(_close_connections_after(run), thread_sensitive=False)()
+
+    def is_statement_limited(self):
+        """
+        : statement_timeout只能在执行查询的线程中设置，此时所有查询都通过arun_query()执行
+        """
+        cost_guard = self.dt_config.cost_guard
+        return cost_guard is not None and cost_guard.statement_timeout is not None
+
+    async def aget_counts_and_aggregates(self, queryset, filter_q, search_key, aggregates):
+        """
+        : 设置了footer的聚合时，计数以及聚合值在线程中计算
+        :return: tuple, (records_total, records_filtered, 聚合值的dict)
+        """
+        if not aggregates:
+            return await self.aget_counts(queryset, filter_q, search_key) + ({},)
+        strategy = self.dt_config.count_strategy
+        return await self.arun_query(
+            lambda: strategy.get_counts_and_aggregates(self.dt_config, queryset, filter_q, search_key, aggregates)
+        )
+
+    async def aget_counts(self, queryset, filter_q, search_key):
+        strategy = self.dt_config.count_strategy
+        if not self.dt_concurrent_queries and not self.is_statement_limited():
+            return await strategy.aget_counts(self.dt_config, queryset, filter_q, search_key)
+        if filter_q is not None and type(strategy).get_counts is CountStrategy.get_counts:
+            # 策略分别计算两个计数时，两个计数同时进行
+            records_total, records_filtered = await asyncio.gather(
+                self.arun_query(lambda: strategy.count_total(self.dt_config, queryset)),
+                self.arun_query(lambda: strategy.count_filtered(self.dt_config, queryset.filter(filter_q))),
+            )
+            return records_total, records_filtered
+        return await self.arun_query(
+            lambda: strategy.get_counts(self.dt_config, queryset, filter_q, search_key)
+        )
+
+    async def afetch_rows(self, queryset):
+        if self.dt_concurrent_queries or self.is_statement_limited():
+            return await self.arun_query(lambda: list(queryset))
+        return [row async for row in queryset]
+
+    async def aget_json_context_data(self, http_queryset=None):
+        """
+        : get_json_context_data()的异步版本
+        :return: dict
+        """
+        try:
+            return await self.aget_dt_json_context_data(http_queryset)
+        except QueryTimeout:
+            return {'error': 'Query timeout'}
+
+    async def aget_dt_json_context_data(self, http_queryset=None):
+        json_context = {}
+
+        self.process_http_queryset(http_queryset)
+        self.dt_hidden_columns = frozenset()
+        queryset, count_queryset = self.route_queryset(self.get_queryset())
+        if not self.is_server_side():
+            rows = await self.afetch_rows(self.get_dt_values(queryset, self.get_dt_query_fields()))
+            json_context[self.dt_data_src] = await self.aserialize_rows(rows)
+            return json_context
+
+        if http_queryset is None:
+            raise ValueError('No GET queryset passed in for server-side mode')
+        try:
+            dt_request = parse_request(self.dt_config.plan, http_queryset)
+        except InvalidRequest:
+            json_context.update(error='Invalid request arguments')
+            return json_context
+        json_context.update(draw=dt_request.draw)
+        try:
+            dt_request = self.apply_cost_guard(dt_request)
+        except CostExceeded:
+            json_context.update(error='Search pattern is too expensive')
+            return json_context
+        self.dt_hidden_columns = self.get_hidden_columns(dt_request)
+        dt_column_fields = self.get_dt_query_fields()
+
+        filter_q, search_key = self.get_filter_q_object(dt_request)
+        delta_refresh = self.dt_config.delta_refresh
+        if delta_refresh is not None:
+            json_context.update(version=await sync_to_async(delta_refresh.get_version)(self.dt_config))
+            if 'dt_since' in http_queryset:
+                return await self.arun_query(lambda: self.get_delta_json_context_data(
+                    queryset, dt_request, filter_q, http_queryset, json_context
+                ))
+        filtered_queryset = queryset.filter(filter_q) if filter_q is not None else queryset
+        if self.dt_config.keyset_pagination:
+            page_task = self.arun_query(
+                lambda: self.get_keyset_page_data(filtered_queryset, dt_request, json_context, search_key)
+            )
+        else:
+            page_queryset = _get_page(
+                filtered_queryset.order_by(*_get_order_by(dt_request.ordering)), dt_request.start, dt_request.length
+            )
+            page_task = self.afetch_rows(self.get_dt_values(page_queryset, dt_column_fields))
+        aggregates = self.dt_config.get_aggregate_expressions(self.dt_hidden_columns)
+        (records_total, records_filtered, aggregate_values), rows = await asyncio.gather(
+            self.aget_counts_and_aggregates(count_queryset, filter_q, search_key, aggregates), page_task
+        )
+        json_context.update(recordsTotal=records_total)
+        json_context.update(recordsFiltered=records_filtered)
+        if aggregates:
+            json_context.update(aggregates=self.dt_config.get_aggregate_values(aggregate_values))
+        if self.dt_config.keyset_pagination:
+            json_context[self.dt_data_src] = rows
+        else:
+            json_context[self.dt_data_src] = await self.aserialize_rows(rows)
+        return json_context
+
+    async def aserialize_rows(self, rows):
+        """
+        : 计算列的resolver可能包含数据库查询，此时在线程中进行转换
+        """
+        if not self.dt_config.get_computed_columns():
+            return self.serialize_rows(rows)
+        return await self.arun_query(lambda: self.serialize_rows(rows))
+
+    async def aget_json_response(self, http_queryset):
+        """
+        : get_json_response()的异步版本
+        : 设置了Meta.response_cache，或者client side模式下设置了Meta.conditional_get时，
+        : 在线程中调用get_json_response()
+        """
+        if self.is_server_side():
+            use_sync = self.dt_config.response_cache is not None
+        else:
+            use_sync = self.dt_config.conditional_get is not None
+        if use_sync:
+            return await sync_to_async(self.get_json_response)(http_queryset)
+        if not self.is_instrumented():
+            return self.render_to_json_response(await self.aget_json_context_data(http_queryset))
+        # 各查询同时进行，只记录查询的总耗时，不记录查询次数
+        timings = RequestTimings(self.dt_config, http_queryset)
+        started = time.perf_counter()
+        json_context = await self.aget_json_context_data(http_queryset)
+        timings.record('query', time.perf_counter() - started)
+        with timings.phase('encode'):
+            response = self.render_to_json_response(json_context)
+        timings.finish()
+        self.report_timings(timings, response)
+        return response
+
+
+class AsyncDataTablesListView(AsyncDataTablesMixin, DataTablesListView):
+    """
+    : DataTablesListView的异步版本，ModelDataTable的配置与DataTablesListView相同
+    """
+
+    async def aget_json_context_data(self, *args, **kwargs):
+        self.config_datatables_from_model()
+        return await super().aget_json_context_data(*args, **kwargs)
+
+    async def aget_json_response(self, *args, **kwargs):
+        self.config_datatables_from_model()
+        return await super().aget_json_response(*args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        export_format = request.GET.get(self.dt_export_param)
+        if export_format:
+            return await sync_to_async(self.get_export_response)(request.GET, export_format)
+        if _is_ajax(request):
+            return await self.aget_json_response(request.GET)
+        return await sync_to_async(super().get)(request, *args, **kwargs)
@@ -1,4 +1,11 @@
-from datatables_utils.utils import ModelDataTable, DataTablesColumn
+from datatables_utils.cache import ConditionalGet, DeltaRefresh, ResponseCache
+from datatables_utils.counts import AggregateCount
+from datatables_utils.guard import CostGuard
+from datatables_utils.search import SQLiteFTS5SearchBackend
+from datatables_utils.serializers import fast_json_dumps
+from django.db.models import Count
+
+from datatables_utils.utils import ModelDataTable, DataTablesColumn, ComputedColumn
 from . import models as test_models
 
 
@@ -14,3 +21,133 @@ class WithMetaModelDataTable(ModelDataTable):
     class Meta:
         model = test_models.TestModel
         fields = ['field_1', 'field_not_exist_1']
+
+
+class KeysetRecordDataTable(ModelDataTable):
+    class Meta:
+        model = test_models.Record
+        fields = ['name', 'amount', 'created', 'updated']
+        keyset_pagination = True
+
+
+class FTSRecordDataTable(ModelDataTable):
+    class Meta:
+        model = test_models.Record
+        fields = ['name']
+        search_backend = SQLiteFTS5SearchBackend()
+
+
+class RecordDataTable(ModelDataTable):
+    class Meta:
+        model = test_models.Record
+        fields = ['name', 'amount', 'code', 'created']
+
+
+class CachedRecordDataTable(ModelDataTable):
+    class Meta:
+        model = test_models.Record
+        fields = ['name', 'amount']
+        response_cache = ResponseCache(timeout=60)
+
+
+class ArrayRecordDataTable(ModelDataTable):
+    class Meta:
+        model = test_models.Record
+        fields = ['name', 'amount', 'created']
+        wire_format = 'array'
+        json_dumps = fast_json_dumps
+
+
+def resolve_same_category_count(pks):
+    categories = dict(test_models.Record.objects.filter(pk__in=pks).values_list('pk', 'category'))
+    counts = dict(
+        test_models.Record.objects.filter(category__in=set(categories.values()))
+        .values_list('category').annotate(count=Count('pk'))
+    )
+    return {pk: counts.get(category, 0) for pk, category in categories.items()}
+
+
+class RelatedRecordDataTable(ModelDataTable):
+    category = DataTablesColumn(display_field='name')
+    same_category = ComputedColumn(resolve_same_category_count)
+
+    class Meta:
+        model = test_models.Record
+        fields = ['name']
+        column_order = ['name', 'category', 'same_category']
+
+
+class ClientSideRecordDataTable(ModelDataTable):
+    dt_serverSide = False
+
+    class Meta:
+        model = test_models.Record
+        fields = ['name', 'amount']
+        table_id = 'dt-client-side-record'
+        conditional_get = ConditionalGet(snapshot=True)
+
+
+class UpdatedFieldRecordDataTable(ModelDataTable):
+    dt_serverSide = False
+
+    class Meta:
+        model = test_models.Record
+        fields = ['name', 'created']
+        table_id = 'dt-updated-field-record'
+        conditional_get = ConditionalGet(updated_field='created')
+
+
+class GuardedRecordDataTable(ModelDataTable):
+    class Meta:
+        model = test_models.Record
+        table_id = 'dt-guarded-record'
+        fields = ['name', 'code']
+        cost_guard = CostGuard(max_pattern_length=8, max_regex_complexity=3, fallback='prefix')
+
+
+class StrictRecordDataTable(ModelDataTable):
+    class Meta:
+        model = test_models.Record
+        table_id = 'dt-strict-record'
+        fields = ['name', 'code']
+        # 1微秒，扫描全表的搜索必然超时
+        cost_guard = CostGuard(allow_regex=False, statement_timeout=0.000001, fallback='error')
+
+
+class PreviewRecordDataTable(ModelDataTable):
+    code = DataTablesColumn(max_length=3)
+
+    class Meta:
+        model = test_models.Record
+        table_id = 'dt-preview-record'
+        fields = ['name', 'notes']
+        max_lengths = {'notes': 10}
+        keyset_pagination = True
+
+
+class AggregateRecordDataTable(ModelDataTable):
+    amount = DataTablesColumn(aggregates=['sum', 'avg'])
+
+    class Meta:
+        model = test_models.Record
+        table_id = 'dt-aggregate-record'
+        fields = ['name', 'created']
+        aggregates = {'created': ['max']}
+
+
+class SingleQueryAggregateRecordDataTable(ModelDataTable):
+    amount = DataTablesColumn(aggregates=['sum', 'min'])
+
+    class Meta:
+        model = test_models.Record
+        table_id = 'dt-single-query-aggregate-record'
+        fields = ['name']
+        count_strategy = AggregateCount()
+
+
+class DeltaRecordDataTable(ModelDataTable):
+    class Meta:
+        model = test_models.Record
+        table_id = 'dt-delta-record'
+        fields = ['name', 'amount']
+        delta_refresh = DeltaRefresh()
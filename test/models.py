@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from django.db import models
+from django.utils import timezone
 
 
 class TestModel(models.Model):
@@ -8,3 +9,17 @@ class TestModel(models.Model):
 
     class Meta:
         managed = False
+
+
+class Category(models.Model):
+    name = models.CharField(max_length=64)
+
+
+class Record(models.Model):
+    name = models.CharField(max_length=64)
+    amount = models.IntegerField(default=0)
+    code = models.CharField(max_length=16, db_index=True, default='')
+    created = models.DateTimeField(null=True)
+    category = models.ForeignKey(Category, null=True, on_delete=models.SET_NULL)
+    notes = models.TextField(blank=True, default='')
+    updated = models.DateTimeField(default=timezone.now)
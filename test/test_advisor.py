@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from datatables_utils.advisor import IndexAdvisor, get_existing_indexes
+from datatables_utils.utils import ModelDataTable
+
+from .models import Category, Record
+from .model_datatables import FTSRecordDataTable, RecordDataTable, RelatedRecordDataTable
+
+
+class IndexAdvisorTestCase(TestCase):
+    """
+    Testcase for the index advisor and the dt_index_advisor command
+    """
+
+    def get_advice(self, *tables):
+        advisor = IndexAdvisor()
+        for dt_config in tables:
+            advisor.add_table(dt_config)
+        return {(item.model, item.fields): item.reasons for item in advisor.get_advice()}, advisor.notes
+
+    def test_existing_indexes(self):
+        indexes = get_existing_indexes(Record)
+        self.assertIn(('id',), indexes)
+        self.assertIn(('code',), indexes)
+        self.assertIn(('category',), indexes)
+
+    def test_ordering_and_search(self):
+        advice, notes = self.get_advice(RecordDataTable)
+        # code已有索引，dt_rowId为主键
+        self.assertEqual(set(advice), {(Record, ('name',)), (Record, ('amount',)), (Record, ('created',))})
+        self.assertIn(('dt-record', 'search created'), advice[(Record, ('created',))])
+        self.assertEqual([note[1].split(':')[0] for note in notes], ['name', 'code'])
+
+    def test_keyset_pagination_needs_composite_index(self):
+        # 共用的fixture使用相同的默认table_id，这里使用各自的table_id以区分建议的来源
+        class OffsetAdvisorDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-advisor-offset'
+                fields = ['name']
+
+        class KeysetAdvisorDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-advisor-keyset'
+                fields = ['name']
+                keyset_pagination = True
+
+        advice, _ = self.get_advice(OffsetAdvisorDataTable, KeysetAdvisorDataTable)
+        # (name, id)同时满足两个table的排序
+        self.assertNotIn((Record, ('name',)), advice)
+        self.assertEqual(advice[(Record, ('name', 'id'))], [
+            ('dt-advisor-offset', 'order by name'), ('dt-advisor-keyset', 'order by name'),
+        ])
+
+    def test_related_column(self):
+        advice, _ = self.get_advice(RelatedRecordDataTable)
+        self.assertIn((Category, ('name',)), advice)
+
+    def test_shadow_table_search_has_no_notes(self):
+        _, notes = self.get_advice(FTSRecordDataTable)
+        self.assertEqual(notes, [])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('dt_index_advisor', '--table', 'dt-aggregate-record', '--explain', stdout=out)
+        self.assertIn('test.Record(created)', out.getvalue())
+        self.assertIn('dt-aggregate-record order by created', out.getvalue())
+
+        out = StringIO()
+        call_command('dt_index_advisor', '--table', 'dt-aggregate-record', '--migration', stdout=out)
+        self.assertIn("models.Index(fields=['created'], name='test_record_created_3dc87b_idx')", out.getvalue())
+
+        with self.assertRaises(SystemExit):
+            call_command('dt_index_advisor', '--table', 'dt-aggregate-record', '--check', stdout=StringIO())
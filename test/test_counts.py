@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.test import TestCase
+
+from datatables_utils.counts import AggregateCount, CachedCount, CappedCount, EstimatedCount, ExactCount
+
+from .models import Record
+from .model_datatables import KeysetRecordDataTable
+
+
+class CountStrategyTestCase(TestCase):
+    """
+    Testcase for count strategies
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([Record(name='record {}'.format(i), amount=i) for i in range(20)])
+
+    def setUp(self):
+        cache.clear()
+        self.queryset = Record.objects.all()
+        self.filter_q = Q(amount__lt=5)
+
+    def test_exact_count(self):
+        with self.assertNumQueries(2):
+            counts = ExactCount().get_counts(KeysetRecordDataTable, self.queryset, self.filter_q)
+        self.assertEqual(counts, (20, 5))
+
+    def test_no_filter_skips_second_count(self):
+        with self.assertNumQueries(1):
+            counts = ExactCount().get_counts(KeysetRecordDataTable, self.queryset)
+        self.assertEqual(counts, (20, 20))
+
+    def test_aggregate_count_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = AggregateCount().get_counts(KeysetRecordDataTable, self.queryset, self.filter_q)
+        self.assertEqual(counts, (20, 5))
+
+    def test_capped_count(self):
+        counts = CappedCount(cap=10).get_counts(KeysetRecordDataTable, self.queryset, self.filter_q)
+        self.assertEqual(counts, (10, 5))
+
+    def test_estimated_count_falls_back_on_sqlite(self):
+        counts = EstimatedCount().get_counts(KeysetRecordDataTable, self.queryset, self.filter_q)
+        self.assertEqual(counts, (20, 5))
+
+    def test_cached_count(self):
+        strategy = CachedCount(timeout=60)
+        counts = strategy.get_counts(KeysetRecordDataTable, self.queryset, self.filter_q, 'x|False')
+        with self.assertNumQueries(0):
+            cached_counts = strategy.get_counts(KeysetRecordDataTable, self.queryset, self.filter_q, 'x|False')
+        self.assertEqual(counts, cached_counts)
+        with self.assertNumQueries(2):
+            strategy.get_counts(KeysetRecordDataTable, self.queryset, self.filter_q, 'y|False')
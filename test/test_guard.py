@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.views import generic
+
+from datatables_utils.guard import CostExceeded, CostGuard, QueryTimeout, get_regex_complexity
+from datatables_utils.query import parse_request
+from datatables_utils.views import AsyncDataTablesMixin, DataTablesListView, DataTablesMixin
+
+from .models import Record
+from .model_datatables import GuardedRecordDataTable, StrictRecordDataTable
+from .test_views import build_http_queryset
+
+
+class RecordListView(DataTablesMixin, generic.ListView):
+    model = Record
+
+
+class AsyncRecordListView(AsyncDataTablesMixin, generic.ListView):
+    model = Record
+
+
+class CostGuardTestCase(SimpleTestCase):
+    """
+    Testcase for CostGuard
+    """
+
+    def test_invalid_statement_timeout(self):
+        for timeout in (0, -1):
+            with self.assertRaises(ValueError):
+                CostGuard(statement_timeout=timeout)
+
+    def test_regex_complexity(self):
+        self.assertEqual(get_regex_complexity('abc'), 0)
+        self.assertEqual(get_regex_complexity('^a[0-9]+(b|c)$'), 3)
+        self.assertIsNone(get_regex_complexity('(a+)+$'))
+        self.assertIsNone(get_regex_complexity('(a|aa){2,}'))
+        self.assertIsNone(get_regex_complexity(r'(a)\1'))
+
+    def test_check_search(self):
+        guard = CostGuard(max_pattern_length=5, max_regex_complexity=2)
+        self.assertEqual(guard.check_search('abc', False), ('abc', False, False))
+        self.assertEqual(guard.check_search('a+b', True), ('a+b', True, False))
+        self.assertEqual(guard.check_search('abcdefg', False), ('abcde', False, False))
+        self.assertEqual(guard.check_search('(a+)+', True), ('(a+)+', False, False))
+        self.assertEqual(guard.check_search('[a', True), ('[a', False, False))
+
+    def test_fallback(self):
+        self.assertEqual(CostGuard(allow_regex=False, fallback='prefix').check_search('a.*', True),
+                         ('a.*', False, True))
+        with self.assertRaises(CostExceeded):
+            CostGuard(allow_regex=False, fallback='error').check_search('a.*', True)
+        with self.assertRaises(ValueError):
+            CostGuard(fallback='ignore')
+
+    def test_apply(self):
+        http_queryset = build_http_queryset(search='x' * 20, **{
+            'columns[1][search][value]': 'a.*b',
+            'columns[1][search][regex]': 'true',
+        })
+        dt_request = parse_request(GuardedRecordDataTable.plan, http_queryset)
+        dt_request = GuardedRecordDataTable.cost_guard.apply(dt_request)
+        self.assertEqual((dt_request.search_value, dt_request.search_regex, dt_request.search_prefix),
+                         ('x' * 8, False, True))
+        column_search = dt_request.column_searches[0]
+        self.assertEqual((column_search.value, column_search.regex, column_search.prefix), ('a.*b', True, False))
+
+
+class CostGuardViewTestCase(TestCase):
+    """
+    Testcase for Meta.cost_guard in DataTablesMixin
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create(
+            [Record(name='record {:03d}'.format(i), code='c{}'.format(i)) for i in range(300)]
+        )
+
+    def get_context(self, dt_config, **kwargs):
+        return RecordListView(dt_config=dt_config).get_json_context_data(build_http_queryset(**kwargs))
+
+    def test_prefix_fallback(self):
+        # 超过长度的搜索内容被截断，并使用前缀搜索
+        context = self.get_context(GuardedRecordDataTable, search='record 01 and more')
+        self.assertEqual(context['recordsFiltered'], 100)
+        self.assertNotIn('error', context)
+        context = self.get_context(GuardedRecordDataTable, search='ecord 01 and more')
+        self.assertEqual(context['recordsFiltered'], 0)
+        # 未超过限制时仍然使用icontains
+        context = self.get_context(GuardedRecordDataTable, search='01')
+        self.assertEqual(context['recordsFiltered'], 13)
+
+    def test_error_fallback(self):
+        http_queryset = build_http_queryset(search='record.*')
+        http_queryset['search[regex]'] = 'true'
+        context = RecordListView(dt_config=StrictRecordDataTable).get_json_context_data(http_queryset)
+        self.assertEqual(context['error'], 'Search pattern is too expensive')
+        self.assertEqual(context['draw'], 1)
+
+    def test_statement_timeout(self):
+        context = self.get_context(StrictRecordDataTable, search='record')
+        self.assertEqual(context, {'error': 'Query timeout'})
+        # progress handler在请求结束后被移除
+        self.assertEqual(Record.objects.filter(name__icontains='record').count(), 300)
+
+    def test_async_statement_timeout(self):
+        view = AsyncRecordListView(dt_config=StrictRecordDataTable)
+        context = async_to_sync(view.aget_json_context_data)(build_http_queryset(search='record'))
+        self.assertEqual(context, {'error': 'Query timeout'})
+
+    def test_limit_statements(self):
+        guard = CostGuard(statement_timeout=0.001)
+        with self.assertRaises(QueryTimeout):
+            with guard.limit_statements(connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000000) '
+                        'SELECT COUNT(*) FROM n'
+                    )
+
+    def test_timeout_is_per_statement(self):
+        guard = CostGuard(statement_timeout=0.05)
+        with guard.limit_statements(connection.alias):
+            time.sleep(0.1)
+            # 之前经过的时间不计入之后的查询
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000) '
+                    'SELECT COUNT(*) FROM n'
+                )
+                self.assertEqual(cursor.fetchone(), (1000,))
+
+    def test_export_statement_timeout(self):
+        view = DataTablesListView.as_view(model=Record, dt_config=StrictRecordDataTable)
+        response = view(RequestFactory().get('/', build_http_queryset(dt_export='csv', search='record')))
+        with self.assertRaises(QueryTimeout):
+            b''.join(response.streaming_content)
@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 
-from django.test import TestCase
+import datetime
+
+from django.test import TestCase, override_settings
 from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
 
 from datatables_utils.utils import ModelDataTable, DataTablesColumn
 
-from .models import TestModel
-from . model_datatables import DeclaredModelDataTable
+from .models import Record, TestModel
+from . model_datatables import DeclaredModelDataTable, RecordDataTable
 
 
 class ModelDataTableTestCase(TestCase):
@@ -40,6 +43,28 @@ class ModelDataTableTestCase(TestCase):
     def test_get_field_from_meta(self):
         pass
 
+    def test_max_length_on_non_text_column(self):
+        class NumericPreviewDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-numeric-preview'
+                fields = ['amount']
+                max_lengths = {'amount': 3}
+
+        with self.assertRaises(ImproperlyConfigured):
+            NumericPreviewDataTable.bind_fields()
+
+    def test_sum_on_non_numeric_column(self):
+        class TextSumDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-text-sum'
+                fields = ['name']
+                aggregates = {'name': ['sum']}
+
+        with self.assertRaises(ImproperlyConfigured):
+            TextSumDataTable.bind_fields()
+
     def test_datatablescolumn_initial_properly(self):
         dt_column = DeclaredModelDataTable.columns['field_1']
         self.assertTrue(isinstance(dt_column, DataTablesColumn))
@@ -53,3 +78,56 @@ class ModelDataTableTestCase(TestCase):
         pk_column = DeclaredModelDataTable.pk_column
         model_id_field = TestModel._meta.get_field('id')
         self.assertIs(pk_column._field, model_id_field)
+
+
+class DataTablesColumnSearchTestCase(TestCase):
+    """
+    Testcase for type-aware lookups of DataTablesColumn
+    """
+
+    def get_q(self, column_name, pattern, is_regex=False):
+        return RecordDataTable.columns[column_name].get_filter_q_object(pattern, is_regex)
+
+    def test_text_lookups(self):
+        self.assertEqual(self.get_q('name', 'abc'), Q(name__icontains='abc'))
+        self.assertEqual(self.get_q('name', 'a.c', True), Q(name__iregex='a.c'))
+        # 普通的索引不能用于istartswith，有索引的文本列仍然使用icontains
+        self.assertEqual(self.get_q('code', 'abc'), Q(code__icontains='abc'))
+
+    def test_prefix_search(self):
+        class PrefixRecordDataTable(ModelDataTable):
+            code = DataTablesColumn(prefix_search=True)
+
+            class Meta:
+                model = Record
+                fields = ['name']
+
+        self.assertEqual(PrefixRecordDataTable.columns['code'].get_filter_q_object('abc', False),
+                         Q(code__istartswith='abc'))
+        self.assertEqual(PrefixRecordDataTable.columns['name'].get_filter_q_object('abc', False),
+                         Q(name__icontains='abc'))
+
+    def test_not_applicable_returns_empty_q(self):
+        column = DataTablesColumn(searchable=False)
+        # 外部代码可以直接对各列的结果进行OR操作
+        self.assertEqual(column.get_filter_q_object('abc', False), Q())
+        self.assertEqual(self.get_q('amount', 'abc') | self.get_q('name', 'abc'), Q(name__icontains='abc'))
+
+    def test_number_lookups(self):
+        self.assertEqual(self.get_q('amount', '12'), Q(amount=12))
+        self.assertEqual(self.get_q('amount', '1..5'), Q(amount__gte=1, amount__lte=5))
+        self.assertEqual(self.get_q('amount', '..5'), Q(amount__lte=5))
+        self.assertEqual(self.get_q('amount', 'abc'), Q())
+        self.assertEqual(self.get_q('amount', '1.', True), Q())
+
+    @override_settings(USE_TZ=False)
+    def test_datetime_lookups(self):
+        self.assertEqual(
+            self.get_q('created', '2017-08-21'),
+            Q(created__gte=datetime.datetime(2017, 8, 21), created__lt=datetime.datetime(2017, 8, 22))
+        )
+        self.assertEqual(
+            self.get_q('created', '2017-08-01..2017-08-21'),
+            Q(created__gte=datetime.datetime(2017, 8, 1), created__lt=datetime.datetime(2017, 8, 22))
+        )
+        self.assertEqual(self.get_q('created', 'abc'), Q())
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from django.http import QueryDict
+from django.test import SimpleTestCase
+
+from datatables_utils.query import InvalidRequest, OrderSpec, TablePlan, parse_request
+
+from .model_datatables import RecordDataTable
+
+
+class ParseRequestTestCase(SimpleTestCase):
+    """
+    Testcase for TablePlan and parse_request
+    """
+
+    def parse(self, query_string, plan=None):
+        return parse_request(plan or RecordDataTable.plan, QueryDict(query_string))
+
+    def test_plan(self):
+        plan = RecordDataTable.plan
+        self.assertEqual([c.name for c in plan.columns[:2]], ['name', 'amount'])
+        self.assertEqual(plan.pk_name, 'pk')
+        with self.assertRaises(AttributeError):
+            plan.pk_name = 'id'
+
+    def test_multi_column_ordering_with_tiebreaker(self):
+        dt_request = self.parse(
+            'draw=1&order[0][column]=1&order[0][dir]=desc&order[1][column]=0&order[1][dir]=asc'
+        )
+        self.assertEqual(dt_request.ordering, (
+            OrderSpec('amount', True), OrderSpec('name', False), OrderSpec('pk', False)
+        ))
+
+    def test_page_length_cap(self):
+        plan = TablePlan.from_table(RecordDataTable, max_page_length=50)
+        self.assertEqual(self.parse('draw=1&start=0&length=-1', plan).length, 50)
+        self.assertEqual(self.parse('draw=1&start=0&length=100000', plan).length, 50)
+        self.assertEqual(self.parse('draw=1&start=0&length=20', plan).length, 20)
+        plan = TablePlan.from_table(RecordDataTable, max_page_length=None)
+        self.assertEqual(self.parse('draw=1&start=0&length=-1', plan).length, -1)
+
+    def test_invalid_arguments(self):
+        for query_string in [
+            'draw=x',
+            'start=0',
+            'draw=1&start=-1',
+            'draw=1&length=-2',
+            'draw=1&order[0][column]=100',
+            'draw=1&order[0][column]=0&order[0][dir]=sideways',
+        ]:
+            with self.assertRaises(InvalidRequest):
+                self.parse(query_string)
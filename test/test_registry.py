@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from datatables_utils.checks import check_shared_caches, check_tables
+from datatables_utils.registry import TableRegistry, registry
+from datatables_utils.utils import ModelDataTable, DataTablesColumn
+
+from .models import Record
+from .model_datatables import CachedRecordDataTable, DeltaRecordDataTable, RecordDataTable
+
+
+class TableRegistryTestCase(SimpleTestCase):
+    """
+    Testcase for the table registry and lazy field binding
+    """
+
+    def test_fields_are_bound_on_first_access(self):
+        class LazyRecordDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                fields = ['name']
+                table_id = 'dt-lazy-record'
+
+        self.assertFalse(LazyRecordDataTable.__dict__['_fields_bound'])
+        self.assertEqual(list(LazyRecordDataTable.columns), ['name'])
+        self.assertTrue(LazyRecordDataTable.__dict__['_fields_bound'])
+        self.assertIs(LazyRecordDataTable.plan, LazyRecordDataTable.__dict__['plan'])
+
+    def test_configuration_error_is_deferred_and_checked(self):
+        class BrokenRecordDataTable(ModelDataTable):
+            category = DataTablesColumn(display_field='not_exist')
+
+            class Meta:
+                model = Record
+                table_id = 'dt-broken-record'
+
+        errors = [e for e in check_tables(None) if e.obj is BrokenRecordDataTable]
+        self.assertEqual([e.id for e in errors], ['datatables_utils.E001'])
+        with self.assertRaises(ImproperlyConfigured):
+            BrokenRecordDataTable.columns
+
+    def test_table_id_collision(self):
+        table_registry = TableRegistry()
+
+        class FirstDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-collision'
+
+        class SecondDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-collision'
+
+        table_registry.register(FirstDataTable)
+        self.assertIs(table_registry.get('dt-collision'), FirstDataTable)
+        table_registry.register(SecondDataTable)
+        self.assertEqual(table_registry.get_collisions(), {'dt-collision': [FirstDataTable, SecondDataTable]})
+        with self.assertRaises(ImproperlyConfigured):
+            table_registry.get('dt-collision')
+        with self.assertRaises(LookupError):
+            table_registry.get('dt-not-exist')
+
+    def test_only_declared_table_id_collision_is_warned(self):
+        class DeclaredDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-declared-collision'
+
+        class OtherDeclaredDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-declared-collision'
+
+        warned = [e.msg.split()[1] for e in check_tables(None) if e.id == 'datatables_utils.W001']
+        self.assertIn('dt-declared-collision', warned)
+        # 同一个model的多个table使用默认的table_id('dt-record')是正常的用法，只在查找时出错
+        self.assertNotIn('dt-record', warned)
+        with self.assertRaises(ImproperlyConfigured):
+            registry.get('dt-record')
+
+    def test_get_for_model_is_cached(self):
+        path = 'test.model_datatables.RecordDataTable'
+        with mock.patch.object(Record, 'datatables_class', path, create=True):
+            registry.clear_cache()
+            with mock.patch('datatables_utils.registry.import_string', return_value=RecordDataTable) as m:
+                self.assertIs(registry.get_for_model(Record), RecordDataTable)
+                self.assertIs(registry.get_for_model(Record), RecordDataTable)
+            self.assertEqual(m.call_count, 1)
+        registry.clear_cache()
+        with self.assertRaises(ImproperlyConfigured):
+            registry.get_for_model(Record)
+
+    def test_process_local_cache_is_warned(self):
+        warned = {e.obj for e in check_shared_caches(None) if e.id == 'datatables_utils.W002'}
+        self.assertIn(CachedRecordDataTable, warned)
+        self.assertIn(DeltaRecordDataTable, warned)
+        self.assertNotIn(RecordDataTable, warned)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertEqual(check_shared_caches(None), [])
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+
+from datatables_utils.search import ColumnSearchBackend
+
+from .models import Record
+from .model_datatables import FTSRecordDataTable, KeysetRecordDataTable
+
+
+class SearchBackendTestCase(TestCase):
+    """
+    Testcase for search backends
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([
+            Record(name='red apple'),
+            Record(name='green apple'),
+            Record(name='red cherry'),
+        ])
+
+    def search(self, dt_config, backend, pattern, is_regex=False):
+        q = backend.get_filter_q_object(dt_config, pattern, is_regex)
+        return sorted(Record.objects.filter(q).values_list('name', flat=True))
+
+    def test_column_backend_keeps_whole_pattern(self):
+        backend = ColumnSearchBackend()
+        self.assertEqual(self.search(KeysetRecordDataTable, backend, 'red apple'), ['red apple'])
+        self.assertEqual(self.search(KeysetRecordDataTable, backend, 'apple red'), [])
+
+    def test_column_backend_tokenize(self):
+        backend = ColumnSearchBackend(tokenize=True)
+        self.assertEqual(self.search(KeysetRecordDataTable, backend, 'apple red'), ['red apple'])
+
+    def test_fts5_backend(self):
+        backend = FTSRecordDataTable.search_backend
+        self.assertEqual(self.search(FTSRecordDataTable, backend, 'app'), ['green apple', 'red apple'])
+        self.assertEqual(self.search(FTSRecordDataTable, backend, 'red app'), ['red apple'])
+
+    def test_fts5_backend_kept_in_sync(self):
+        backend = FTSRecordDataTable.search_backend
+        record = Record.objects.get(name='red cherry')
+        record.name = 'yellow banana'
+        record.save()
+        Record.objects.filter(name='green apple').delete()
+        Record.objects.create(name='yellow lemon')
+        self.assertEqual(self.search(FTSRecordDataTable, backend, 'red'), ['red apple'])
+        self.assertEqual(self.search(FTSRecordDataTable, backend, 'yellow'), ['yellow banana', 'yellow lemon'])
+
+    def test_fts5_backend_quotes_terms(self):
+        backend = FTSRecordDataTable.search_backend
+        self.assertEqual(self.search(FTSRecordDataTable, backend, '"red OR'), [])
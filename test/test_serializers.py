@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import decimal
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.test import SimpleTestCase
+
+from datatables_utils.serializers import RowSerializer, fast_json_dumps, get_value_converter
+
+
+class RowSerializerTestCase(SimpleTestCase):
+    """
+    Testcase for value converters and RowSerializer
+    """
+
+    def test_converters_match_django_json_encoder(self):
+        values = [
+            (models.DateTimeField(), datetime.datetime(2017, 8, 21, 10, 30, 15, 123456)),
+            (models.DateTimeField(), datetime.datetime(2017, 8, 21, 10, 30, tzinfo=datetime.timezone.utc)),
+            (models.DateField(), datetime.date(2017, 8, 21)),
+            (models.TimeField(), datetime.time(10, 30, 15, 123456)),
+            (models.DurationField(), datetime.timedelta(days=1, seconds=5)),
+            (models.DecimalField(), decimal.Decimal('1.50')),
+        ]
+        for field, value in values:
+            converter = get_value_converter(field)
+            self.assertEqual(converter(value), json.loads(json.dumps(value, cls=DjangoJSONEncoder)))
+        self.assertIsNone(get_value_converter(models.CharField()))
+
+    def test_serialize(self):
+        converters = {'price': str}
+        rows = [('apple', decimal.Decimal('1.50')), ('banana', None)]
+        serializer = RowSerializer(['name', 'price'], converters)
+        self.assertEqual(serializer.serialize(rows), [
+            {'name': 'apple', 'price': '1.50'}, {'name': 'banana', 'price': None},
+        ])
+        serializer = RowSerializer(['name', 'price'], converters, wire_format='array')
+        self.assertEqual(serializer.serialize(rows), [['apple', '1.50'], ['banana', None]])
+
+    def test_fast_json_dumps(self):
+        value = {'data': [['apple', decimal.Decimal('1.5')]], 'recordsTotal': 1}
+        self.assertEqual(json.loads(fast_json_dumps(value)), {'data': [['apple', '1.5']], 'recordsTotal': 1})
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import json
+import re
+
+from django.template import Context, Template
+from django.test import TestCase
+
+from datatables_utils.templatetags.datatables_widget import json_filter
+
+from .models import Record
+from .model_datatables import (
+    AggregateRecordDataTable, ArrayRecordDataTable, DeltaRecordDataTable, KeysetRecordDataTable, RecordDataTable,
+)
+from .test_views import RecordListView
+
+
+TEMPLATE = Template(
+    '{% load datatables_widget %}'
+    '{% render_table dt_config defer_loading=True %}'
+    '{% render_js_script dt_config defer_loading=True %}'
+)
+
+
+class DeferLoadingTestCase(TestCase):
+    """
+    Testcase for the defer_loading option of render_table and render_js_script
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([Record(name='record {:02d}'.format(i), amount=i) for i in range(15)])
+
+    def render(self, dt_config):
+        view = RecordListView(dt_config=dt_config)
+        return TEMPLATE.render(Context({'view': view, 'dt_config': dt_config}))
+
+    def get_config(self, html):
+        return json.loads(re.search(r'var dt_config = (.*);', html).group(1))
+
+    def test_first_page_is_embedded(self):
+        # count以及第一页的查询只进行一次
+        with self.assertNumQueries(2):
+            html = self.render(RecordDataTable)
+        self.assertEqual(self.get_config(html)['deferLoading'], [15, 15])
+        self.assertEqual(html.count('<tr id='), 10)
+        first = Record.objects.order_by('name').first()
+        self.assertIn('<tr id="{}">'.format(first.pk), html)
+        self.assertIn('<td>record 00</td>', html)
+
+    def test_array_wire_format(self):
+        html = self.render(ArrayRecordDataTable)
+        self.assertEqual(html.count('<tr id='), 10)
+        self.assertIn('<td>record 00</td>', html)
+
+    def test_aggregate_footer(self):
+        html = self.render(AggregateRecordDataTable)
+        self.assertIn('<tr data-dt-aggregate="sum">', html)
+        self.assertIn('<th data-dt-column="amount">105</th>', html)
+        # 第一列没有该聚合时显示聚合函数的名称
+        self.assertIn('<th>最大</th>', html)
+        self.assertIn("on('xhr.dt'", html)
+
+    def test_keyset_cursor(self):
+        html = self.render(KeysetRecordDataTable)
+        self.assertRegex(html, r'var dt_cursor = "[^"]+";')
+
+    def test_delta_refresh_version(self):
+        html = self.render(DeltaRecordDataTable)
+        self.assertIn("register('deltaReload()'", html)
+        self.assertRegex(html, r'var dt_initial_version = \d+;')
+        self.assertNotIn('deltaReload', self.render(RecordDataTable))
+
+    def test_without_view(self):
+        html = TEMPLATE.render(Context({'dt_config': RecordDataTable}))
+        self.assertNotIn('deferLoading', html)
+        self.assertNotIn('<tbody>', html)
+
+    def test_json_filter_escapes_script(self):
+        self.assertEqual(json_filter('</script>'), '"\\u003C/script\\u003E"')
+
+    def test_batch_url(self):
+        template = Template('{% load datatables_widget %}{% render_js_script dt_config batch_url="/batch/" %}')
+        html = template.render(Context({'dt_config': KeysetRecordDataTable}))
+        self.assertIn('window.dt_batch.request("/batch/", "{}"'.format(KeysetRecordDataTable.table_id), html)
@@ -0,0 +1,875 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import gzip
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.http import HttpResponse, QueryDict
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.views import generic
+
+from datatables_utils.cache import DeltaRefresh, ResponseCache
+from datatables_utils.counts import CachedCount
+from datatables_utils.instrumentation import dt_request_finished
+from datatables_utils.query import parse_request
+from datatables_utils.routing import WRITE_COOKIE_NAME, ReadRouting, ReadYourWritesMiddleware, mark_write
+from datatables_utils.utils import ModelDataTable
+from datatables_utils.views import AsyncDataTablesListView, DataTablesBatchView, DataTablesListView, DataTablesMixin
+
+from .models import Category, Record
+from .model_datatables import (
+    AggregateRecordDataTable, ArrayRecordDataTable, CachedRecordDataTable, ClientSideRecordDataTable,
+    DeltaRecordDataTable, KeysetRecordDataTable,
+    PreviewRecordDataTable, RecordDataTable, RelatedRecordDataTable, SingleQueryAggregateRecordDataTable,
+    UpdatedFieldRecordDataTable,
+)
+
+
+def build_http_queryset(start=0, length=10, order_column=0, order_dir='asc', search='', **extra):
+    http_queryset = QueryDict(mutable=True)
+    http_queryset.update({
+        'draw': '1',
+        'start': str(start),
+        'length': str(length),
+        'order[0][column]': str(order_column),
+        'order[0][dir]': order_dir,
+        'search[value]': search,
+        'search[regex]': 'false',
+    })
+    for key, value in extra.items():
+        http_queryset[key] = value
+    return http_queryset
+
+
+class RecordListView(DataTablesMixin, generic.ListView):
+    model = Record
+
+
+class KeysetPaginationTestCase(TestCase):
+    """
+    Testcase for keyset pagination in DataTablesMixin
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        # amount有重复值，用于检验pk tiebreaker
+        Record.objects.bulk_create(
+            [Record(name='record {:02d}'.format(i), amount=i % 7) for i in range(30)]
+        )
+
+    def get_context(self, **kwargs):
+        view = RecordListView(dt_config=KeysetRecordDataTable)
+        return view.get_json_context_data(build_http_queryset(**kwargs))
+
+    def get_expected_pks(self, order_by):
+        return list(Record.objects.order_by(*order_by).values_list('pk', flat=True))
+
+    def test_seek_forward_matches_offset(self):
+        expected = self.get_expected_pks(['-amount', 'pk'])
+        cursor = None
+        for start in range(0, 30, 10):
+            extra = {'cursor': cursor} if cursor else {}
+            with CaptureQueriesContext(connection) as queries:
+                context = self.get_context(start=start, order_column=1, order_dir='desc', **extra)
+            self.assertEqual(len(queries), 2)
+            self.assertNotIn('OFFSET', queries[-1]['sql'])
+            self.assertEqual([row['pk'] for row in context['data']], expected[start:start + 10])
+            cursor = context['cursor']
+
+    def test_seek_backward_matches_offset(self):
+        expected = self.get_expected_pks(['name', 'pk'])
+        cursor = self.get_context(start=20)['cursor']
+        context = self.get_context(start=10, cursor=cursor)
+        self.assertEqual([row['pk'] for row in context['data']], expected[10:20])
+
+    def walk(self, order_column, length=5):
+        pks, cursor = [], None
+        for start in range(0, Record.objects.count(), length):
+            extra = {'cursor': cursor} if cursor else {}
+            context = self.get_context(start=start, length=length, order_column=order_column, order_dir='desc', **extra)
+            pks.extend(row['pk'] for row in context['data'])
+            cursor = context.get('cursor')
+        return pks
+
+    def test_seek_keeps_microseconds(self):
+        # 同一毫秒内的多行
+        base = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        for index, record in enumerate(Record.objects.order_by('pk')):
+            record.updated = base + datetime.timedelta(microseconds=100 * index)
+            record.save()
+        self.assertEqual(self.walk(order_column=3), self.get_expected_pks(['-updated', 'pk']))
+
+    def test_nullable_order_column_uses_offset(self):
+        self.assertIn('created', KeysetRecordDataTable.plan.nullable)
+        base = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        for record in Record.objects.all():
+            if record.pk % 3:
+                record.created = base + datetime.timedelta(seconds=record.pk)
+                record.save()
+        self.assertEqual(self.walk(order_column=2), self.get_expected_pks(['-created', 'pk']))
+
+    def test_invalid_cursor_falls_back_to_offset(self):
+        expected = self.get_expected_pks(['name', 'pk'])
+        cursor = self.get_context(start=0, order_dir='desc')['cursor']
+        for bad_cursor in [cursor, 'not-a-cursor']:
+            context = self.get_context(start=10, cursor=bad_cursor)
+            self.assertEqual([row['pk'] for row in context['data']], expected[10:20])
+
+
+class ColumnSearchTestCase(TestCase):
+    """
+    Testcase for global and per-column search in DataTablesMixin
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([
+            Record(name='apple', amount=3, code='A1'),
+            Record(name='apple pie', amount=12, code='B1'),
+            Record(name='banana', amount=12, code='A2'),
+        ])
+
+    def get_names(self, **kwargs):
+        view = RecordListView(dt_config=RecordDataTable)
+        context = view.get_json_context_data(build_http_queryset(**kwargs))
+        return [row['name'] for row in context['data']]
+
+    def test_global_search_uses_typed_lookups(self):
+        self.assertEqual(self.get_names(search='12'), ['apple pie', 'banana'])
+        self.assertEqual(self.get_names(search='a1'), ['apple'])
+
+    def test_column_search(self):
+        self.assertEqual(self.get_names(**{'columns[1][search][value]': '10..20'}), ['apple pie', 'banana'])
+        self.assertEqual(self.get_names(**{
+            'columns[0][search][value]': 'apple',
+            'columns[1][search][value]': '12',
+        }), ['apple pie'])
+        self.assertEqual(self.get_names(**{'columns[1][search][value]': 'abc'}), [])
+
+
+    def test_regex_search_key_keeps_case(self):
+        class CachedCountRecordDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-cached-count-record'
+                fields = ['name', 'code']
+                count_strategy = CachedCount(timeout=60)
+
+        cache.clear()
+        view = RecordListView(dt_config=CachedCountRecordDataTable)
+        for pattern, expected in [(r'^\D+$', 3), (r'^\d+$', 0)]:
+            context = view.get_json_context_data(build_http_queryset(**{
+                'columns[0][search][value]': pattern, 'columns[0][search][regex]': 'true',
+            }))
+            self.assertEqual(context['recordsFiltered'], expected)
+            self.assertEqual(len(context['data']), expected)
+        # 普通文本搜索不区分大小写，可以共用同一个key
+        keys = [
+            view.get_filter_q_object(parse_request(CachedCountRecordDataTable.plan, build_http_queryset(search=value)))[1]
+            for value in ['APPLE', 'apple']
+        ]
+        self.assertEqual(keys[0], keys[1])
+
+
+class ResponseCacheTestCase(TestCase):
+    """
+    Testcase for the response cache of DataTablesMixin
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([Record(name='record {}'.format(i), amount=i) for i in range(5)])
+
+    def setUp(self):
+        cache.clear()
+
+    def get_response(self, **kwargs):
+        view = RecordListView(dt_config=CachedRecordDataTable)
+        response = view.get_json_response(build_http_queryset(**kwargs))
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_cached_response_patches_draw(self):
+        first = self.get_response(draw='1')
+        with self.assertNumQueries(0):
+            second = self.get_response(draw='2')
+        self.assertEqual(first['draw'], 1)
+        self.assertEqual(second['draw'], 2)
+        self.assertEqual(first['data'], second['data'])
+        self.assertEqual(second['recordsTotal'], 5)
+
+    def test_model_change_invalidates_cache(self):
+        self.get_response()
+        Record.objects.create(name='record 5', amount=5)
+        self.assertEqual(self.get_response()['recordsTotal'], 6)
+        Record.objects.filter(name='record 5').delete()
+        self.assertEqual(self.get_response()['recordsTotal'], 5)
+
+    def test_invalid_request(self):
+        response = self.get_response(draw='3', length='abc')
+        self.assertEqual(response['draw'], 3)
+        self.assertIn('error', response)
+
+    def test_concurrent_misses_are_coalesced(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'recordsTotal': 1}, True
+
+        response_cache = ResponseCache()
+        results = []
+        leader = threading.Thread(target=lambda: results.append(response_cache.get_body('key', compute)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(response_cache.get_body('key', compute)))
+        follower.start()
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['{"recordsTotal": 1}'] * 2)
+
+
+class ExportTestCase(TestCase):
+    """
+    Testcase for streaming export in DataTablesListView
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([
+            Record(name='apple', amount=3),
+            Record(name='apple pie', amount=12),
+            Record(name='banana', amount=7),
+        ])
+
+    def export(self, export_format, **kwargs):
+        view = DataTablesListView.as_view(model=Record, dt_config=RecordDataTable)
+        http_queryset = build_http_queryset(dt_export=export_format, **kwargs)
+        response = view(RequestFactory().get('/', http_queryset))
+        content = b''.join(response.streaming_content).decode('utf-8') if response.streaming else None
+        return response, content
+
+    def test_csv_export_uses_search_and_order(self):
+        response, content = self.export('csv', search='apple', order_column=1, order_dir='desc', length='1')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], ','.join(RecordDataTable.get_titles()))
+        self.assertEqual([line.split(',')[:2] for line in lines[1:]], [['apple pie', '12'], ['apple', '3']])
+
+    def test_ndjson_export(self):
+        response, content = self.export('ndjson', order_column=1)
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['apple', 'banana', 'apple pie'])
+
+    def test_unsupported_format(self):
+        response, content = self.export('xlsx')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(USE_TZ=False)
+class WireFormatTestCase(TestCase):
+    """
+    Testcase for wire formats and row serialization
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.record = Record.objects.create(name='apple', amount=3, created=datetime.datetime(2017, 8, 21, 10, 30))
+
+    def get_response(self, dt_config):
+        view = RecordListView(dt_config=dt_config)
+        response = view.get_json_response(build_http_queryset())
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_object_format(self):
+        response = self.get_response(RecordDataTable)
+        self.assertEqual(response['data'], [{
+            'name': 'apple', 'amount': 3, 'code': '', 'created': '2017-08-21T10:30:00', 'pk': self.record.pk,
+        }])
+
+    def test_array_format(self):
+        response = self.get_response(ArrayRecordDataTable)
+        self.assertEqual(response['data'], [['apple', 3, '2017-08-21T10:30:00', self.record.pk]])
+        dt_config = ArrayRecordDataTable.get_dt_config()
+        self.assertEqual([c['data'] for c in dt_config['columns']], [0, 1, 2])
+        self.assertEqual(dt_config['rowId'], 3)
+
+
+class HiddenColumnTestCase(TestCase):
+    """
+    Testcase for columns hidden on the client side
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        fruit = Category.objects.create(name='fruit')
+        cls.record = Record.objects.create(name='apple', amount=3, category=fruit)
+        Record.objects.create(name='pear', amount=5, category=fruit)
+
+    def get_context(self, dt_config, **kwargs):
+        view = RecordListView(dt_config=dt_config)
+        with CaptureQueriesContext(connection) as queries:
+            context = view.get_json_context_data(build_http_queryset(**kwargs))
+        return context, queries
+
+    def test_hidden_columns_are_not_fetched(self):
+        context, queries = self.get_context(
+            RecordDataTable, search='apple', order_column=1, **{'columns[0][visible]': 'false'}
+        )
+        self.assertEqual(context['data'], [{'amount': 3, 'code': '', 'created': None, 'pk': self.record.pk}])
+        page_sql = queries[-1]['sql']
+        self.assertNotIn('"name"', page_sql.split(' FROM ')[0])
+
+    def test_array_format_keeps_positions(self):
+        context, _ = self.get_context(ArrayRecordDataTable, length=1, **{'columns[1][visible]': 'false'})
+        self.assertEqual(context['data'], [['apple', None, None, self.record.pk]])
+
+    def test_hidden_computed_column_is_not_resolved(self):
+        context, queries = self.get_context(RelatedRecordDataTable, **{
+            'columns[1][visible]': 'false', 'columns[2][visible]': 'false',
+        })
+        # count以及page，不join关联表，也不调用resolver
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('JOIN', queries[-1]['sql'])
+        self.assertEqual(context['data'][0], {'name': 'apple', 'pk': self.record.pk})
+
+    @mock.patch('datatables_utils.utils.ROW_SERIALIZER_CACHE_SIZE', 4)
+    def test_row_serializer_cache_is_bounded(self):
+        # 客户端可以提交任意的隐藏列组合
+        for mask in range(16):
+            self.get_context(RecordDataTable, **{
+                'columns[{}][visible]'.format(index): 'false' for index in range(4) if mask & (1 << index)
+            })
+        self.assertEqual(len(RecordDataTable._row_serializers), 4)
+        context, _ = self.get_context(RecordDataTable, length=1)
+        self.assertEqual(set(context['data'][0]), {'name', 'amount', 'code', 'created', 'pk'})
+
+    def test_keyset_fetches_hidden_order_column(self):
+        context, _ = self.get_context(
+            KeysetRecordDataTable, order_column=1, order_dir='desc', **{'columns[1][visible]': 'false'}
+        )
+        self.assertEqual([row['name'] for row in context['data']], ['pear', 'apple'])
+        self.assertIn('cursor', context)
+
+
+class PreviewColumnTestCase(TestCase):
+    """
+    Testcase for DataTablesColumn.max_length
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([
+            Record(name='long', code='abcdef', notes='0123456789' * 1000 + 'needle'),
+            Record(name='short', code='abc', notes='tiny'),
+        ])
+
+    def get_context(self, **kwargs):
+        view = RecordListView(dt_config=PreviewRecordDataTable)
+        return view.get_json_context_data(build_http_queryset(**kwargs))
+
+    def test_values_are_truncated_in_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            context = self.get_context(order_column=1)
+        self.assertEqual(
+            [(row['code'], row['notes']) for row in context['data']],
+            [('abc\u2026', '0123456789\u2026'), ('abc', 'tiny')],
+        )
+        self.assertIn('SUBSTR', queries[-1]['sql'].upper())
+
+    def test_search_and_order_use_full_values(self):
+        context = self.get_context(search='needle')
+        self.assertEqual([row['name'] for row in context['data']], ['long'])
+        # 截断列作为keyset分页的排序列时，cursor使用完整的值
+        context = self.get_context(order_column=2, order_dir='desc', length=1)
+        self.assertEqual(context['data'][0]['notes'], 'tiny')
+        self.assertEqual(set(context['data'][0]), {'code', 'name', 'notes', 'pk'})
+        context = self.get_context(order_column=2, order_dir='desc', start=1, length=1, cursor=context['cursor'])
+        self.assertEqual(context['data'][0]['name'], 'long')
+
+    def test_export_uses_full_values(self):
+        response = RecordListView(dt_config=PreviewRecordDataTable).get_export_response(
+            build_http_queryset(order_column=1), 'ndjson'
+        )
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertTrue(records[0]['notes'].endswith('needle'))
+
+
+class AggregateTestCase(TestCase):
+    """
+    Testcase for footer aggregates computed with recordsFiltered
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([
+            Record(name='apple', amount=3, created=datetime.datetime(2017, 8, 21, tzinfo=datetime.timezone.utc)),
+            Record(name='apricot', amount=5),
+            Record(name='pear', amount=10, created=datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)),
+        ])
+
+    def get_context(self, dt_config, **kwargs):
+        view = RecordListView(dt_config=dt_config)
+        with CaptureQueriesContext(connection) as queries:
+            context = view.get_json_context_data(build_http_queryset(**kwargs))
+        return context, queries
+
+    def test_aggregates_without_search(self):
+        context, queries = self.get_context(AggregateRecordDataTable)
+        # 计数与聚合值在同一条查询中，加上当前页的查询
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(context['recordsTotal'], 3)
+        self.assertEqual(context['aggregates'], {
+            'amount': {'sum': 18, 'avg': 6.0}, 'created': {'max': '2018-01-01T00:00:00Z'},
+        })
+
+    def test_aggregates_over_filtered_rows(self):
+        context, queries = self.get_context(AggregateRecordDataTable, search='ap', length=1)
+        self.assertEqual(len(queries), 3)
+        self.assertEqual((context['recordsTotal'], context['recordsFiltered']), (3, 2))
+        self.assertEqual(context['aggregates']['amount'], {'sum': 8, 'avg': 4.0})
+        self.assertIn('SUM', queries[1]['sql'])
+
+    def test_aggregate_count_single_query(self):
+        context, queries = self.get_context(SingleQueryAggregateRecordDataTable, search='pear')
+        self.assertEqual(len(queries), 2)
+        self.assertEqual((context['recordsTotal'], context['recordsFiltered']), (3, 1))
+        self.assertEqual(context['aggregates'], {'amount': {'sum': 10, 'min': 10}})
+
+    def test_hidden_column_is_not_aggregated(self):
+        context, _ = self.get_context(AggregateRecordDataTable, **{'columns[0][visible]': 'false'})
+        self.assertEqual(list(context['aggregates']), ['created'])
+
+
+if 'replica' in settings.DATABASES:
+    class ReplicaRecordDataTable(ModelDataTable):
+        class Meta:
+            model = Record
+            table_id = 'dt-replica-record'
+            fields = ['name']
+            read_routing = ReadRouting(using='replica', count_using='default', read_your_writes=60)
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, 'Requires a "replica" database alias')
+class ReadRoutingTestCase(TestCase):
+    """
+    Testcase for Meta.read_routing
+    """
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([Record(name='apple'), Record(name='pear'), Record(name='plum')])
+        Record.objects.using('replica').bulk_create([Record(name='apple')])
+
+    def get_context(self, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        view = RecordListView(dt_config=ReplicaRecordDataTable, request=request)
+        return view.get_json_context_data(build_http_queryset())
+
+    def test_page_and_counts_use_their_aliases(self):
+        context = self.get_context()
+        self.assertEqual(context['recordsTotal'], 3)
+        self.assertEqual([row['name'] for row in context['data']], ['apple'])
+
+    def test_recent_write_reads_primary(self):
+        response = HttpResponse()
+        mark_write(response)
+        context = self.get_context({WRITE_COOKIE_NAME: response.cookies[WRITE_COOKIE_NAME].value})
+        self.assertEqual(context['recordsTotal'], 3)
+        self.assertEqual(len(context['data']), 3)
+
+    def test_expired_write_reads_replica(self):
+        response = HttpResponse()
+        mark_write(response, timestamp=time.time() - 120)
+        context = self.get_context({WRITE_COOKIE_NAME: response.cookies[WRITE_COOKIE_NAME].value})
+        self.assertEqual(len(context['data']), 1)
+
+    def test_recent_model_write_bypasses_replica_for_cached_responses(self):
+        class CachedReplicaRecordDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-cached-replica-record'
+                fields = ['name']
+                read_routing = ReadRouting(using='replica', replication_lag=5)
+                response_cache = ResponseCache()
+
+        def get_names(**kwargs):
+            view = RecordListView(dt_config=CachedReplicaRecordDataTable, request=RequestFactory().get('/'))
+            response = view.get_json_response(build_http_queryset(**kwargs))
+            return [row['name'] for row in json.loads(response.content.decode('utf-8'))['data']]
+
+        cache.clear()
+        self.assertEqual(get_names(), ['apple'])
+        Record.objects.create(name='quince')
+        # 没有进行写操作的用户在replication_lag内也读取primary，缓存中不会保存replica上的旧数据
+        self.assertEqual(get_names(), ['apple', 'pear', 'plum', 'quince'])
+        with mock.patch('datatables_utils.routing.time.time', return_value=time.time() + 10):
+            self.assertEqual(get_names(length=5), ['apple'])
+
+    def test_middleware_marks_successful_writes(self):
+        middleware = ReadYourWritesMiddleware(lambda request: HttpResponse())
+        self.assertIn(WRITE_COOKIE_NAME, middleware(RequestFactory().post('/')).cookies)
+        self.assertNotIn(WRITE_COOKIE_NAME, middleware(RequestFactory().get('/')).cookies)
+        middleware = ReadYourWritesMiddleware(lambda request: HttpResponse(status=400))
+        self.assertNotIn(WRITE_COOKIE_NAME, middleware(RequestFactory().post('/')).cookies)
+
+    def test_unknown_alias(self):
+        with self.assertRaises(ImproperlyConfigured):
+            type('UnknownAliasDataTable', (ModelDataTable,), {
+                '__module__': __name__,
+                'Meta': type('Meta', (), {
+                    'model': Record, 'table_id': 'dt-unknown-alias', 'read_routing': ReadRouting(using='missing'),
+                }),
+            })
+
+
+class DeltaRefreshTestCase(TestCase):
+    """
+    Testcase for Meta.delta_refresh
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.records = [Record.objects.create(name=name, amount=i) for i, name in enumerate(['apple', 'pear', 'plum'])]
+        self.version = self.get_context()['version']
+
+    def get_context(self, dt_config=DeltaRecordDataTable, **kwargs):
+        view = RecordListView(dt_config=dt_config)
+        return view.get_json_context_data(build_http_queryset(**kwargs))
+
+    def get_delta(self, since=None, ids=None, dt_config=DeltaRecordDataTable):
+        ids = [r.pk for r in self.records] if ids is None else ids
+        return self.get_context(dt_config, dt_since=str(self.version if since is None else since),
+                                dt_ids=','.join(str(pk) for pk in ids))
+
+    def test_no_changes_without_queries(self):
+        with self.assertNumQueries(0):
+            context = self.get_delta()
+        self.assertEqual((context['data'], context['ids']), ([], []))
+        self.assertNotIn('reload', context)
+
+    def test_updated_row(self):
+        self.records[1].amount = 42
+        self.records[1].save()
+        with self.assertNumQueries(2):
+            context = self.get_delta()
+        self.assertEqual(context['ids'], [str(self.records[1].pk)])
+        self.assertEqual(context['data'][0]['amount'], 42)
+        self.assertGreater(context['version'], self.version)
+        self.assertNotIn('recordsTotal', context)
+
+    def test_unlimited_page_length(self):
+        class UnlimitedDeltaDataTable(ModelDataTable):
+            class Meta:
+                model = Record
+                table_id = 'dt-unlimited-delta'
+                fields = ['name', 'amount']
+                max_page_length = None
+                delta_refresh = DeltaRefresh()
+
+        # 变化序号属于各个table
+        self.version = self.get_context(UnlimitedDeltaDataTable)['version']
+        self.records[1].amount = 42
+        self.records[1].save()
+        context = self.get_delta(dt_config=UnlimitedDeltaDataTable)
+        self.assertNotIn('error', context)
+        self.assertEqual(context['ids'], [str(self.records[1].pk)])
+
+    def test_changes_requiring_reload(self):
+        Record.objects.create(name='banana')
+        self.assertTrue(self.get_delta()['reload'])
+
+        self.version = self.get_context()['version']
+        # 重新排序后当前页的行与客户端不同
+        self.records[2].name = 'aardvark'
+        self.records[2].save()
+        self.assertTrue(self.get_delta()['reload'])
+
+        self.assertTrue(self.get_delta(since=self.version - 1000)['reload'])
+        self.assertEqual(self.get_context(dt_since='x')['error'], 'Invalid request arguments')
+
+    def test_keyset_pagination_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            type('KeysetDeltaDataTable', (ModelDataTable,), {
+                '__module__': __name__,
+                'Meta': type('Meta', (), {
+                    'model': Record, 'table_id': 'dt-keyset-delta', 'keyset_pagination': True,
+                    'delta_refresh': DeltaRefresh(),
+                }),
+            })
+
+
+class RelatedColumnTestCase(TestCase):
+    """
+    Testcase for display_field and ComputedColumn
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        fruit, tool = Category.objects.create(name='fruit'), Category.objects.create(name='tool')
+        Record.objects.bulk_create([
+            Record(name='apple', category=fruit),
+            Record(name='pear', category=fruit),
+            Record(name='hammer', category=tool),
+            Record(name='orphan'),
+        ])
+
+    def get_context(self, **kwargs):
+        view = RecordListView(dt_config=RelatedRecordDataTable)
+        return view.get_json_context_data(build_http_queryset(**kwargs))
+
+    def test_display_field_search_and_order(self):
+        context = self.get_context(order_column=1, order_dir='desc', search='tool')
+        self.assertEqual([row['name'] for row in context['data']], ['hammer'])
+        self.assertEqual(context['data'][0]['category'], 'tool')
+
+        context = self.get_context(order_column=1, order_dir='asc', **{'columns[1][search][value]': 'fru'})
+        self.assertEqual([row['name'] for row in context['data']], ['apple', 'pear'])
+
+    def test_computed_column_is_batched(self):
+        with CaptureQueriesContext(connection) as queries:
+            context = self.get_context(length=10)
+        # count, page, 以及resolver的两次批量查询，与行数无关
+        self.assertEqual(len(queries), 4)
+        values = {row['name']: row['same_category'] for row in context['data']}
+        self.assertEqual(values, {'apple': 2, 'pear': 2, 'hammer': 1, 'orphan': 0})
+
+    def test_computed_column_config(self):
+        columns = RelatedRecordDataTable.get_dt_config_columns()
+        self.assertEqual(columns[2], {
+            'data': 'same_category', 'searchable': False, 'orderable': False, 'defaultContent': '',
+        })
+        self.assertEqual(RelatedRecordDataTable.get_query_fields(), ['name', 'category__name', 'pk'])
+
+
+class InstrumentationTestCase(TestCase):
+    """
+    Testcase for timings, Server-Timing header and slow request log
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([Record(name='record {}'.format(i), amount=i) for i in range(5)])
+
+    def get_response(self, view, **kwargs):
+        return view.get_json_response(build_http_queryset(**kwargs))
+
+    def test_signal_receives_phases(self):
+        received = []
+
+        def receiver(sender, timings, **kwargs):
+            received.append(timings)
+
+        dt_request_finished.connect(receiver, sender=RecordDataTable)
+        try:
+            self.get_response(RecordListView(dt_config=RecordDataTable), start=2, search='record')
+        finally:
+            dt_request_finished.disconnect(receiver, sender=RecordDataTable)
+        timings = received[0]
+        self.assertEqual(list(timings.phases), ['count_total', 'count_filtered', 'page', 'serialize', 'encode'])
+        self.assertEqual(timings.phases['count_total'][1], 1)
+        self.assertEqual(timings.phases['page'][1], 1)
+        self.assertEqual(timings.queries, 3)
+        self.assertEqual((timings.search_length, timings.start), (6, 2))
+        self.assertTrue(timings.table.endswith('RecordDataTable'))
+
+    def test_server_timing_header(self):
+        view = RecordListView(dt_config=RecordDataTable, dt_server_timing=True)
+        response = self.get_response(view)
+        self.assertIn('count_total;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_slow_request_log(self):
+        view = RecordListView(dt_config=RecordDataTable, dt_slow_request_threshold=0)
+        with self.assertLogs('datatables_utils.slow_requests', 'WARNING') as logs:
+            self.get_response(view, start=1)
+        self.assertIn('start=1', logs.output[0])
+        self.assertEqual(logs.records[0].dt_timings['start'], 1)
+
+    def test_not_instrumented_by_default(self):
+        response = self.get_response(RecordListView(dt_config=RecordDataTable))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class BatchViewTestCase(TestCase):
+    """
+    Testcase for DataTablesBatchView
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([Record(name='record {:02d}'.format(i), amount=i) for i in range(15)])
+
+    def post(self, tables, **initkwargs):
+        view = DataTablesBatchView.as_view(
+            dt_tables=[RecordDataTable, 'dt-preview-record'], **initkwargs
+        )
+        request = RequestFactory().post('/', json.dumps({'tables': tables}), content_type='application/json')
+        return view(request)
+
+    def test_combined_response(self):
+        response = self.post({
+            RecordDataTable.table_id: build_http_queryset(length=5).urlencode(),
+            PreviewRecordDataTable.table_id: build_http_queryset(length=3, search='record 1').urlencode(),
+            'dt-not-registered': '',
+        })
+        content = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(content[RecordDataTable.table_id]['recordsTotal'], 15)
+        self.assertEqual(len(content[RecordDataTable.table_id]['data']), 5)
+        self.assertEqual(content[PreviewRecordDataTable.table_id]['recordsFiltered'], 5)
+        self.assertIn('cursor', content[PreviewRecordDataTable.table_id])
+        self.assertEqual(content['dt-not-registered'], {'error': 'Unknown table'})
+
+    def test_conditional_get_table(self):
+        # 各table的响应嵌入同一个JSON，请求头中的If-None-Match以及gzip不起作用
+        cache.clear()
+        etag, _ = ClientSideRecordDataTable.conditional_get.get_validators(ClientSideRecordDataTable, Record.objects.all())
+        view = DataTablesBatchView.as_view(dt_tables=[ClientSideRecordDataTable])
+        for _ in range(2):
+            request = RequestFactory().post(
+                '/', json.dumps({'tables': {ClientSideRecordDataTable.table_id: ''}}), content_type='application/json',
+                HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag,
+            )
+            response = view(request)
+            self.assertEqual(response.status_code, 200)
+            content = json.loads(response.content.decode('utf-8'))
+            self.assertEqual(len(content[ClientSideRecordDataTable.table_id]['data']), 15)
+
+    def test_ambiguous_table_id(self):
+        with self.assertRaises(ImproperlyConfigured):
+            view = DataTablesBatchView.as_view(dt_tables=[RecordDataTable, KeysetRecordDataTable])
+            view(RequestFactory().post('/', json.dumps({'tables': {}}), content_type='application/json'))
+
+    def test_invalid_requests(self):
+        response = self.post({RecordDataTable.table_id: 'length=abc'})
+        content = json.loads(response.content.decode('utf-8'))
+        self.assertIn('error', content[RecordDataTable.table_id])
+        view = DataTablesBatchView.as_view(dt_tables=[RecordDataTable])
+        response = view(RequestFactory().post('/', 'not json', content_type='application/json'))
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTestCase(TestCase):
+    """
+    Testcase for ETag / Last-Modified in client side mode
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        created = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        Record.objects.bulk_create(
+            [Record(name='record {}'.format(i), amount=i, created=created) for i in range(5)]
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, dt_config, **headers):
+        view = DataTablesListView.as_view(model=Record, dt_config=dt_config)
+        request = RequestFactory().get('/', HTTP_X_REQUESTED_WITH='XMLHttpRequest', **headers)
+        return view(request)
+
+    def test_etag_from_model_version(self):
+        response = self.get(ClientSideRecordDataTable)
+        self.assertEqual(len(json.loads(response.content.decode('utf-8'))['data']), 5)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(ClientSideRecordDataTable, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Record.objects.create(name='record 5')
+        response = self.get(ClientSideRecordDataTable, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_gzip_snapshot(self):
+        self.get(ClientSideRecordDataTable)
+        with self.assertNumQueries(0):
+            response = self.get(ClientSideRecordDataTable, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content).decode('utf-8'))['data']), 5)
+
+    def test_updated_field(self):
+        response = self.get(UpdatedFieldRecordDataTable)
+        self.assertEqual(response['Last-Modified'], 'Wed, 01 Jan 2020 00:00:00 GMT')
+        with self.assertNumQueries(1):
+            response = self.get(UpdatedFieldRecordDataTable, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.get(UpdatedFieldRecordDataTable, HTTP_IF_MODIFIED_SINCE='Thu, 02 Jan 2020 00:00:00 GMT')
+        self.assertEqual(response.status_code, 304)
+
+
+class AsyncViewTestCase(TestCase):
+    """
+    Testcase for AsyncDataTablesListView
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Record.objects.bulk_create([Record(name='record {:02d}'.format(i), amount=i) for i in range(15)])
+
+    def get_context(self, dt_config, **kwargs):
+        view = AsyncDataTablesListView(model=Record, dt_config=dt_config)
+        return async_to_sync(view.aget_json_context_data)(build_http_queryset(**kwargs))
+
+    def test_matches_sync_view(self):
+        for dt_config in [RecordDataTable, KeysetRecordDataTable, ArrayRecordDataTable, AggregateRecordDataTable]:
+            for kwargs in [{}, {'search': 'record 1', 'start': 2, 'length': 3}, {'length': 'x'}]:
+                view = RecordListView(dt_config=dt_config)
+                expected = view.get_json_context_data(build_http_queryset(**kwargs))
+                context = self.get_context(dt_config, **kwargs)
+                # cursor的签名包含时间戳
+                self.assertEqual('cursor' in context, 'cursor' in expected)
+                context.pop('cursor', None)
+                expected.pop('cursor', None)
+                self.assertEqual(context, expected)
+
+    def test_ajax_get(self):
+        view = AsyncDataTablesListView.as_view(model=Record, dt_config=RecordDataTable)
+        request = RequestFactory().get('/', build_http_queryset(length=5), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        response = async_to_sync(view)(request)
+        content = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(content['recordsTotal'], 15)
+        self.assertEqual(len(content['data']), 5)
+
+
+class ConcurrentAsyncViewTestCase(TransactionTestCase):
+    """
+    Testcase for AsyncDataTablesListView with dt_concurrent_queries
+    """
+
+    def test_concurrent_queries(self):
+        Record.objects.bulk_create([Record(name='record {:02d}'.format(i), amount=i) for i in range(15)])
+        view = AsyncDataTablesListView(model=Record, dt_config=RecordDataTable, dt_concurrent_queries=True)
+        context = async_to_sync(view.aget_json_context_data)(build_http_queryset(search='record 1', length=3))
+        self.assertEqual(context['recordsTotal'], 15)
+        self.assertEqual(context['recordsFiltered'], 5)
+        self.assertEqual([row['name'] for row in context['data']], ['record 10', 'record 11', 'record 12'])
+
+    def test_concurrent_batch(self):
+        Record.objects.bulk_create([Record(name='record {:02d}'.format(i), amount=i) for i in range(15)])
+        view = DataTablesBatchView.as_view(dt_tables=[RecordDataTable, PreviewRecordDataTable],
+                                           dt_concurrent_queries=True)
+        tables = {
+            RecordDataTable.table_id: build_http_queryset(length=5).urlencode(),
+            PreviewRecordDataTable.table_id: build_http_queryset(length=3).urlencode(),
+        }
+        request = RequestFactory().post('/', json.dumps({'tables': tables}), content_type='application/json')
+        content = json.loads(view(request).content.decode('utf-8'))
+        self.assertEqual(len(content[RecordDataTable.table_id]['data']), 5)
+        self.assertEqual(len(content[PreviewRecordDataTable.table_id]['data']), 3)